@@ -0,0 +1,389 @@
+"""Códigos de entrada firmados y control de acceso en la puerta.
+
+Cada entrada de una venta (una por asiento o por unidad comprada) tiene un
+código `venta-numero-firma`, donde la firma es un HMAC del evento, la venta
+y el número de entrada. El código se deriva de la venta, así que queda
+emitido cuando crear_venta tiene éxito sin escribir nada más en la
+transacción de compra; cambiar el secreto invalida todos los códigos.
+
+ControlAcceso precarga los códigos válidos de un evento en arreglos
+compactos (clave ordenada de 8 bytes, 5 bytes de firma y un byte de estado
+por entrada) y valida cada lectura con una búsqueda binaria, sin consultar
+la base: una entrada repetida en esta puerta se rechaza en el momento.
+Cada ingreso se anota en un diario y un hilo lo guarda en la tabla
+ingresos en lotes (cada `intervalo` segundos o al juntar `tamano_lote`), así
+las lecturas no esperan el lock de escritura de SQLite. El diario cubre los
+ingresos que todavía no se guardaron: al reiniciar se vuelven a cargar. Una
+misma entrada leída en otra puerta u otro worker antes del volcado la
+rechaza la clave primaria de ingresos y queda en `conflictos`.
+
+Sin conexión la puerta trabaja con un snapshot del evento (no necesita el
+secreto: trae las firmas válidas) y anota cada ingreso en un diario junto
+al archivo; al volver la conexión el diario se concilia con la base y se
+informan las entradas que también ingresaron por otra puerta.
+"""
+import base64
+import bisect
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+VALIDO = 'valido'
+REPETIDO = 'repetido'
+INVALIDO = 'invalido'
+
+_BYTES_FIRMA = 5
+_BITS_NUMERO = 16  # entradas por venta
+
+
+def _firma(secreto, evento_id, venta_id, numero):
+    clave = secreto.encode() if isinstance(secreto, str) else secreto
+    datos = f'{evento_id}.{venta_id}.{numero}'.encode()
+    return hmac.new(clave, datos, hashlib.sha256).digest()[:_BYTES_FIRMA]
+
+
+def codigo_entrada(secreto, evento_id, venta_id, numero):
+    """Código de la entrada `numero` (desde 1) de una venta"""
+    return f'{venta_id}-{numero}-{_firma(secreto, evento_id, venta_id, numero).hex().upper()}'
+
+
+def codigos_venta(secreto, evento_id, venta_id, cantidad):
+    """Códigos de todas las entradas de una venta"""
+    return [codigo_entrada(secreto, evento_id, venta_id, numero) for numero in range(1, cantidad + 1)]
+
+
+def leer_codigo(codigo):
+    """(venta_id, numero, firma) de un código bien formado, o None"""
+    try:
+        venta, numero, firma = codigo.strip().split('-')
+        datos = int(venta), int(numero), bytes.fromhex(firma)
+    except (AttributeError, ValueError):
+        return None
+    if len(datos[2]) != _BYTES_FIRMA or not 0 < datos[1] < 2 ** _BITS_NUMERO:
+        return None
+    return datos
+
+
+@dataclass(slots=True)
+class Lectura:
+    resultado: str  # VALIDO, REPETIDO o INVALIDO
+    venta_id: Optional[int] = None
+    numero: Optional[int] = None
+    momento: Optional[str] = None  # del ingreso (el primero si es repetido)
+
+
+class ControlAcceso:
+    """Códigos válidos e ingresos de un evento en memoria.
+
+    db: Database donde se registran los ingresos (None sin conexión).
+    secreto: con él se aceptan también las ventas posteriores a la precarga
+    (se verifican contra la base); sin él solo las precargadas.
+    diario: archivo donde se anota cada ingreso al momento. Sin conexión es
+    lo que se concilia después; con conexión guarda solo los ingresos que
+    faltan volcar.
+    intervalo, tamano_lote: los ingresos se guardan en la base cada
+    `intervalo` segundos o apenas se juntan `tamano_lote`.
+    """
+
+    def __init__(self, evento_id, claves, firmas, ingresados=None, db=None, secreto=None,
+                 puerta=None, diario=None, intervalo=1.0, tamano_lote=500):
+        self.evento_id = evento_id
+        self.db = db
+        self.puerta = puerta
+        self.intervalo = intervalo
+        self.tamano_lote = tamano_lote
+        self._secreto = secreto
+        self._claves = claves
+        self._firmas = bytearray(firmas)
+        self._ingresados = bytearray(ingresados) if ingresados is not None else bytearray(len(claves))
+        self._momentos = {}  # clave -> momento del ingreso registrado por esta puerta
+        self._pendientes = []  # (venta_id, numero, momento) por guardar en la base
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+        self._diario = open(diario, 'a', encoding='utf-8') if diario else None
+        self._recuperados = []  # diarios de procesos terminados, se borran tras volcarlos
+        # Métricas
+        self.lecturas = {VALIDO: 0, REPETIDO: 0, INVALIDO: 0}
+        self.volcados = 0
+        self.conflictos = []  # ingresos que la base ya tenía de otra puerta o worker
+
+    # ---- Construcción ----
+
+    @classmethod
+    def desde_db(cls, db, evento_id, secreto, **opciones):
+        """Precargar los códigos válidos y los ingresos ya registrados del evento.
+
+        Con un diario (ver ruta_diario) se recuperan además los ingresos que
+        los procesos anteriores de esta puerta no llegaron a volcar.
+        """
+        entradas = sorted((venta_id << _BITS_NUMERO) | numero
+                          for venta_id, cantidad in db.obtener_entradas_evento(evento_id)
+                          for numero in range(1, cantidad + 1))
+        claves = array('Q', entradas)
+        firmas = b''.join(_firma(secreto, evento_id, clave >> _BITS_NUMERO, clave & 0xFFFF) for clave in claves)
+        control = cls(evento_id, claves, firmas, db=db, secreto=secreto, **opciones)
+        for venta_id, numero in db.obtener_ingresos_evento(evento_id):
+            i = control._buscar((venta_id << _BITS_NUMERO) | numero)
+            if i is not None:
+                control._ingresados[i] = 1
+        if opciones.get('diario'):
+            control._recuperar(opciones['diario'])
+        return control
+
+    @classmethod
+    def desde_snapshot(cls, ruta, **opciones):
+        """Cargar un snapshot y repetir su diario (los ingresos anotados sin conexión)"""
+        with open(ruta, encoding='utf-8') as f:
+            datos = json.load(f)
+        claves = array('Q')
+        claves.frombytes(base64.b64decode(datos['claves']))
+        control = cls(datos['evento_id'], claves, base64.b64decode(datos['firmas']),
+                      base64.b64decode(datos['ingresados']), **opciones)
+        for venta_id, numero, momento, _ in cls.leer_diario(ruta + '.diario'):
+            clave = (venta_id << _BITS_NUMERO) | numero
+            i = control._buscar(clave)
+            if i is not None and not control._ingresados[i]:
+                control._ingresados[i] = 1
+                control._momentos[clave] = momento
+        return control
+
+    def snapshot(self):
+        """Códigos válidos e ingresos actuales para una puerta sin conexión"""
+        with self._lock:
+            return {
+                'evento_id': self.evento_id,
+                'generado': datetime.now().isoformat(timespec='seconds'),
+                'claves': base64.b64encode(self._claves.tobytes()).decode(),
+                'firmas': base64.b64encode(bytes(self._firmas)).decode(),
+                'ingresados': base64.b64encode(bytes(self._ingresados)).decode(),
+            }
+
+    def guardar_snapshot(self, ruta):
+        temporal = ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporal, ruta)
+
+    @staticmethod
+    def leer_diario(ruta):
+        """Ingresos anotados sin conexión: (venta_id, numero, momento, puerta)"""
+        if not os.path.exists(ruta):
+            return []
+        with open(ruta, encoding='utf-8') as f:
+            registros = []
+            for linea in f:
+                partes = linea.rstrip('\n').split('\t')
+                # Una línea cortada por un apagón (sin fin de línea) se descarta
+                if linea.endswith('\n') and len(partes) == 4:
+                    registros.append((int(partes[0]), int(partes[1]), partes[2], partes[3] or None))
+            return registros
+
+    # ---- Lecturas ----
+
+    def _buscar(self, clave):
+        i = bisect.bisect_left(self._claves, clave)
+        if i < len(self._claves) and self._claves[i] == clave:
+            return i
+        return None
+
+    def validar(self, codigo):
+        """Validar un código y anotar el ingreso.
+
+        No consulta la base salvo para una venta posterior a la precarga con
+        firma correcta: el ingreso queda en el diario y lo guarda el hilo de
+        volcado.
+        """
+        datos = leer_codigo(codigo)
+        if datos is None:
+            return self._contar(Lectura(INVALIDO))
+        venta_id, numero, firma = datos
+        clave = (venta_id << _BITS_NUMERO) | numero
+        with self._lock:
+            conocida = self._buscar(clave) is not None
+        if not conocida and not self._agregar_venta_nueva(venta_id, numero, firma):
+            return self._contar(Lectura(INVALIDO))
+
+        momento = datetime.now().isoformat(sep=' ', timespec='seconds')
+        with self._lock:
+            i = self._buscar(clave)
+            if not hmac.compare_digest(bytes(self._firmas[i * _BYTES_FIRMA:(i + 1) * _BYTES_FIRMA]), firma):
+                return self._contar(Lectura(INVALIDO))
+            if self._ingresados[i]:
+                return self._contar(Lectura(REPETIDO, venta_id, numero, self._momentos.get(clave)))
+            self._ingresados[i] = 1
+            self._momentos[clave] = momento
+            self._pendientes.append((venta_id, numero, momento))
+            if self._diario is not None:
+                self._anotar(venta_id, numero, momento)
+                self._diario.flush()
+            lleno = len(self._pendientes) >= self.tamano_lote
+        if self.db is not None:
+            self._iniciar()
+            if lleno:
+                self._despertar.set()
+        return self._contar(Lectura(VALIDO, venta_id, numero, momento))
+
+    def _anotar(self, venta_id, numero, momento):
+        self._diario.write(f'{venta_id}\t{numero}\t{momento}\t{self.puerta or ""}\n')
+
+    def _agregar_venta_nueva(self, venta_id, numero, firma):
+        """Sumar las entradas de una venta hecha después de la precarga"""
+        if self.db is None or self._secreto is None:
+            return False
+        # Solo una firma correcta justifica consultar la base: un código inventado no llega a ella
+        if not hmac.compare_digest(_firma(self._secreto, self.evento_id, venta_id, numero), firma):
+            return False
+        venta = self.db.obtener_venta(venta_id)
+        if venta is None or venta['evento_id'] != self.evento_id or numero > venta['cantidad']:
+            return False
+        with self._lock:
+            for n in range(1, venta['cantidad'] + 1):
+                nueva = (venta_id << _BITS_NUMERO) | n
+                if self._buscar(nueva) is None:
+                    j = bisect.bisect_left(self._claves, nueva)
+                    self._claves.insert(j, nueva)
+                    self._firmas[j * _BYTES_FIRMA:j * _BYTES_FIRMA] = _firma(self._secreto, self.evento_id, venta_id, n)
+                    self._ingresados.insert(j, 0)
+        return True
+
+    def _contar(self, lectura):
+        self.lecturas[lectura.resultado] += 1
+        return lectura
+
+    # ---- Guardado en lotes ----
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name=f'ingresos-{self.evento_id}',
+                                              daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            self.volcar()
+
+    def volcar(self):
+        """Guardar en la base los ingresos pendientes; devuelve cuántos se guardaron"""
+        if self.db is None:
+            return 0
+        with self._lock:
+            lote, self._pendientes = self._pendientes, []
+        if not lote:
+            return 0
+        conflictos = self.db.registrar_ingresos(
+            [(self.evento_id, venta_id, numero, momento, self.puerta) for venta_id, numero, momento in lote])
+        if conflictos is None:
+            # La base no respondió: siguen en el diario y se reintentan en el próximo volcado
+            with self._lock:
+                self._pendientes[:0] = lote
+            return 0
+        with self._lock:
+            if self._diario is not None:
+                # El diario se queda solo con lo que llegó mientras se volcaba
+                self._diario.truncate(0)
+                for pendiente in self._pendientes:
+                    self._anotar(*pendiente)
+                self._diario.flush()
+            recuperados, self._recuperados = self._recuperados, []
+        for ruta in recuperados:
+            os.remove(ruta)
+        # Un ingreso recuperado que ya estaba guardado (corte entre el commit
+        # y el recorte del diario) no es un conflicto
+        momentos = {(venta_id, numero): momento for venta_id, numero, momento in lote}
+        conflictos = [c for c in conflictos if (c[3], c[4]) != (momentos[c[1], c[2]], self.puerta)]
+        self.volcados += 1
+        self.conflictos.extend(conflictos)
+        return len(lote) - len(conflictos)
+
+    def _recuperar(self, diario):
+        """Volver a encolar los ingresos que un proceso anterior de esta puerta
+        anotó en su diario y no llegó a volcar (el propio, si el pid se repite)"""
+        directorio, nombre = os.path.split(os.path.abspath(diario))
+        prefijo = nombre.split('-')[0] + '-'
+        for archivo in sorted(os.listdir(directorio)):
+            pid = archivo[len(prefijo):-len('.diario')]
+            if not (archivo.startswith(prefijo) and archivo.endswith('.diario') and pid.isdigit()):
+                continue
+            propio = archivo == nombre
+            # El diario de un worker que sigue vivo lo vuelca ese worker
+            if not propio and _proceso_vivo(int(pid)):
+                continue
+            ruta = os.path.join(directorio, archivo)
+            for venta_id, numero, momento, _ in self.leer_diario(ruta):
+                clave = (venta_id << _BITS_NUMERO) | numero
+                i = self._buscar(clave)
+                if i is not None and not self._ingresados[i]:
+                    self._ingresados[i] = 1
+                    self._momentos[clave] = momento
+                    self._pendientes.append((venta_id, numero, momento))
+            if not propio:
+                self._recuperados.append(ruta)
+        if self._pendientes and self.db is not None:
+            self._iniciar()
+
+    def estadisticas(self):
+        return {
+            'entradas': len(self._claves),
+            'ingresados': self._ingresados.count(1),
+            'pendientes': len(self._pendientes),
+            'volcados': self.volcados,
+            'conflictos': len(self.conflictos),
+            'lecturas': dict(self.lecturas),
+        }
+
+    def cerrar(self):
+        self.volcar()
+        if self._diario is not None:
+            self._diario.close()
+            self._diario = None
+
+
+def ruta_diario(directorio, evento_id):
+    """Diario de este proceso para un evento: `evento-pid.diario`.
+
+    Cada worker escribe el suyo; el que arranca después de un corte
+    recupera los de los procesos que ya no existen (ver desde_db).
+    """
+    os.makedirs(directorio, exist_ok=True)
+    return os.path.join(directorio, f'{evento_id}-{os.getpid()}.diario')
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def conciliar(db, ruta):
+    """Guardar en la base los ingresos del diario de una puerta sin conexión.
+
+    Devuelve (guardados, conflictos); los conflictos son entradas que la base
+    ya tenía registradas por otra puerta. El diario conciliado se renombra
+    para no volver a aplicarlo.
+    """
+    with open(ruta, encoding='utf-8') as f:
+        evento_id = json.load(f)['evento_id']
+    registros = ControlAcceso.leer_diario(ruta + '.diario')
+    if not registros:
+        return 0, []
+    conflictos = db.registrar_ingresos(
+        [(evento_id, venta_id, numero, momento, puerta) for venta_id, numero, momento, puerta in registros])
+    if conflictos is None:
+        raise RuntimeError('No se pudieron guardar los ingresos; el diario queda sin conciliar')
+    os.replace(ruta + '.diario', f'{ruta}.diario.conciliado-{int(time.time())}')
+    return len(registros) - len(conflictos), conflictos
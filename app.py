@@ -1,14 +1,258 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, make_response, Response, jsonify
+from markupsafe import Markup
+from werkzeug.middleware.proxy_fix import ProxyFix
 from functools import wraps
-from datetime import datetime
+from dataclasses import asdict
+from datetime import datetime, timezone
+import atexit
+import hashlib
+import hmac
+import ipaddress
+import json
 import os
+import socket
+import threading
 from database import Database
-from models import Evento, Venta, Usuario
+from cache import CacheFragmentos
+from passwords import HasherPasswords, HashOcupadoError
+import exportacion
+from models import Evento, Venta, Usuario, normalizar_email
+from asientos import parsear_secciones
+from sala_espera import SalaEspera
+from limites import Limite, LimitadorTasa
+from metricas import Metricas, TIPO_CONTENIDO
+from accesos import ControlAcceso, codigos_venta, ruta_diario
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
-db = Database()
+# Proxies inversos delante de la app que agregan X-Forwarded-For (0 = conexión directa).
+# Sin esto detrás de un proxy todos los clientes tendrían su IP y compartirían los límites por IP;
+# con más saltos que los reales un cliente podría elegir su IP con la cabecera.
+PROXIES_CONFIABLES = int(os.environ.get('PROXIES_CONFIABLES', 0))
+if PROXIES_CONFIABLES > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXIES_CONFIABLES, x_proto=PROXIES_CONFIABLES)
+
+# Filas por página en los listados de administración
+TAMANO_PAGINA = int(os.environ.get('TAMANO_PAGINA', 50))
+
+db = Database(
+    os.environ.get('DATABASE_PATH', 'teatro.db'),
+    max_conexiones=int(os.environ.get('DB_POOL_SIZE', 8)),
+    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    principales_ttl=float(os.environ.get('PRINCIPAL_TTL', 30)),
+    catalogo_ttl=float(os.environ.get('CATALOGO_TTL', 60)),
+    version_ttl=float(os.environ.get('VERSION_TTL', 1)),
+    # Commits agrupados de ventas (0 = una transacción por compra)
+    lote_ventas=int(os.environ.get('VENTAS_LOTE', 0)),
+    espera_lote=float(os.environ.get('VENTAS_ESPERA_MS', 0)) / 1000,
+    # Archivos de ventas particionadas por evento, separados por comas (vacío = todo en teatro.db)
+    particiones=[ruta for ruta in os.environ.get('VENTAS_PARTICIONES', '').split(',') if ruta.strip()],
+    sincronizar_cada=float(os.environ.get('PARTICIONES_SINCRONIZAR', 1)),
+    hasher=HasherPasswords(
+        procesos=int(os.environ['PASSWORD_PROCESOS']) if 'PASSWORD_PROCESOS' in os.environ else None,
+        max_cola=int(os.environ.get('PASSWORD_MAX_COLA', 64)),
+        timeout=float(os.environ.get('PASSWORD_TIMEOUT', 5)),
+        n=int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 15)),
+        r=int(os.environ.get('PASSWORD_SCRYPT_R', 8)),
+        p=int(os.environ.get('PASSWORD_SCRYPT_P', 1)),
+    ),
+)
+
+# Segundos que un proxy inverso puede servir las páginas públicas sin revalidar
+PROXY_MAX_AGE = int(os.environ.get('PROXY_MAX_AGE', 5))
+# Cambia los ETags al desplegar plantillas nuevas
+VERSION_APP = os.environ.get('APP_VERSION', '')
+
+# HTML renderizado de tarjetas y detalles de eventos
+fragmentos = CacheFragmentos(max_bytes=int(os.environ.get('FRAGMENTOS_MAX_BYTES', 8 * 1024 * 1024)))
+
+# Sala de espera: compradores admitidos a la vez por evento (0 = sin sala de espera)
+SALA_ESPERA_CAPACIDAD = int(os.environ.get('SALA_ESPERA_CAPACIDAD', 0))
+# Segundos entre refrescos de la página de espera
+SALA_ESPERA_REFRESCO = int(os.environ.get('SALA_ESPERA_REFRESCO', 5))
+sala_espera = SalaEspera(
+    os.environ.get('SALA_ESPERA_PATH', 'teatro-espera.db'),
+    app.secret_key,
+    capacidad=SALA_ESPERA_CAPACIDAD,
+    ttl_admision=float(os.environ.get('SALA_ESPERA_TTL', 600)),
+    # Una admisión que el visitante no retira (dejó de refrescar la página) se descarta
+    ttl_turno=float(os.environ.get('SALA_ESPERA_TTL_TURNO', 6 * SALA_ESPERA_REFRESCO)),
+    # Segundos entre rondas del proceso que avanza las admisiones
+    intervalo=float(os.environ.get('SALA_ESPERA_INTERVALO', 1)),
+) if SALA_ESPERA_CAPACIDAD > 0 else None
+
+# Límites de tasa compartidos por los workers del host ('solicitudes/segundos', vacío = sin límite)
+limitador = LimitadorTasa(
+    os.environ.get('LIMITES_PATH') or LimitadorTasa.ruta_compartida('teatro-limites'),
+    casilleros=int(os.environ.get('LIMITES_CASILLEROS', 2 ** 16)),
+)
+LIMITE_LOGIN_IP = Limite.desde_texto('login-ip', os.environ.get('LIMITE_LOGIN_IP', '30/60'))
+LIMITE_LOGIN_EMAIL = Limite.desde_texto('login-email', os.environ.get('LIMITE_LOGIN_EMAIL', '10/300'))
+LIMITE_BUSCAR_IP = Limite.desde_texto('buscar-ip', os.environ.get('LIMITE_BUSCAR_IP', '20/60'))
+LIMITE_BUSCAR_EMAIL = Limite.desde_texto('buscar-email', os.environ.get('LIMITE_BUSCAR_EMAIL', '10/60'))
+
+# Firma de los códigos de entrada; cambiarlo invalida los códigos ya emitidos
+SECRETO_ENTRADAS = os.environ.get('ENTRADAS_SECRETO', app.secret_key)
+# Nombre de esta puerta en la tabla ingresos
+PUERTA = os.environ.get('INGRESOS_PUERTA', socket.gethostname())
+# Segundos entre volcados de los ingresos a la base (antes si se juntan INGRESOS_LOTE)
+INGRESOS_INTERVALO = float(os.environ.get('INGRESOS_INTERVALO', 1))
+INGRESOS_LOTE = int(os.environ.get('INGRESOS_LOTE', 500))
+# Diarios de los ingresos que todavía no se volcaron (se recuperan al reiniciar)
+INGRESOS_DIARIOS = os.environ.get('INGRESOS_DIARIOS') or os.path.join(
+    os.path.dirname(os.path.abspath(db.db_path)), 'ingresos')
+controles_acceso = {}  # evento_id -> ControlAcceso de este proceso
+_lock_controles = threading.Lock()
+
+def control_acceso(evento_id, evento=None):
+    """Control de acceso del evento, precargado la primera vez que se usa.
+
+    None si el evento no existe: un id cualquiera no deja un control en memoria.
+    """
+    with _lock_controles:
+        control = controles_acceso.get(evento_id)
+        if control is None:
+            if evento is None and db.obtener_evento(evento_id) is None:
+                return None
+            control = controles_acceso[evento_id] = ControlAcceso.desde_db(
+                db, evento_id, SECRETO_ENTRADAS, puerta=PUERTA, intervalo=INGRESOS_INTERVALO,
+                tamano_lote=INGRESOS_LOTE, diario=ruta_diario(INGRESOS_DIARIOS, evento_id))
+        return control
+
+@atexit.register
+def _cerrar_controles():
+    # Los ingresos que esperan el próximo volcado no se pierden al apagar
+    for control in list(controles_acceso.values()):
+        control.cerrar()
+
+# Métricas por request y por consulta en /metrics (METRICAS=0 las desactiva)
+metricas = Metricas(
+    # Sentencias más lentas que esto van al log con sus parámetros (0 = no registrar)
+    consulta_lenta=float(os.environ.get('CONSULTA_LENTA_MS', 100)) / 1000,
+) if os.environ.get('METRICAS', '1') != '0' else None
+# Si está definido, /metrics exige Authorization: Bearer <token>; si no, solo
+# responde a requests directos desde la misma máquina (sin pasar por un proxy)
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+
+def _sumar_estadisticas(componentes):
+    """Estadísticas de los componentes de cada partición sumadas"""
+    def estadisticas():
+        total = {}
+        for componente in componentes:
+            for clave, valor in componente.estadisticas().items():
+                if isinstance(valor, dict):
+                    destino = total.setdefault(clave, {})
+                    for subclave, cantidad in valor.items():
+                        destino[subclave] = destino.get(subclave, 0) + cantidad
+                else:
+                    total[clave] = total.get(clave, 0) + valor
+        return total
+    return estadisticas
+
+if metricas is not None:
+    particiones_ventas = db.particiones.particiones if db.particiones else []
+    metricas.instrumentar(db.pool)
+    if db.particiones is not None:
+        metricas.instrumentar(db.particiones.lecturas)
+    for particion in particiones_ventas[1:]:
+        metricas.instrumentar(particion.pool)
+    metricas.registrar('principales', db.principales.estadisticas)
+    metricas.registrar('catalogo', db.catalogo.estadisticas)
+    metricas.registrar('fragmentos', fragmentos.estadisticas)
+    metricas.registrar('limites', limitador.estadisticas)
+    metricas.registrar('reservas', _sumar_estadisticas([p.reservas for p in particiones_ventas] or [db.reservas]))
+    if db.escritor_ventas is not None:
+        metricas.registrar('escritor_ventas', _sumar_estadisticas(
+            [p.escritor for p in particiones_ventas if p.escritor] or [db.escritor_ventas]))
+    if db.particiones is not None:
+        metricas.registrar('particiones', db.particiones.estadisticas)
+    metricas.registrar('accesos', lambda: _sumar_estadisticas(list(controles_acceso.values()))())
+
+# ==================== FRAGMENTOS ====================
+
+@app.template_global()
+def hueco(nombre):
+    """Marca en un fragmento cacheado el lugar de un contenido por request"""
+    return Markup(f'<!--hueco:{nombre}-->')
+
+@app.template_global()
+def fragmento_evento(plantilla, evento, **huecos):
+    """Renderizar un fragmento de evento desde la cache y completar sus huecos.
+    
+    El fragmento se cachea por (plantilla, evento) y versión del evento, que
+    solo cambia al editar sus datos; stock, asientos y botones que dependen
+    de la sesión van en los huecos. La plantilla se renderiza sin el contexto
+    del request para que no pueda depender de quién la ve.
+    """
+    clave = (plantilla, evento.id)
+    html = fragmentos.obtener(clave, evento.version)
+    if html is None:
+        html = Markup(app.jinja_env.get_template(plantilla).render(evento=evento))
+        fragmentos.guardar(clave, evento.version, html)
+    for nombre, contenido in huecos.items():
+        html = html.replace(hueco(nombre), contenido)
+    return html
+
+# ==================== GET CONDICIONAL ====================
+
+def _etag_pagina(recurso, version):
+    """ETag de una página pública: recurso, versión de su contenido y quién la ve"""
+    etag = f'{VERSION_APP}{recurso}-{version}'
+    if 'user_id' in session:
+        # La barra de navegación muestra nombre y rol: una variante por usuario
+        usuario = f"{session['user_id']}|{session.get('user_rol')}|{session.get('user_nombre')}"
+        etag += '-' + hashlib.sha1(usuario.encode('utf-8')).hexdigest()[:12]
+    return etag
+
+def _ultima_modificacion(version):
+    if not version['actualizado_en']:
+        return None
+    return datetime.strptime(version['actualizado_en'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+def _cabeceras_cache(respuesta, etag, ultima_modificacion):
+    respuesta.set_etag(etag, weak=True)
+    respuesta.last_modified = ultima_modificacion
+    respuesta.vary.add('Cookie')
+    if 'user_id' in session:
+        respuesta.cache_control.private = True
+        respuesta.cache_control.no_cache = True
+    else:
+        respuesta.cache_control.public = True
+        respuesta.cache_control.max_age = 0
+        respuesta.cache_control.s_maxage = PROXY_MAX_AGE
+    return respuesta
+
+def pagina_condicional(recurso, generar, version=None):
+    """Responder 304 si el cliente ya tiene la versión actual de la página.
+    
+    Por defecto la versión es la del catálogo, que sale de una cache en
+    memoria de TTL corto, así que un 304 no consulta la base ni renderiza la
+    plantilla. Una página de un solo recurso pasa su propia versión
+    ({'version', 'actualizado_en'}) para no invalidarse con cada cambio del
+    catálogo. Las páginas con mensajes flash pendientes no se cachean
+    porque son de un solo uso.
+    """
+    if session.get('_flashes'):
+        return generar()
+    
+    if version is None:
+        version = db.version_catalogo()
+    etag = _etag_pagina(recurso, version['version'])
+    ultima_modificacion = _ultima_modificacion(version)
+    
+    if request.if_none_match:
+        vigente = request.if_none_match.contains_weak(etag)
+    else:
+        vigente = (ultima_modificacion is not None and request.if_modified_since is not None
+                   and ultima_modificacion <= request.if_modified_since)
+    if vigente:
+        return _cabeceras_cache(make_response('', 304), etag, ultima_modificacion)
+    
+    respuesta = make_response(generar())
+    if respuesta.status_code != 200:
+        return respuesta
+    return _cabeceras_cache(respuesta, etag, ultima_modificacion)
 
 # Decorador para requerir login
 def login_required(f):
@@ -20,73 +264,187 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Decorador para requerir rol de admin
-def admin_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Por favor inicia sesión', 'error')
-            return redirect(url_for('login'))
-        
-        usuario = db.obtener_usuario_por_id(session['user_id'])
-        if not usuario or usuario.rol not in ['admin', 'superuser']:
-            flash('No tienes permisos para acceder a esta página', 'error')
-            return redirect(url_for('index'))
-        return f(*args, **kwargs)
-    return decorated_function
-
-# Decorador para requerir rol de superuser
-def superuser_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Por favor inicia sesión', 'error')
-            return redirect(url_for('login'))
-        
-        usuario = db.obtener_usuario_por_id(session['user_id'])
-        if not usuario or usuario.rol != 'superuser':
-            flash('No tienes permisos para acceder a esta página', 'error')
-            return redirect(url_for('index'))
-        return f(*args, **kwargs)
-    return decorated_function
-
-# Decorador para requerir rol de director
-def director_required(f):
+# Decorador para requerir alguno de los roles indicados.
+# El rol se lee de la cache de principales, así que una página protegida
+# normalmente no hace ninguna consulta de autenticación.
+def rol_requerido(*roles):
+    def decorador(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'user_id' not in session:
+                flash('Por favor inicia sesión', 'error')
+                return redirect(url_for('login'))
+            
+            principal = db.obtener_principal(session['user_id'])
+            if not principal or principal.rol not in roles:
+                flash('No tienes permisos para acceder a esta página', 'error')
+                return redirect(url_for('index'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorador
+
+# Decorador de admisión a la compra de un evento.
+# Sin lugar libre el comprador queda en la sala de espera, una página que
+# no consulta teatro.db; una vez admitido, el token firmado en la sesión
+# (ligado a su usuario) lo deja pasar sin volver a la cola hasta que compra
+# o vence.
+def sala_de_espera(f):
     @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Por favor inicia sesión', 'error')
-            return redirect(url_for('login'))
-        
-        usuario = db.obtener_usuario_por_id(session['user_id'])
-        if not usuario or usuario.rol not in ['director', 'superuser']:
-            flash('No tienes permisos para acceder a esta página', 'error')
-            return redirect(url_for('index'))
-        return f(*args, **kwargs)
+    def decorated_function(evento_id, *args, **kwargs):
+        if sala_espera is None:
+            return f(evento_id, *args, **kwargs)
+        admisiones = session.get('admisiones', {})
+        visitante = str(session['user_id'])
+        if not sala_espera.validar(admisiones.get(str(evento_id)), evento_id, visitante):
+            turno = sala_espera.turno(evento_id, visitante)
+            if turno.token is None:
+                respuesta = make_response(render_template(
+                    'sala_espera.html', turno=turno, refresco=SALA_ESPERA_REFRESCO))
+                respuesta.headers['Retry-After'] = str(SALA_ESPERA_REFRESCO)
+                respuesta.headers['Cache-Control'] = 'no-store'
+                return respuesta
+            admisiones[str(evento_id)] = turno.token
+            session['admisiones'] = admisiones
+        return f(evento_id, *args, **kwargs)
     return decorated_function
 
-# Decorador para requerir rol de actor
-def actor_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Por favor inicia sesión', 'error')
-            return redirect(url_for('login'))
-        
-        usuario = db.obtener_usuario_por_id(session['user_id'])
-        if not usuario or usuario.rol not in ['actor', 'superuser']:
-            flash('No tienes permisos para acceder a esta página', 'error')
-            return redirect(url_for('index'))
-        return f(*args, **kwargs)
-    return decorated_function
+# Decorador de límites de tasa para los POST de una ruta.
+# Cada regla es (límite, función que da la clave del request); si alguna
+# se agota se responde 429 con el formulario y Retry-After, antes de que
+# la vista toque la base de datos. Las reglas se consumen en orden y la
+# primera que rechaza corta: un request rechazado por IP no gasta además
+# el cupo del email (que un atacante podría agotar a la víctima).
+def limitar(plantilla, *reglas):
+    def decorador(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method == 'POST':
+                espera = 0
+                for limite, clave in reglas:
+                    valor = clave() if limite else None
+                    if valor:
+                        espera = limitador.consumir(limite, valor)
+                        if espera:
+                            break
+                if espera:
+                    flash('Hay demasiados intentos, espera unos segundos antes de volver a intentar', 'error')
+                    respuesta = make_response(render_template(plantilla), 429)
+                    respuesta.headers['Retry-After'] = str(int(espera) + 1)
+                    return respuesta
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorador
+
+# Decorador de presupuesto de consultas SQL por request.
+# En modo debug o testing una vista que emite más sentencias que las
+# esperadas queda en el log (y en testing falla), así una consulta de más
+# o un N+1 aparece en los tests y no en producción.
+def presupuesto_consultas(maximo):
+    def decorador(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            respuesta = f(*args, **kwargs)
+            if metricas is not None and (app.debug or app.testing):
+                consultas = metricas.consultas_en_request()
+                if consultas is not None and consultas > maximo:
+                    mensaje = f'{request.endpoint} emitió {consultas} consultas SQL (presupuesto {maximo})'
+                    if app.testing:
+                        raise AssertionError(mensaje)
+                    app.logger.warning(mensaje)
+            return respuesta
+        # tests/test-presupuestos-consultas.py recorre las rutas que lo tienen
+        decorated_function.presupuesto_consultas = maximo
+        return decorated_function
+    return decorador
+
+def _ip_cliente():
+    # Con PROXIES_CONFIABLES, ProxyFix ya la tomó de X-Forwarded-For
+    return request.remote_addr
+
+def _email_formulario():
+    return normalizar_email(request.form.get('email', ''))
+
+# ==================== MÉTRICAS ====================
+
+@app.before_request
+def iniciar_metricas():
+    if metricas is not None:
+        metricas.iniciar_request()
+
+@app.after_request
+def estado_metricas(respuesta):
+    request.environ['teatro.estado'] = respuesta.status_code
+    return respuesta
+
+@app.teardown_request
+def terminar_metricas(error=None):
+    if metricas is not None:
+        metricas.terminar_request(request.endpoint or 'sin_ruta', request.method,
+                                  request.environ.get('teatro.estado', 500))
+
+def _request_local():
+    """Request hecho desde esta máquina y no reenviado por un proxy"""
+    if 'X-Forwarded-For' in request.headers or 'Forwarded' in request.headers:
+        return False
+    try:
+        return ipaddress.ip_address(request.remote_addr or '').is_loopback
+    except ValueError:
+        return False
+
+@app.route('/metrics')
+def exponer_metricas():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    if metricas is None:
+        return Response('Métricas desactivadas\n', 404, mimetype='text/plain')
+    if METRICAS_TOKEN:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICAS_TOKEN}'):
+            return Response('No autorizado\n', 401, mimetype='text/plain')
+    elif not _request_local():
+        return Response('No autorizado\n', 403, mimetype='text/plain')
+    return Response(metricas.texto(), content_type=TIPO_CONTENIDO)
+
+admin_required = rol_requerido('admin', 'superuser')
+superuser_required = rol_requerido('superuser')
+director_required = rol_requerido('director', 'superuser')
+actor_required = rol_requerido('actor', 'superuser')
+acceso_required = rol_requerido('admin', 'director', 'superuser')
 
 @app.route('/')
+@presupuesto_consultas(2)
 def index():
-    """Página principal - muestra todos los eventos disponibles"""
-    eventos = db.obtener_eventos()
-    return render_template('index.html', eventos=eventos)
+    """Página principal - muestra la cartelera (las funciones de hoy en adelante)"""
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    def generar():
+        eventos = db.obtener_proximos_eventos(desde=hoy)
+        return render_template('index.html', eventos=eventos)
+    # La cartelera cambia con el contenido del catálogo y con el día; las
+    # ventas no la invalidan porque la página actualiza el stock aparte
+    # (/cartelera/disponibilidad)
+    version = db.version_catalogo()
+    return pagina_condicional(f'catalogo{hoy}', generar,
+                              {'version': version['contenido'], 'actualizado_en': version['contenido_en']})
+
+@app.route('/cartelera/disponibilidad')
+@presupuesto_consultas(2)
+def disponibilidad_cartelera():
+    """Stock de los eventos de la cartelera, {evento_id: entradas}"""
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    def generar():
+        return jsonify({evento.id: evento.entradas_disponibles
+                        for evento in db.obtener_proximos_eventos(desde=hoy)})
+    return pagina_condicional(f'disponibilidad{hoy}', generar)
+
+@app.route('/buscar')
+@presupuesto_consultas(3)
+def buscar():
+    """Búsqueda de eventos por nombre, descripción o lugar"""
+    q = request.args.get('q', '').strip()
+    pagina = max(1, request.args.get('pagina', 1, type=int))
+    eventos, hay_mas = db.buscar_eventos(q, pagina=pagina, limite=TAMANO_PAGINA) if q else ([], False)
+    return render_template('buscar.html', eventos=eventos, hay_mas=hay_mas, q=q, pagina=pagina)
 
 @app.route('/registro', methods=['GET', 'POST'])
+@presupuesto_consultas(4)
 def registro():
     """Registro de nuevos usuarios"""
     if request.method == 'POST':
@@ -105,7 +463,11 @@ def registro():
             return render_template('registro.html')
         
         # Crear usuario
-        user_id = db.crear_usuario(nombre, email, password, telefono)
+        try:
+            user_id = db.crear_usuario(nombre, email, password, telefono)
+        except HashOcupadoError:
+            flash('Hay demasiadas solicitudes en este momento, intenta de nuevo en unos segundos', 'error')
+            return render_template('registro.html'), 503
         if user_id:
             flash('Registro exitoso. Por favor inicia sesión', 'success')
             return redirect(url_for('login'))
@@ -115,13 +477,19 @@ def registro():
     return render_template('registro.html')
 
 @app.route('/login', methods=['GET', 'POST'])
+@presupuesto_consultas(4)
+@limitar('login.html', (LIMITE_LOGIN_IP, _ip_cliente), (LIMITE_LOGIN_EMAIL, _email_formulario))
 def login():
     """Inicio de sesión"""
     if request.method == 'POST':
         email = request.form.get('email', '').strip()
         password = request.form.get('password', '').strip()
         
-        usuario = db.verificar_credenciales(email, password)
+        try:
+            usuario = db.verificar_credenciales(email, password)
+        except HashOcupadoError:
+            flash('Hay demasiadas solicitudes en este momento, intenta de nuevo en unos segundos', 'error')
+            return render_template('login.html'), 503
         if usuario:
             session['user_id'] = usuario.id
             session['user_nombre'] = usuario.nombre
@@ -151,6 +519,7 @@ def logout():
     return redirect(url_for('index'))
 
 @app.route('/perfil')
+@presupuesto_consultas(2)
 @login_required
 def perfil():
     """Perfil del usuario"""
@@ -159,16 +528,28 @@ def perfil():
     return render_template('perfil.html', usuario=usuario, ventas=ventas)
 
 @app.route('/evento/<int:evento_id>')
+@presupuesto_consultas(2)
 def detalle_evento(evento_id):
     """Página de detalle de un evento específico"""
-    evento = db.obtener_evento(evento_id)
-    if not evento:
+    # Versión propia del evento (datos, stock y asientos) desde la cache de
+    # versiones: un 304 no carga el evento. La del catálogo cambia con cada
+    # venta de cualquier evento y en plena venta casi nunca daría 304
+    version = db.version_evento(evento_id)
+    if version is None:
         flash('Evento no encontrado', 'error')
         return redirect(url_for('index'))
-    return render_template('detalle_evento.html', evento=evento)
+    def generar():
+        evento = db.obtener_evento(evento_id)
+        if not evento:
+            flash('Evento no encontrado', 'error')
+            return redirect(url_for('index'))
+        return render_template('detalle_evento.html', evento=evento)
+    return pagina_condicional(f'evento{evento_id}', generar, version)
 
 @app.route('/comprar/<int:evento_id>', methods=['GET', 'POST'])
+@presupuesto_consultas(8)
 @login_required
+@sala_de_espera
 def comprar(evento_id):
     """Proceso de compra de entradas"""
     evento = db.obtener_evento(evento_id)
@@ -178,6 +559,14 @@ def comprar(evento_id):
     
     if request.method == 'POST':
         cantidad = request.form.get('cantidad', type=int)
+        asientos = request.form.getlist('asientos', type=int) if evento.mapa else []
+        if asientos:
+            # Cada asiento se cobra una vez: repetidos o fuera del mapa invalidan el formulario
+            if (len(set(asientos)) != len(asientos)
+                    or min(asientos) < 0 or max(asientos) >= evento.mapa.capacidad):
+                flash('Selección de asientos inválida', 'error')
+                return render_template('comprar.html', evento=evento)
+            cantidad = len(asientos)
         
         if not cantidad or cantidad <= 0:
             flash('La cantidad debe ser mayor a 0', 'error')
@@ -189,23 +578,31 @@ def comprar(evento_id):
         
         # Procesar la compra
         total = cantidad * evento.precio
-        usuario = db.obtener_usuario_por_id(session['user_id'])
-        venta_id = db.crear_venta(evento_id, session['user_id'], cantidad, total)
+        venta_id = db.crear_venta(evento_id, session['user_id'], cantidad, total, asientos or None)
         
         if venta_id:
+            if sala_espera is not None:
+                # Compra terminada: el lugar pasa al siguiente de la fila
+                admisiones = session.get('admisiones', {})
+                sala_espera.liberar(admisiones.pop(str(evento_id), None))
+                session['admisiones'] = admisiones
             flash(f'Compra realizada exitosamente. ID de compra: {venta_id}', 'success')
             return redirect(url_for('confirmacion', venta_id=venta_id))
         else:
+            # El stock pudo cambiar desde que se cargó el evento: mostrar el actual
+            evento = db.obtener_evento(evento_id) or evento
             flash('Error al procesar la compra. Puede que no haya suficientes entradas disponibles', 'error')
             return render_template('comprar.html', evento=evento)
     
     return render_template('comprar.html', evento=evento)
 
 @app.route('/confirmacion/<int:venta_id>')
+@presupuesto_consultas(1)
 @login_required
 def confirmacion(venta_id):
     """Página de confirmación de compra"""
-    venta = db.obtener_venta(venta_id)
+    # Venta, evento y comprador en una sola consulta
+    venta = db.obtener_recibo(venta_id)
     if not venta:
         flash('Venta no encontrada', 'error')
         return redirect(url_for('index'))
@@ -215,70 +612,57 @@ def confirmacion(venta_id):
         flash('No tienes permiso para ver esta venta', 'error')
         return redirect(url_for('index'))
     
-    evento = db.obtener_evento(venta['evento_id'])
-    usuario = db.obtener_usuario_por_id(venta['user_id'])
-    return render_template('confirmacion.html', venta=venta, evento=evento, usuario=usuario)
+    codigos = codigos_venta(SECRETO_ENTRADAS, venta['evento_id'], venta['id'], venta['cantidad'])
+    return render_template('confirmacion.html', venta=venta, codigos=codigos)
 
 # ==================== DASHBOARDS POR ROL ====================
 
 @app.route('/dashboard/superuser')
+@presupuesto_consultas(6)
 @superuser_required
 def dashboard_superuser():
     """Dashboard para Super Usuario"""
-    eventos = db.obtener_eventos()
-    ventas = db.obtener_todas_ventas()
-    usuarios = db.obtener_todos_usuarios()
+    eventos = db.obtener_proximos_eventos(limite=10)
+    ventas = db.obtener_ultimas_ventas(10)
+    resumen = db.obtener_resumen_ventas()
     
-    # Estadísticas generales
-    total_ventas = sum(v['total'] for v in ventas)
-    total_entradas_vendidas = sum(v['cantidad'] for v in ventas)
-    total_eventos = len(eventos)
-    total_usuarios = len(usuarios)
-    
-    # Estadísticas por rol
-    usuarios_por_rol = {}
-    for usuario in usuarios:
-        rol = usuario.rol
-        usuarios_por_rol[rol] = usuarios_por_rol.get(rol, 0) + 1
+    # Estadísticas por rol (agregados mantenidos por la base)
+    usuarios_por_rol = db.obtener_usuarios_por_rol()
     
     return render_template('dashboard_superuser.html', 
                          eventos=eventos,
                          ventas=ventas,
-                         usuarios=usuarios,
-                         total_ventas=total_ventas,
-                         total_entradas_vendidas=total_entradas_vendidas,
-                         total_eventos=total_eventos,
-                         total_usuarios=total_usuarios,
+                         total_ventas=resumen['total_ventas'],
+                         total_entradas_vendidas=resumen['total_entradas'],
+                         total_eventos=db.contar_eventos(),
+                         total_usuarios=sum(usuarios_por_rol.values()),
                          usuarios_por_rol=usuarios_por_rol)
 
 @app.route('/dashboard/director')
+@presupuesto_consultas(4)
 @director_required
 def dashboard_director():
     """Dashboard para Director"""
-    eventos = db.obtener_eventos()
-    ventas = db.obtener_todas_ventas()
+    eventos = db.obtener_proximos_eventos()
+    resumen = db.obtener_resumen_ventas()
     
-    # Estadísticas de eventos
-    eventos_activos = [e for e in eventos if e.entradas_disponibles > 0]
-    eventos_agotados = [e for e in eventos if e.entradas_disponibles == 0]
-    
-    # Estadísticas de ventas
-    total_recaudado = sum(v['total'] for v in ventas)
-    total_entradas = sum(v['cantidad'] for v in ventas)
+    # Estadísticas de la cartelera
+    eventos_activos = sum(1 for e in eventos if e.entradas_disponibles > 0)
     
     return render_template('dashboard_director.html',
                          eventos=eventos,
-                         eventos_activos=len(eventos_activos),
-                         eventos_agotados=len(eventos_agotados),
-                         total_recaudado=total_recaudado,
-                         total_entradas=total_entradas,
-                         ventas=ventas[:10])  # Últimas 10 ventas
+                         eventos_activos=eventos_activos,
+                         eventos_agotados=len(eventos) - eventos_activos,
+                         total_recaudado=resumen['total_ventas'],
+                         total_entradas=resumen['total_entradas'],
+                         ventas=db.obtener_ultimas_ventas(10))  # Últimas 10 ventas
 
 @app.route('/dashboard/actor')
+@presupuesto_consultas(2)
 @actor_required
 def dashboard_actor():
     """Dashboard para Actor/Actriz"""
-    eventos = db.obtener_eventos()
+    eventos = db.obtener_proximos_eventos()
     
     # Para el actor, mostramos los eventos en los que participa
     # (En una implementación real, habría una tabla de relación actor-evento)
@@ -291,26 +675,57 @@ def dashboard_actor():
                          proximos_eventos=proximos_eventos,
                          total_eventos=len(eventos))
 
+# ==================== CONTROL DE ACCESO ====================
+
+@app.route('/checkin/<int:evento_id>', methods=['GET', 'POST'])
+# Peor caso: primera lectura (precarga) de una venta posterior a la precarga
+@presupuesto_consultas(4)
+@acceso_required
+def checkin(evento_id):
+    """Validar códigos de entrada en la puerta (formulario o JSON {"codigo": ...})"""
+    if request.method == 'POST' and request.is_json:
+        # Los lectores no cargan el evento: el control ya está en memoria
+        control = control_acceso(evento_id)
+        if control is None:
+            return jsonify(error='Evento no encontrado'), 404
+        datos = request.get_json(silent=True) or {}
+        return jsonify(asdict(control.validar(str(datos.get('codigo', '')))))
+
+    evento = db.obtener_evento(evento_id)
+    if not evento:
+        flash('Evento no encontrado', 'error')
+        return redirect(url_for('admin'))
+    control = control_acceso(evento_id, evento)
+    lectura = control.validar(request.form.get('codigo', '')) if request.method == 'POST' else None
+    return render_template('checkin.html', evento=evento, lectura=lectura,
+                           estadisticas=control.estadisticas())
+
+@app.route('/checkin/<int:evento_id>/snapshot')
+@acceso_required
+def snapshot_checkin(evento_id):
+    """Códigos válidos del evento para una puerta sin conexión (manage.py puerta)"""
+    control = control_acceso(evento_id)
+    if control is None:
+        flash('Evento no encontrado', 'error')
+        return redirect(url_for('admin'))
+    respuesta = Response(json.dumps(control.snapshot()), mimetype='application/json')
+    respuesta.headers['Content-Disposition'] = f'attachment; filename=acceso-evento-{evento_id}.json'
+    return respuesta
+
 # ==================== RUTAS DE ADMINISTRACIÓN ====================
 
 @app.route('/admin')
+@presupuesto_consultas(3)
 @admin_required
 def admin():
     """Panel de administración (para admin y superuser)"""
     eventos = db.obtener_eventos()
-    ventas = db.obtener_todas_ventas()
-    usuarios = db.obtener_todos_usuarios()
-    
-    # Estadísticas
-    total_ventas = sum(v['total'] for v in ventas)
-    total_entradas_vendidas = sum(v['cantidad'] for v in ventas)
+    resumen = db.obtener_resumen_ventas()
     
     return render_template('admin.html', 
                          eventos=eventos, 
-                         ventas=ventas, 
-                         usuarios=usuarios,
-                         total_ventas=total_ventas,
-                         total_entradas_vendidas=total_entradas_vendidas)
+                         total_ventas=resumen['total_ventas'],
+                         total_entradas_vendidas=resumen['total_entradas'])
 
 @app.route('/admin/evento/nuevo', methods=['GET', 'POST'])
 @admin_required
@@ -326,11 +741,18 @@ def nuevo_evento():
         descripcion = request.form.get('descripcion', '').strip()
         imagen_url = request.form.get('imagen_url', '').strip()
         
-        if not all([nombre, fecha, hora, lugar, precio, entradas_disponibles]):
+        try:
+            secciones = parsear_secciones(request.form.get('secciones', ''))
+        except ValueError:
+            flash('El formato de los asientos numerados no es válido', 'error')
+            return render_template('nuevo_evento.html')
+        
+        # Con asientos numerados el stock es la capacidad del mapa
+        if not all([nombre, fecha, hora, lugar, precio, secciones or entradas_disponibles]):
             flash('Por favor complete todos los campos obligatorios', 'error')
             return render_template('nuevo_evento.html')
         
-        if db.crear_evento(nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url):
+        if db.crear_evento(nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url, secciones or None):
             flash('Evento creado exitosamente', 'success')
             return redirect(url_for('admin'))
         else:
@@ -357,6 +779,10 @@ def editar_evento(evento_id):
         descripcion = request.form.get('descripcion', '').strip()
         imagen_url = request.form.get('imagen_url', '').strip()
         
+        if entradas_disponibles is None and evento.mapa is None:
+            flash('Por favor complete todos los campos obligatorios', 'error')
+            return render_template('editar_evento.html', evento=evento)
+        
         if db.actualizar_evento(evento_id, nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url):
             flash('Evento actualizado exitosamente', 'success')
             return redirect(url_for('admin'))
@@ -376,11 +802,25 @@ def eliminar_evento(evento_id):
     return redirect(url_for('admin'))
 
 @app.route('/admin/usuarios')
+@presupuesto_consultas(2)
 @admin_required
 def admin_usuarios():
-    """Gestión de usuarios"""
-    usuarios = db.obtener_todos_usuarios()
-    return render_template('admin_usuarios.html', usuarios=usuarios)
+    """Gestión de usuarios (paginada)"""
+    filtros = {
+        'rol': request.args.get('rol', '').strip(),
+        'email': request.args.get('email', '').strip(),
+    }
+    try:
+        usuarios, siguiente = db.obtener_usuarios_pagina(
+            cursor=request.args.get('cursor'),
+            limite=TAMANO_PAGINA,
+            rol=filtros['rol'] or None,
+            email_prefijo=filtros['email'] or None,
+        )
+    except ValueError:
+        flash('Página inválida', 'error')
+        return redirect(url_for('admin_usuarios'))
+    return render_template('admin_usuarios.html', usuarios=usuarios, siguiente=siguiente, filtros=filtros)
 
 @app.route('/admin/usuario/cambiar-rol/<int:user_id>/<nuevo_rol>')
 @superuser_required
@@ -398,11 +838,49 @@ def cambiar_rol_usuario(user_id, nuevo_rol):
     return redirect(url_for('admin_usuarios'))
 
 @app.route('/admin/ventas')
+@presupuesto_consultas(3)
 @admin_required
 def admin_ventas():
-    """Reporte de ventas"""
-    ventas = db.obtener_todas_ventas()
-    return render_template('admin_ventas.html', ventas=ventas)
+    """Reporte de ventas (paginado)"""
+    filtros = {
+        'evento_id': request.args.get('evento_id', type=int),
+        'desde': request.args.get('desde', '').strip(),
+        'hasta': request.args.get('hasta', '').strip(),
+        'email': request.args.get('email', '').strip(),
+    }
+    try:
+        ventas, siguiente = db.obtener_ventas_pagina(
+            cursor=request.args.get('cursor'),
+            limite=TAMANO_PAGINA,
+            evento_id=filtros['evento_id'],
+            desde=filtros['desde'] or None,
+            hasta=filtros['hasta'] or None,
+            email_prefijo=filtros['email'] or None,
+        )
+    except ValueError:
+        flash('Página inválida', 'error')
+        return redirect(url_for('admin_ventas'))
+    return render_template('admin_ventas.html', ventas=ventas, siguiente=siguiente, filtros=filtros,
+                           eventos=db.obtener_nombres_eventos())
+
+@app.route('/admin/ventas/exportar')
+@admin_required
+def exportar_ventas():
+    """Exportar las ventas filtradas en CSV o JSON Lines (respuesta en streaming)"""
+    formato = request.args.get('formato', 'csv')
+    if formato not in exportacion.FORMATOS:
+        flash('Formato de exportación inválido', 'error')
+        return redirect(url_for('admin_ventas'))
+    ventas = db.iterar_ventas(
+        evento_id=request.args.get('evento_id', type=int),
+        desde=request.args.get('desde', '').strip() or None,
+        hasta=request.args.get('hasta', '').strip() or None,
+        email_prefijo=request.args.get('email', '').strip() or None,
+        user_id=request.args.get('user_id', type=int),
+    )
+    nombre = f"ventas-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{formato}"
+    return Response(exportacion.exportar(ventas, formato), content_type=exportacion.FORMATOS[formato],
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"'})
 
 @app.route('/mis-compras')
 def mis_compras():
@@ -410,6 +888,8 @@ def mis_compras():
     return render_template('mis_compras.html')
 
 @app.route('/buscar-compras', methods=['POST'])
+@presupuesto_consultas(1)
+@limitar('mis_compras.html', (LIMITE_BUSCAR_IP, _ip_cliente), (LIMITE_BUSCAR_EMAIL, _email_formulario))
 def buscar_compras():
     """Buscar compras por email"""
     email = request.form.get('email', '').strip()
@@ -0,0 +1,172 @@
+import json
+
+# Estados de cada asiento (un byte por asiento en el mapa)
+LIBRE = 0
+RETENIDO = 1
+VENDIDO = 2
+
+
+class MapaAsientos:
+    """Mapa de asientos numerados de un evento.
+
+    El layout es una lista de secciones, cada una con sus filas y la
+    cantidad de asientos por fila::
+
+        [{'nombre': 'Platea', 'filas': [['A', 20], ['B', 22]]}, ...]
+
+    Los estados se guardan en un bytearray con un byte por asiento, en el
+    orden sección → fila → número, de modo que una sala de 2000 butacas
+    ocupa 2 KB y se lee y escribe como un único valor. Las secciones y las
+    filas se listan de la mejor a la peor ubicación.
+    """
+
+    def __init__(self, secciones, estados=None):
+        self.secciones = secciones
+        self._filas = []  # (seccion, fila, inicio, cantidad)
+        inicio = 0
+        for seccion in secciones:
+            for fila, cantidad in seccion['filas']:
+                self._filas.append((seccion['nombre'], str(fila), inicio, int(cantidad)))
+                inicio += int(cantidad)
+        self.capacidad = inicio
+        if estados is None:
+            estados = bytearray(self.capacidad)
+        self.estados = bytearray(estados)
+        if len(self.estados) != self.capacidad:
+            raise ValueError('El estado no coincide con la capacidad del mapa')
+
+    # ---- Serialización ----
+
+    @classmethod
+    def desde_db(cls, layout, estados):
+        return cls(json.loads(layout), estados)
+
+    def layout_json(self):
+        return json.dumps(self.secciones, ensure_ascii=False, separators=(',', ':'))
+
+    def estados_blob(self):
+        return bytes(self.estados)
+
+    # ---- Consultas ----
+
+    def posicion(self, seccion, fila, numero):
+        """Offset de un asiento a partir de sección, fila y número (desde 1)"""
+        for nombre, nombre_fila, inicio, cantidad in self._filas:
+            if nombre == seccion and nombre_fila == str(fila):
+                if 1 <= numero <= cantidad:
+                    return inicio + numero - 1
+                break
+        raise KeyError(f'Asiento inexistente: {seccion} {fila}{numero}')
+
+    def ubicacion(self, posicion):
+        """(sección, fila, número) del asiento en el offset dado"""
+        for nombre, fila, inicio, cantidad in self._filas:
+            if inicio <= posicion < inicio + cantidad:
+                return nombre, fila, posicion - inicio + 1
+        raise KeyError(f'Asiento inexistente: {posicion}')
+
+    def etiqueta(self, posicion):
+        seccion, fila, numero = self.ubicacion(posicion)
+        return f'{seccion} {fila}{numero}'
+
+    def contar(self, estado=LIBRE):
+        return self.estados.count(estado)
+
+    def filas(self):
+        """Filas para mostrar en plantillas: (sección, fila, [(offset, estado), ...])"""
+        for seccion, fila, inicio, cantidad in self._filas:
+            yield seccion, fila, [(p, self.estados[p]) for p in range(inicio, inicio + cantidad)]
+
+    def mejores_adyacentes(self, cantidad):
+        """Los mejores `cantidad` asientos libres contiguos en una misma fila.
+
+        Prefiere las primeras secciones y filas y, dentro de la fila, el
+        bloque más cercano al centro. Devuelve None si no hay bloque libre.
+        """
+        hueco = bytes(cantidad)
+        for seccion, fila, inicio, largo in self._filas:
+            if largo < cantidad:
+                continue
+            centro = (largo - cantidad) / 2
+            mejor = None
+            fila_estados = bytes(self.estados[inicio:inicio + largo])
+            desde = fila_estados.find(hueco)
+            while desde != -1:
+                if mejor is None or abs(desde - centro) < abs(mejor - centro):
+                    mejor = desde
+                desde = fila_estados.find(hueco, desde + 1)
+            if mejor is not None:
+                return list(range(inicio + mejor, inicio + mejor + cantidad))
+        return None
+
+    def mejores_libres(self, cantidad):
+        """Los `cantidad` mejores asientos libres, juntos si es posible"""
+        adyacentes = self.mejores_adyacentes(cantidad)
+        if adyacentes is not None:
+            return adyacentes
+        libres = [p for p, estado in enumerate(self.estados) if estado == LIBRE]
+        return libres[:cantidad] if len(libres) >= cantidad else None
+
+    # ---- Cambios de estado ----
+
+    def cambiar(self, posiciones, nuevo, permitidos):
+        """Pasar los asientos a `nuevo` si todos están en un estado permitido.
+
+        Devuelve cuántos asientos estaban libres, o None si alguno no se
+        podía cambiar (en ese caso el mapa no se modifica).
+        """
+        posiciones = sorted(set(posiciones))
+        if not posiciones or posiciones[0] < 0 or posiciones[-1] >= self.capacidad:
+            return None
+        if any(self.estados[p] not in permitidos for p in posiciones):
+            return None
+        libres = sum(1 for p in posiciones if self.estados[p] == LIBRE)
+        for p in posiciones:
+            self.estados[p] = nuevo
+        return libres
+
+
+def parsear_secciones(texto):
+    """Convertir el formato del formulario en un layout de secciones.
+
+    Una línea por sección, con rango o lista de filas y asientos por fila::
+
+        Platea: A-J x 20
+        Pullman: K,L,M x 16
+    """
+    secciones = []
+    for linea in texto.splitlines():
+        if not linea.strip():
+            continue
+        nombre, _, resto = linea.partition(':')
+        filas, _, cantidad = resto.partition('x')
+        filas, cantidad = filas.strip(), int(cantidad)
+        if '-' in filas:
+            desde, hasta = [f.strip() for f in filas.split('-', 1)]
+            if len(desde) != 1 or len(hasta) != 1:
+                raise ValueError(f'Rango de filas inválido: {filas}')
+            nombres = [chr(c) for c in range(ord(desde), ord(hasta) + 1)]
+        else:
+            nombres = [f.strip() for f in filas.split(',') if f.strip()]
+        if not nombre.strip() or not nombres or cantidad <= 0:
+            raise ValueError(f'Sección inválida: {linea}')
+        secciones.append({'nombre': nombre.strip(), 'filas': [[f, cantidad] for f in nombres]})
+    return secciones
+
+
+def cargar_mapa(conn, evento_id):
+    """Leer el mapa de asientos de un evento (una sola fila) o None"""
+    row = conn.execute(
+        'SELECT layout, estados FROM mapas_asientos WHERE evento_id = ?', (evento_id,)
+    ).fetchone()
+    if row:
+        return MapaAsientos.desde_db(row[0], row[1])
+    return None
+
+
+def guardar_mapa(conn, evento_id, mapa):
+    """Insertar o actualizar el mapa de asientos de un evento"""
+    conn.execute('''
+        INSERT INTO mapas_asientos (evento_id, layout, estados) VALUES (?, ?, ?)
+        ON CONFLICT(evento_id) DO UPDATE SET estados = excluded.estados
+    ''', (evento_id, mapa.layout_json(), mapa.estados_blob()))
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+_AUSENTE = object()
+
+
+class CacheLRU:
+    """Cache en memoria del proceso, acotada por cantidad de entradas y con TTL.
+
+    Segura entre hilos. Cuando se llena descarta la entrada usada hace más
+    tiempo; las entradas vencidas se descartan al leerlas. Lleva contadores
+    de aciertos y fallos para las métricas.
+    """
+
+    def __init__(self, max_entradas=1000, ttl=None):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()  # clave -> (valor, vence_en)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave, defecto=None):
+        with self._lock:
+            entrada = self._datos.get(clave, _AUSENTE)
+            if entrada is not _AUSENTE:
+                valor, vence_en = entrada
+                if vence_en is None or vence_en > time.monotonic():
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                del self._datos[clave]
+            self.fallos += 1
+            return defecto
+
+    def guardar(self, clave, valor, ttl=_AUSENTE):
+        ttl = self.ttl if ttl is _AUSENTE else ttl
+        vence_en = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._datos[clave] = (valor, vence_en)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+    def estadisticas(self):
+        return {'entradas': len(self._datos), 'aciertos': self.aciertos, 'fallos': self.fallos}
+
+
+class CacheFragmentos:
+    """HTML renderizado por clave y versión, acotado por tamaño total en bytes.
+
+    Cada clave guarda una sola versión: guardar una versión nueva reemplaza la
+    anterior, y pedir una versión distinta de la guardada es un fallo. Cuando
+    se supera el presupuesto se descartan los fragmentos usados hace más tiempo.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._datos = OrderedDict()  # clave -> (version, html, bytes)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave, version):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada[0] == version:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, version, html):
+        tamano = len(html.encode('utf-8'))
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[2]
+            self._datos[clave] = (version, html, tamano)
+            self.bytes += tamano
+            while self.bytes > self.max_bytes:
+                _, (_, _, descartado) = self._datos.popitem(last=False)
+                self.bytes -= descartado
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._datos)
+
+    def estadisticas(self):
+        return {'entradas': len(self._datos), 'bytes': self.bytes,
+                'aciertos': self.aciertos, 'fallos': self.fallos}
@@ -0,0 +1,56 @@
+import threading
+
+from cache import CacheLRU
+
+
+class CatalogoEventos:
+    """Cache de lectura del catálogo de eventos.
+
+    Guarda los datos estáticos de cada evento (nombre, fecha, lugar,
+    descripción, layout de asientos...) y el listado ordenado. El stock y el
+    estado de los asientos no se cachean: Database los lee con una consulta
+    angosta en cada acceso, así que siempre están al día aunque las ventas
+    ocurran en otro proceso. crear/actualizar/eliminar_evento invalidan la
+    cache local; los cambios hechos por otros procesos se ven al vencer el TTL.
+    """
+
+    def __init__(self, max_eventos=5000, ttl=60.0, version_ttl=1.0):
+        self.eventos = CacheLRU(max_entradas=max_eventos, ttl=ttl)
+        self.listados = CacheLRU(max_entradas=16, ttl=ttl)
+        # Versión global del catálogo y de cada evento: TTL corto porque
+        # cambian con cada venta
+        self.version = CacheLRU(max_entradas=max_eventos + 1, ttl=version_ttl)
+        self._lock = threading.Lock()
+        self.generacion = 0
+
+    def invalidar(self, evento_id=None):
+        """Descartar un evento (o todo el catálogo) y los listados"""
+        with self._lock:
+            self.generacion += 1
+            if evento_id is None:
+                self.eventos.limpiar()
+            else:
+                self.eventos.invalidar(evento_id)
+            self.listados.limpiar()
+            self.version.limpiar()
+
+    def guardar_evento(self, evento, generacion):
+        """Cachear un evento leído cuando la cache estaba en `generacion`"""
+        with self._lock:
+            if generacion == self.generacion:
+                self.eventos.guardar(evento.id, evento)
+
+    def guardar_listado(self, clave, eventos, generacion):
+        """Cachear un listado (sus eventos no traen el layout de asientos)"""
+        with self._lock:
+            if generacion == self.generacion:
+                self.listados.guardar(clave, eventos)
+
+    def estadisticas(self):
+        eventos = self.eventos.estadisticas()
+        listados = self.listados.estadisticas()
+        return {
+            'eventos': eventos['entradas'],
+            'aciertos': eventos['aciertos'] + listados['aciertos'],
+            'fallos': eventos['fallos'] + listados['fallos'],
+        }
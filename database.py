@@ -1,72 +1,157 @@
 import sqlite3
-from datetime import datetime
-from models import Evento, Venta, Usuario
-import hashlib
+import base64
+import json
+import re
+import zlib
+from datetime import date, datetime, timedelta
+from models import Evento, Venta, Usuario, Principal, mapeador, normalizar_email
+from cache import CacheLRU
+from catalogo import CatalogoEventos
+from dataclasses import replace
+from pool import ConnectionPool
+from reservas import MotorReservas
+from escritor_ventas import EscritorVentas
+from particiones import (ParticionesVentas, Particion, VISTA_VENTAS, VISTA_RESUMEN, VISTA_VERSIONES_STOCK,
+                         VISTA_RESUMEN_EVENTO)
+from asientos import MapaAsientos, LIBRE, cargar_mapa, guardar_mapa
+import migraciones
+import resumenes
+from passwords import HasherPasswords
+
+
+def _codificar_cursor(*valores):
+    """Cursor opaco para paginación por clave (la última fila de la página)"""
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Cursor de paginación inválido')
+    if not isinstance(valores, list) or len(valores) != 2:
+        raise ValueError('Cursor de paginación inválido')
+    return valores
+
+
+# Proyecciones de listado: solo las columnas que muestran las páginas
+_EVENTO_RESUMEN = ('id, nombre, fecha, hora, lugar, precio, entradas_disponibles, '
+                   'substr(descripcion, 1, 100) AS descripcion, imagen_url, version, inicio')
+_USUARIO_RESUMEN = 'id, nombre, email, telefono, rol, created_at'
+
+
+def _filtros_ventas(evento_id=None, desde=None, hasta=None, email_prefijo=None, user_id=None):
+    """Condiciones y parámetros comunes de los listados de ventas"""
+    condiciones, params = [], []
+    if evento_id:
+        condiciones.append('v.evento_id = ?')
+        params.append(evento_id)
+    if user_id:
+        condiciones.append('v.user_id = ?')
+        params.append(user_id)
+    if desde:
+        condiciones.append('v.fecha_compra >= ?')
+        params.append(desde)
+    if hasta:
+        condiciones.append("v.fecha_compra < date(?, '+1 day')")
+        params.append(hasta)
+    if email_prefijo:
+        condiciones.append('u.email >= ? AND u.email < ?')
+        params.extend(_rango_prefijo(normalizar_email(email_prefijo)))
+    return condiciones, params
+
+
+def _consulta_fts(texto, max_terminos=8):
+    """Consulta FTS5 segura a partir de lo que escribe el usuario.
+
+    Cada palabra se busca como prefijo y deben aparecer todas; la sintaxis
+    de FTS5 (comillas, operadores) del texto se descarta. None si no hay
+    palabras.
+    """
+    palabras = re.findall(r'\w+', texto or '')[:max_terminos]
+    if not palabras:
+        return None
+    return ' '.join(f'"{p}"*' for p in palabras)
+
+
+def _rango_prefijo(prefijo):
+    """Rango [desde, hasta) que cubre los textos que empiezan con prefijo (usa índices)"""
+    return prefijo, prefijo + '\U0010ffff'
+
 
 class Database:
-    def __init__(self, db_path='teatro.db'):
+    def __init__(self, db_path='teatro.db', max_conexiones=8, timeout=10.0, pragmas=None,
+                 principales_max=10000, principales_ttl=30.0,
+                 catalogo_max=5000, catalogo_ttl=60.0, version_ttl=1.0, hasher=None,
+                 lote_ventas=0, espera_lote=0.0, particiones=None, sincronizar_cada=1.0):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, max_conexiones=max_conexiones,
+                                   timeout=timeout, pragmas=pragmas)
+        self.reservas = MotorReservas(self.pool, particion=0 if particiones else None)
+        # Con lote_ventas > 0 las compras pasan por el escritor con commits agrupados
+        self.escritor_ventas = None
+        if lote_ventas > 0:
+            self.escritor_ventas = EscritorVentas(self.reservas, tamano_lote=lote_ventas,
+                                                  espera_maxima=espera_lote)
+        # Ventas particionadas en otros archivos por evento (ver particiones.py)
+        self.particiones = None
+        self._ventas, self._resumen, self._resumen_evento = 'ventas', 'resumen_ventas', 'resumen_ventas_evento'
+        # Stock y asientos que muestran las páginas (con particiones, los de la partición dueña)
+        self._stock, self._estados = 'e.entradas_disponibles', 'm.estados'
+        if particiones:
+            self.particiones = ParticionesVentas(
+                Particion(0, self.pool, self.reservas, self.escritor_ventas), particiones,
+                max_conexiones=max_conexiones, timeout=timeout, pragmas=pragmas,
+                lote_ventas=lote_ventas, espera_lote=espera_lote, sincronizar_cada=sincronizar_cada)
+            self._ventas, self._resumen, self._resumen_evento = VISTA_VENTAS, VISTA_RESUMEN, VISTA_RESUMEN_EVENTO
+            self._stock = self.particiones.columna('eventos', 'entradas_disponibles', 'id', self._stock)
+            self._estados = self.particiones.columna('mapas_asientos', 'estados', 'evento_id', self._estados)
+        # Principales de sesión cacheados; otros procesos ven un cambio de rol al vencer el TTL
+        self.principales = CacheLRU(max_entradas=principales_max, ttl=principales_ttl)
+        self._versiones_rol = {}  # user_id -> rol_version mínima aceptable en la cache
+        self.catalogo = CatalogoEventos(max_eventos=catalogo_max, ttl=catalogo_ttl,
+                                        version_ttl=version_ttl)
+        # KDF de contraseñas en un pool de procesos (ver passwords.py)
+        self.passwords = hasher or HasherPasswords()
     
     def get_connection(self):
-        """Obtener conexión a la base de datos"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Obtener una conexión del pool (close() la devuelve al pool)"""
+        return self.pool.obtener()
+    
+    def _conexion_ventas(self):
+        """Conexión para leer ventas, totales y stock (con las particiones adjuntas si las hay)"""
+        if self.particiones is None:
+            return self.pool.obtener()
+        return self.particiones.lecturas.obtener()
+    
+    def _en_particion(self, evento_id, operacion):
+        """Ejecutar operacion(particion) donde vive el stock del evento"""
+        if self.particiones is None:
+            return operacion(Particion(0, self.pool, self.reservas, self.escritor_ventas))
+        return self.particiones.ejecutar(evento_id, operacion)
+    
+    def cerrar(self):
+        """Cerrar las conexiones abiertas del pool y el pool de hash"""
+        self.pool.cerrar_todas()
+        if self.particiones is not None:
+            self.particiones.cerrar()
+        self.passwords.cerrar()
     
     def _hash_password(self, password):
-        """Hashear contraseña"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Hashear contraseña (puede levantar HashOcupadoError)"""
+        return self.passwords.hashear(password)
     
-    def inicializar_db(self):
-        """Crear las tablas si no existen"""
+    def migrar(self, informar=None):
+        """Aplicar las migraciones de esquema pendientes"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Tabla de usuarios
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS usuarios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                telefono TEXT,
-                rol TEXT DEFAULT 'cliente',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabla de eventos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS eventos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                fecha TEXT NOT NULL,
-                hora TEXT NOT NULL,
-                lugar TEXT NOT NULL,
-                precio REAL NOT NULL,
-                entradas_disponibles INTEGER NOT NULL,
-                descripcion TEXT,
-                imagen_url TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabla de ventas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ventas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                evento_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                cantidad INTEGER NOT NULL,
-                total REAL NOT NULL,
-                fecha_compra TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (evento_id) REFERENCES eventos (id),
-                FOREIGN KEY (user_id) REFERENCES usuarios (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        try:
+            return migraciones.migrar(conn, informar=informar)
+        finally:
+            conn.close()
+    
+    def inicializar_db(self):
+        """Crear o actualizar el esquema y los datos de ejemplo"""
+        self.migrar()
         
         # Crear datos de ejemplo
         self._crear_datos_ejemplo()
@@ -90,21 +175,24 @@ class Database:
             self.crear_usuario('Cliente Test', 'cliente@teatro.com', 'cliente123', '555-1111', 'cliente')
         
         # Crear eventos de ejemplo si no hay ninguno
-        if len(self.obtener_eventos()) == 0:
+        if self.contar_eventos() == 0:
+            # Funciones en las próximas semanas para que la cartelera no quede vacía
+            def dia(n):
+                return (date.today() + timedelta(days=n)).isoformat()
             eventos_ejemplo = [
-                ('Romeo y Julieta', '2024-12-20', '20:00', 'Teatro Principal', 25.00, 100, 
+                ('Romeo y Julieta', dia(30), '20:00', 'Teatro Principal', 25.00, 100, 
                  'Clásica obra de Shakespeare sobre el amor prohibido entre dos jóvenes de familias rivales.', 
                  'https://picsum.photos/400/300?random=1'),
-                ('La Casa de Bernarda Alba', '2024-12-22', '19:30', 'Teatro Nacional', 30.00, 80, 
+                ('La Casa de Bernarda Alba', dia(32), '19:30', 'Teatro Nacional', 30.00, 80, 
                  'Drama de Federico García Lorca sobre el poder y la represión en una familia española.', 
                  'https://picsum.photos/400/300?random=2'),
-                ('El Avaro', '2024-12-25', '21:00', 'Teatro Municipal', 20.00, 120, 
+                ('El Avaro', dia(35), '21:00', 'Teatro Municipal', 20.00, 120, 
                  'Comedia de Molière que critica la avaricia y la obsesión por el dinero.', 
                  'https://picsum.photos/400/300?random=3'),
-                ('Hamlet', '2024-12-28', '20:30', 'Teatro Real', 35.00, 90, 
+                ('Hamlet', dia(38), '20:30', 'Teatro Real', 35.00, 90, 
                  'La tragedia de venganza más famosa de Shakespeare.', 
                  'https://picsum.photos/400/300?random=4'),
-                ('La vida es sueño', '2024-12-30', '19:00', 'Teatro Calderón', 28.00, 110, 
+                ('La vida es sueño', dia(40), '19:00', 'Teatro Calderón', 28.00, 110, 
                  'Obra maestra de Calderón de la Barca sobre el libre albedrío y el destino.', 
                  'https://picsum.photos/400/300?random=5'),
             ]
@@ -115,11 +203,13 @@ class Database:
     # ==================== USUARIOS ====================
     
     def crear_usuario(self, nombre, email, password, telefono=None, rol='cliente'):
-        """Crear un nuevo usuario"""
+        """Crear un nuevo usuario (HashOcupadoError si el pool de hash está saturado)"""
+        email = normalizar_email(email)
+        # El KDF corre antes de tomar una conexión del pool
+        password_hash = self._hash_password(password)
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
-            password_hash = self._hash_password(password)
             cursor.execute('''
                 INSERT INTO usuarios (nombre, email, password, telefono, rol)
                 VALUES (?, ?, ?, ?, ?)
@@ -135,24 +225,14 @@ class Database:
             return None
     
     def obtener_usuario_por_email(self, email):
-        """Obtener un usuario por email"""
+        """Obtener un usuario por email (sin distinguir mayúsculas)"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM usuarios WHERE email = ?', (email,))
+        cursor.execute('SELECT * FROM usuarios WHERE email = ?', (normalizar_email(email),))
         row = cursor.fetchone()
+        usuario = mapeador(Usuario, cursor)(row) if row else None
         conn.close()
-        
-        if row:
-            return Usuario(
-                id=row['id'],
-                nombre=row['nombre'],
-                email=row['email'],
-                password=row['password'],
-                telefono=row['telefono'],
-                rol=row['rol'],
-                created_at=row['created_at']
-            )
-        return None
+        return usuario
     
     def obtener_usuario_por_id(self, user_id):
         """Obtener un usuario por ID"""
@@ -160,56 +240,120 @@ class Database:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM usuarios WHERE id = ?', (user_id,))
         row = cursor.fetchone()
+        usuario = mapeador(Usuario, cursor)(row) if row else None
         conn.close()
-        
-        if row:
-            return Usuario(
-                id=row['id'],
-                nombre=row['nombre'],
-                email=row['email'],
-                password=row['password'],
-                telefono=row['telefono'],
-                rol=row['rol'],
-                created_at=row['created_at']
-            )
-        return None
+        return usuario
     
     def verificar_credenciales(self, email, password):
-        """Verificar credenciales de login"""
+        """Verificar credenciales de login (HashOcupadoError si el pool de hash está saturado).
+        
+        Si el hash guardado es SHA-256 heredado o usa otros parámetros de
+        costo, se recalcula con los actuales aprovechando la contraseña en claro.
+        """
         usuario = self.obtener_usuario_por_email(email)
-        if usuario and usuario.password == self._hash_password(password):
-            return usuario
-        return None
+        if not usuario or not self.passwords.verificar(password, usuario.password):
+            return None
+        if self.passwords.necesita_rehash(usuario.password):
+            try:
+                nuevo = self._hash_password(password)
+                conn = self.get_connection()
+                conn.execute('UPDATE usuarios SET password = ? WHERE id = ? AND password = ?',
+                             (nuevo, usuario.id, usuario.password))
+                conn.commit()
+                conn.close()
+                usuario.password = nuevo
+            except Exception as e:
+                print(f"Error al actualizar el hash de la contraseña: {e}")
+        return usuario
     
-    def obtener_todos_usuarios(self):
-        """Obtener todos los usuarios"""
+    def obtener_todos_usuarios(self, completo=False):
+        """Obtener todos los usuarios (sin el hash de la contraseña salvo completo=True)"""
+        columnas = '*' if completo else _USUARIO_RESUMEN
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM usuarios ORDER BY created_at DESC')
-        rows = cursor.fetchall()
+        cursor.execute(f'SELECT {columnas} FROM usuarios ORDER BY created_at DESC')
+        a_usuario = mapeador(Usuario, cursor)
+        usuarios = [a_usuario(row) for row in cursor.fetchall()]
         conn.close()
-        
-        usuarios = []
-        for row in rows:
-            usuarios.append(Usuario(
-                id=row['id'],
-                nombre=row['nombre'],
-                email=row['email'],
-                password=row['password'],
-                telefono=row['telefono'],
-                rol=row['rol'],
-                created_at=row['created_at']
-            ))
         return usuarios
     
+    def obtener_usuarios_pagina(self, cursor=None, limite=50, rol=None, email_prefijo=None, completo=False):
+        """Obtener una página de usuarios (created_at DESC) con paginación por cursor.
+        
+        Al filtrar por prefijo de email la página se ordena por email, que es
+        el índice que resuelve el filtro. Devuelve (usuarios, siguiente_cursor);
+        siguiente_cursor es None en la última página.
+        """
+        condiciones, params = [], []
+        if rol:
+            condiciones.append('rol = ?')
+            params.append(rol)
+        if email_prefijo:
+            condiciones.append('email >= ? AND email < ?')
+            params.extend(_rango_prefijo(normalizar_email(email_prefijo)))
+            clave, orden = 'email', 'email, id'
+            comparacion = '(email, id) > (?, ?)'
+        else:
+            clave, orden = 'created_at', 'created_at DESC, id DESC'
+            comparacion = '(created_at, id) < (?, ?)'
+        if cursor:
+            condiciones.append(comparacion)
+            params.extend(_decodificar_cursor(cursor))
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+        
+        conn = self.get_connection()
+        db_cursor = conn.cursor()
+        db_cursor.execute(f'''
+            SELECT {'*' if completo else _USUARIO_RESUMEN} FROM usuarios
+            {where}
+            ORDER BY {orden}
+            LIMIT ?
+        ''', (*params, limite + 1))
+        a_usuario = mapeador(Usuario, db_cursor)
+        rows = db_cursor.fetchall()
+        conn.close()
+        
+        usuarios = [a_usuario(row) for row in rows[:limite]]
+        siguiente = None
+        if len(rows) > limite:
+            siguiente = _codificar_cursor(getattr(usuarios[-1], clave), usuarios[-1].id)
+        return usuarios, siguiente
+    
+    def obtener_principal(self, user_id):
+        """Obtener id, nombre y rol de un usuario para chequear permisos (cacheado)"""
+        principal = self.principales.obtener(user_id)
+        if principal is not None:
+            return principal
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, nombre, rol, rol_version FROM usuarios WHERE id = ?', (user_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        if row:
+            principal = mapeador(Principal, cursor)(row)
+            # Una lectura anterior a un cambio de rol no debe volver a la cache
+            if principal.rol_version >= self._versiones_rol.get(user_id, 0):
+                self.principales.guardar(user_id, principal)
+            return principal
+        return None
+    
     def cambiar_rol_usuario(self, user_id, nuevo_rol):
-        """Cambiar el rol de un usuario"""
+        """Cambiar el rol de un usuario (invalida sus permisos cacheados)"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
-            cursor.execute('UPDATE usuarios SET rol = ? WHERE id = ?', (nuevo_rol, user_id))
+            cursor.execute('''
+                UPDATE usuarios SET rol = ?, rol_version = rol_version + 1 WHERE id = ?
+            ''', (nuevo_rol, user_id))
+            cursor.execute('SELECT rol_version FROM usuarios WHERE id = ?', (user_id,))
+            row = cursor.fetchone()
             conn.commit()
             conn.close()
+            if row:
+                self._versiones_rol[user_id] = row['rol_version']
+            self.principales.invalidar(user_id)
             return True
         except Exception as e:
             print(f"Error al cambiar rol: {e}")
@@ -217,81 +361,327 @@ class Database:
     
     # ==================== EVENTOS ====================
     
-    def obtener_eventos(self):
-        """Obtener todos los eventos"""
-        conn = self.get_connection()
+    def obtener_eventos(self, completo=False):
+        """Obtener todos los eventos (datos estáticos cacheados, stock siempre al día).
+        
+        Por defecto es la proyección de listado: la descripción viene recortada
+        a 100 caracteres. completo=True trae todas las columnas.
+        """
+        clave = 'completo' if completo else 'resumen'
+        generacion = self.catalogo.generacion
+        eventos = self.catalogo.listados.obtener(clave)
+        conn = self._conexion_ventas()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM eventos ORDER BY fecha, hora')
-        rows = cursor.fetchall()
+        
+        if eventos is None:
+            cursor.execute(f'''
+                SELECT {self._stock} AS entradas_disponibles, {"e.*" if completo else _EVENTO_RESUMEN}
+                FROM eventos e ORDER BY fecha, hora
+            ''')
+            a_evento = mapeador(Evento, cursor)
+            eventos = [a_evento(row) for row in cursor.fetchall()]
+            conn.close()
+            self.catalogo.guardar_listado(clave, eventos, generacion)
+            return [replace(e) for e in eventos]
+        
+        # Solo el stock se lee de la base (índice cubriente, sin descripciones)
+        cursor.execute(f'SELECT e.id, {self._stock} FROM eventos e')
+        stock = dict(cursor.fetchall())
+        conn.close()
+        return [replace(e, entradas_disponibles=stock[e.id]) for e in eventos if e.id in stock]
+    
+    def obtener_proximos_eventos(self, desde=None, hasta=None, lugar=None, precio_min=None,
+                                 precio_max=None, con_stock=False, limite=None):
+        """Eventos que empiezan desde `desde` (por defecto ahora), por orden de inicio.
+        
+        desde y hasta son fechas 'AAAA-MM-DD' o instantes 'AAAA-MM-DD HH:MM:SS';
+        hasta incluye el día completo. Las consultas recorren el índice de
+        inicio (o el de lugar), así que su costo depende de los eventos
+        próximos y no de todo el historial. Sin filtros de fecha final, lugar
+        ni precio la cartelera sale de la cache, como obtener_eventos.
+        """
+        desde = desde or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if hasta is None and lugar is None and precio_min is None and precio_max is None:
+            eventos = self._cartelera(desde)
+        else:
+            condiciones, params = ['inicio >= ?'], [desde]
+            if hasta:
+                condiciones.append("inicio < date(?, '+1 day')")
+                params.append(hasta)
+            if lugar:
+                condiciones.append('lugar = ?')
+                params.append(lugar)
+            if precio_min is not None:
+                condiciones.append('precio >= ?')
+                params.append(precio_min)
+            if precio_max is not None:
+                condiciones.append('precio <= ?')
+                params.append(precio_max)
+            if con_stock:
+                condiciones.append(f'{self._stock} > 0')
+            
+            conn = self._conexion_ventas()
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {self._stock} AS entradas_disponibles, {_EVENTO_RESUMEN} FROM eventos e
+                WHERE {' AND '.join(condiciones)}
+                ORDER BY inicio
+                LIMIT ?
+            ''', (*params, -1 if limite is None else limite))
+            a_evento = mapeador(Evento, cursor)
+            eventos = [a_evento(row) for row in cursor.fetchall()]
+            conn.close()
+            return eventos
+        
+        if con_stock:
+            eventos = [e for e in eventos if e.entradas_disponibles > 0]
+        return eventos if limite is None else eventos[:limite]
+    
+    def _cartelera(self, desde):
+        """Próximos eventos desde `desde`: datos estáticos cacheados, stock al día"""
+        generacion = self.catalogo.generacion
+        cacheado = self.catalogo.listados.obtener('proximos')
+        conn = self._conexion_ventas()
+        cursor = conn.cursor()
+        
+        # La cartelera cacheada sirve si empieza antes: después solo se achica
+        if cacheado is None or cacheado[0] > desde:
+            cursor.execute(f'''
+                SELECT {self._stock} AS entradas_disponibles, {_EVENTO_RESUMEN}
+                FROM eventos e WHERE inicio >= ? ORDER BY inicio
+            ''', (desde,))
+            a_evento = mapeador(Evento, cursor)
+            eventos = [a_evento(row) for row in cursor.fetchall()]
+            conn.close()
+            self.catalogo.guardar_listado('proximos', (desde, eventos), generacion)
+            return [replace(e) for e in eventos]
+        
+        # Solo el stock de los eventos que siguen por delante (rango del índice de inicio)
+        cursor.execute(f'SELECT e.id, {self._stock} FROM eventos e WHERE inicio >= ?', (desde,))
+        stock = dict(cursor.fetchall())
         conn.close()
+        return [replace(e, entradas_disponibles=stock[e.id]) for e in cacheado[1] if e.id in stock]
+    
+    def obtener_nombres_eventos(self):
+        """(id, nombre) de todos los eventos por fecha, para selectores de filtro.
         
-        eventos = []
-        for row in rows:
-            eventos.append(Evento(
-                id=row['id'],
-                nombre=row['nombre'],
-                fecha=row['fecha'],
-                hora=row['hora'],
-                lugar=row['lugar'],
-                precio=row['precio'],
-                entradas_disponibles=row['entradas_disponibles'],
-                descripcion=row['descripcion'],
-                imagen_url=row['imagen_url'] if 'imagen_url' in row.keys() else None
-            ))
-        return eventos
+        Sale de la cache de listados del catálogo: sin stock ni otras
+        columnas, así un acierto no consulta la base.
+        """
+        generacion = self.catalogo.generacion
+        nombres = self.catalogo.listados.obtener('nombres')
+        if nombres is not None:
+            return nombres
+        conn = self.get_connection()
+        nombres = [tuple(row) for row in conn.execute('SELECT id, nombre FROM eventos ORDER BY fecha, hora')]
+        conn.close()
+        self.catalogo.guardar_listado('nombres', nombres, generacion)
+        return nombres
     
-    def obtener_evento(self, evento_id):
-        """Obtener un evento por ID"""
+    def contar_eventos(self):
+        """Cantidad total de eventos, pasados y futuros"""
         conn = self.get_connection()
+        total = conn.execute('SELECT COUNT(*) FROM eventos').fetchone()[0]
+        conn.close()
+        return total
+    
+    def obtener_evento(self, evento_id):
+        """Obtener un evento por ID (datos estáticos cacheados, stock y asientos al día)"""
+        generacion = self.catalogo.generacion
+        evento = self.catalogo.eventos.obtener(evento_id)
+        conn = self._conexion_ventas()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM eventos WHERE id = ?', (evento_id,))
+        
+        if evento is not None:
+            cursor.execute(f'''
+                SELECT {self._stock} AS entradas_disponibles, {self._estados} AS mapa_estados
+                FROM eventos e
+                LEFT JOIN mapas_asientos m ON m.evento_id = e.id
+                WHERE e.id = ?
+            ''', (evento_id,))
+            row = cursor.fetchone()
+            conn.close()
+            if row is None:
+                # Eliminado desde otro proceso
+                self.catalogo.invalidar(evento_id)
+                return None
+            mapa = None
+            if evento.mapa is not None and row['mapa_estados'] is not None:
+                mapa = MapaAsientos(evento.mapa.secciones, row['mapa_estados'])
+            return replace(evento, entradas_disponibles=row['entradas_disponibles'], mapa=mapa)
+        
+        cursor.execute(f'''
+            SELECT {self._stock} AS entradas_disponibles, e.*,
+                   m.layout AS mapa_layout, {self._estados} AS mapa_estados
+            FROM eventos e
+            LEFT JOIN mapas_asientos m ON m.evento_id = e.id
+            WHERE e.id = ?
+        ''', (evento_id,))
         row = cursor.fetchone()
         conn.close()
         
         if row:
-            return Evento(
-                id=row['id'],
-                nombre=row['nombre'],
-                fecha=row['fecha'],
-                hora=row['hora'],
-                lugar=row['lugar'],
-                precio=row['precio'],
-                entradas_disponibles=row['entradas_disponibles'],
-                descripcion=row['descripcion'],
-                imagen_url=row['imagen_url'] if 'imagen_url' in row.keys() else None
-            )
+            evento = mapeador(Evento, cursor)(row)
+            if row['mapa_layout'] is not None:
+                evento.mapa = MapaAsientos.desde_db(row['mapa_layout'], row['mapa_estados'])
+            self.catalogo.guardar_evento(evento, generacion)
+            return replace(evento)
         return None
     
-    def crear_evento(self, nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url=None):
-        """Crear un nuevo evento"""
+    def buscar_eventos(self, texto, pagina=1, limite=20):
+        """Buscar eventos por nombre, descripción o lugar, los más relevantes primero.
+        
+        Usa el índice de texto completo eventos_fts. Devuelve (eventos,
+        hay_mas); hay_mas indica si existe una página siguiente.
+        """
+        consulta = _consulta_fts(texto)
+        if consulta is None:
+            return [], False
+        pagina = max(1, pagina)
+        
+        conn = self._conexion_ventas()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {self._stock} AS entradas_disponibles, {_EVENTO_RESUMEN}, coincidencias.rank
+            FROM (
+                SELECT rowid, rank FROM eventos_fts
+                WHERE eventos_fts MATCH ?
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            ) coincidencias
+            JOIN eventos e ON e.id = coincidencias.rowid
+        ''', (consulta, limite + 1, (pagina - 1) * limite))
+        a_evento = mapeador(Evento, cursor)
+        rows = sorted(cursor.fetchall(), key=lambda row: row['rank'])
+        conn.close()
+        
+        return [a_evento(row) for row in rows[:limite]], len(rows) > limite
+    
+    def version_catalogo(self):
+        """Versión global del catálogo y momento del último cambio.
+        
+        version cambia con cualquier alta, edición, baja o venta de entradas
+        (con particiones lleva además los contadores de stock de cada una);
+        contenido (y contenido_en) solo con altas, ediciones y bajas. Se
+        cachea unos instantes para que las ráfagas de requests condicionales
+        no consulten la base.
+        """
+        version = self.catalogo.version.obtener('catalogo')
+        if version is not None:
+            return version
+        
+        stock = ''
+        if self.particiones is not None:
+            stock = f", (SELECT group_concat(version, '.') FROM {VISTA_VERSIONES_STOCK}) AS stock"
+        conn = self._conexion_ventas()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT version, actualizado_en, contenido, contenido_en{stock}
+            FROM catalogo_version WHERE id = 1
+        ''')
+        row = cursor.fetchone()
+        conn.close()
+        
+        version = dict(row) if row else {'version': 0, 'actualizado_en': None,
+                                         'contenido': 0, 'contenido_en': None}
+        if 'stock' in version:
+            version['version'] = f"{version['version']}.{version.pop('stock')}"
+        self.catalogo.version.guardar('catalogo', version)
+        return version
+    
+    def version_evento(self, evento_id):
+        """Versión de la página de un evento y momento de su último cambio.
+        
+        Cubre sus datos, su stock y el estado de sus asientos, y sale de la
+        misma cache de TTL corto que version_catalogo: un request condicional
+        que acierta no carga el evento. None si el evento no existe.
+        """
+        version = self.catalogo.version.obtener(('evento', evento_id))
+        if version is not None:
+            return version
+        
+        conn = self._conexion_ventas()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT e.version, e.actualizado_en, {self._stock} AS entradas_disponibles,
+                   {self._estados} AS estados
+            FROM eventos e
+            LEFT JOIN mapas_asientos m ON m.evento_id = e.id
+            WHERE e.id = ?
+        ''', (evento_id,))
+        row = cursor.fetchone()
+        conn.close()
+        if row is None:
+            return None
+        
+        etiqueta = f"{row['version']}.{row['entradas_disponibles']}"
+        if row['estados'] is not None:
+            etiqueta += f".{zlib.crc32(row['estados']):08x}"
+        version = {'version': etiqueta, 'actualizado_en': row['actualizado_en']}
+        self.catalogo.version.guardar(('evento', evento_id), version)
+        return version
+    
+    def crear_evento(self, nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url=None, secciones=None):
+        """Crear un nuevo evento.
+        
+        Si se pasan secciones (ver MapaAsientos) el evento tiene asientos
+        numerados y su stock es la capacidad del mapa.
+        """
         try:
+            mapa = MapaAsientos(secciones) if secciones else None
+            if mapa is not None:
+                entradas_disponibles = mapa.capacidad
             conn = self.get_connection()
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO eventos (nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url))
-            conn.commit()
             evento_id = cursor.lastrowid
+            if mapa is not None:
+                guardar_mapa(conn, evento_id, mapa)
+            if self.particiones is not None:
+                self.particiones.alojar(conn, evento_id, entradas_disponibles, mapa)
+            conn.commit()
             conn.close()
+            self.catalogo.invalidar(evento_id)
             return evento_id
         except Exception as e:
             print(f"Error al crear evento: {e}")
             return None
     
     def actualizar_evento(self, evento_id, nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url=None):
-        """Actualizar un evento existente"""
+        """Actualizar un evento existente.
+        
+        Si el evento tiene asientos numerados se ignora entradas_disponibles:
+        el stock se recalcula con los asientos libres del mapa en la misma
+        transacción, así sigue siendo igual a la cantidad de libres.
+        """
         try:
             conn = self.get_connection()
+            conn.execute('BEGIN IMMEDIATE')
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE eventos
                 SET nombre = ?, fecha = ?, hora = ?, lugar = ?, precio = ?, 
-                    entradas_disponibles = ?, descripcion = ?, imagen_url = ?
+                    descripcion = ?, imagen_url = ?
                 WHERE id = ?
-            ''', (nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url, evento_id))
+                RETURNING particion
+            ''', (nombre, fecha, hora, lugar, precio, descripcion, imagen_url, evento_id))
+            row = cursor.fetchone()
+            if row is not None and row['particion'] and self.particiones is not None:
+                # El stock (y el mapa) es de la partición: teatro.db queda con
+                # el que ella fijó
+                entradas_disponibles = self.particiones.fijar_stock(evento_id, entradas_disponibles)
+            else:
+                mapa = cargar_mapa(conn, evento_id)
+                if mapa is not None:
+                    entradas_disponibles = mapa.contar(LIBRE)
+            cursor.execute('UPDATE eventos SET entradas_disponibles = ? WHERE id = ?',
+                           (entradas_disponibles, evento_id))
             conn.commit()
             conn.close()
+            self.catalogo.invalidar(evento_id)
             return True
         except Exception as e:
             print(f"Error al actualizar evento: {e}")
@@ -302,9 +692,13 @@ class Database:
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM eventos WHERE id = ?', (evento_id,))
+            cursor.execute('DELETE FROM eventos WHERE id = ? RETURNING particion', (evento_id,))
+            row = cursor.fetchone()
             conn.commit()
             conn.close()
+            if self.particiones is not None and row is not None:
+                self.particiones.desalojar(evento_id, row['particion'])
+            self.catalogo.invalidar(evento_id)
             return True
         except Exception as e:
             print(f"Error al eliminar evento: {e}")
@@ -312,45 +706,82 @@ class Database:
     
     # ==================== VENTAS ====================
     
-    def crear_venta(self, evento_id, user_id, cantidad, total):
-        """Crear una nueva venta"""
+    def crear_venta(self, evento_id, user_id, cantidad, total, asientos=None):
+        """Crear una nueva venta (descuento atómico de stock, sin sobreventa).
+        
+        En eventos con asientos numerados se venden los asientos indicados
+        (offsets del mapa) o, si no se indican, los mejores disponibles.
+        """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Verificar entradas disponibles
-            cursor.execute('SELECT entradas_disponibles FROM eventos WHERE id = ?', (evento_id,))
-            row = cursor.fetchone()
-            if not row or row['entradas_disponibles'] < cantidad:
-                conn.close()
-                return None
-            
-            # Crear la venta
-            cursor.execute('''
-                INSERT INTO ventas (evento_id, user_id, cantidad, total)
-                VALUES (?, ?, ?, ?)
-            ''', (evento_id, user_id, cantidad, total))
-            
-            # Actualizar entradas disponibles
-            cursor.execute('''
-                UPDATE eventos
-                SET entradas_disponibles = entradas_disponibles - ?
-                WHERE id = ?
-            ''', (cantidad, evento_id))
-            
-            conn.commit()
-            venta_id = cursor.lastrowid
-            conn.close()
+            venta_id = self._en_particion(evento_id, lambda particion: (
+                particion.escritor or particion.reservas).reservar(evento_id, user_id, cantidad, total, asientos))
+            if venta_id:
+                self.catalogo.version.limpiar()
             return venta_id
         except Exception as e:
             print(f"Error al crear venta: {e}")
             return None
     
+    def obtener_mapa_asientos(self, evento_id):
+        """Obtener el mapa de asientos de un evento (None si no es numerado)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT layout, estados FROM mapas_asientos WHERE evento_id = ?', (evento_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        if row:
+            return MapaAsientos.desde_db(row['layout'], row['estados'])
+        return None
+    
+    def retener_asientos(self, evento_id, asientos):
+        """Retener varios asientos libres en una sola transacción"""
+        try:
+            retenidos = self._en_particion(
+                evento_id, lambda particion: particion.reservas.retener_asientos(evento_id, asientos))
+            if retenidos:
+                self.catalogo.version.limpiar()
+            return retenidos
+        except Exception as e:
+            print(f"Error al retener asientos: {e}")
+            return None
+    
+    def liberar_asientos(self, evento_id, asientos):
+        """Liberar varios asientos retenidos o vendidos en una sola transacción"""
+        try:
+            liberados = self._en_particion(
+                evento_id, lambda particion: particion.reservas.liberar_asientos(evento_id, asientos))
+            if liberados:
+                self.catalogo.version.limpiar()
+            return liberados
+        except Exception as e:
+            print(f"Error al liberar asientos: {e}")
+            return None
+    
     def obtener_venta(self, venta_id):
         """Obtener una venta por ID"""
-        conn = self.get_connection()
+        conn = self._conexion_ventas()
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT * FROM {self._ventas} WHERE id = ?', (venta_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        if row:
+            return dict(row)
+        return None
+    
+    def obtener_recibo(self, venta_id):
+        """Venta con los datos del evento y del comprador en una sola consulta"""
+        conn = self._conexion_ventas()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM ventas WHERE id = ?', (venta_id,))
+        cursor.execute(f'''
+            SELECT v.*, e.nombre AS evento_nombre, e.fecha AS evento_fecha, e.hora AS evento_hora,
+                   e.lugar AS evento_lugar, u.nombre AS usuario_nombre, u.email AS usuario_email
+            FROM {self._ventas} v
+            LEFT JOIN eventos e ON e.id = v.evento_id
+            LEFT JOIN usuarios u ON u.id = v.user_id
+            WHERE v.id = ?
+        ''', (venta_id,))
         row = cursor.fetchone()
         conn.close()
         
@@ -360,11 +791,11 @@ class Database:
     
     def obtener_todas_ventas(self):
         """Obtener todas las ventas"""
-        conn = self.get_connection()
+        conn = self._conexion_ventas()
         cursor = conn.cursor()
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT v.*, e.nombre as evento_nombre, u.nombre as usuario_nombre, u.email as usuario_email
-            FROM ventas v
+            FROM {self._ventas} v
             JOIN eventos e ON v.evento_id = e.id
             JOIN usuarios u ON v.user_id = u.id
             ORDER BY v.fecha_compra DESC
@@ -373,13 +804,98 @@ class Database:
         conn.close()
         return [dict(row) for row in rows]
     
+    def obtener_ventas_pagina(self, cursor=None, limite=50, evento_id=None, desde=None, hasta=None, email_prefijo=None):
+        """Obtener una página de ventas (fecha_compra DESC) con paginación por cursor.
+        
+        Filtros opcionales: evento, rango de fechas de compra (YYYY-MM-DD,
+        ambos inclusive) y prefijo del email del comprador. Devuelve
+        (ventas, siguiente_cursor); siguiente_cursor es None en la última página.
+        """
+        condiciones, params = _filtros_ventas(evento_id, desde, hasta, email_prefijo)
+        if cursor:
+            condiciones.append('(v.fecha_compra, v.id) < (?, ?)')
+            params.extend(_decodificar_cursor(cursor))
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+        
+        conn = self._conexion_ventas()
+        db_cursor = conn.cursor()
+        db_cursor.execute(f'''
+            SELECT v.*, e.nombre as evento_nombre, u.nombre as usuario_nombre, u.email as usuario_email
+            FROM {self._ventas} v
+            JOIN eventos e ON v.evento_id = e.id
+            JOIN usuarios u ON v.user_id = u.id
+            {where}
+            ORDER BY v.fecha_compra DESC, v.id DESC
+            LIMIT ?
+        ''', (*params, limite + 1))
+        rows = db_cursor.fetchall()
+        conn.close()
+        
+        ventas = [dict(row) for row in rows[:limite]]
+        siguiente = None
+        if len(rows) > limite:
+            siguiente = _codificar_cursor(ventas[-1]['fecha_compra'], ventas[-1]['id'])
+        return ventas, siguiente
+    
+    def iterar_ventas(self, evento_id=None, desde=None, hasta=None, email_prefijo=None, user_id=None, lote=1000):
+        """Recorrer las ventas filtradas en orden cronológico, de a `lote` filas.
+        
+        Generador para exportaciones: cada bloque es una consulta aparte que
+        sigue desde la última (fecha_compra, id) leída, y la conexión vuelve
+        al pool entre bloques. Así la memoria no depende de la cantidad de
+        ventas y una descarga lenta no retiene una conexión del pool mientras
+        el cliente recibe la respuesta. Las ventas que entran durante el
+        recorrido aparecen al final.
+        """
+        condiciones, params = _filtros_ventas(evento_id, desde, hasta, email_prefijo, user_id)
+        ultima = ()
+        while True:
+            bloque = condiciones + ['(v.fecha_compra, v.id) > (?, ?)'] if ultima else condiciones
+            where = f"WHERE {' AND '.join(bloque)}" if bloque else ''
+            conn = self._conexion_ventas()
+            try:
+                rows = conn.execute(f'''
+                    SELECT v.id, v.fecha_compra, v.evento_id, e.nombre as evento_nombre,
+                           v.user_id, u.nombre as usuario_nombre, u.email as usuario_email,
+                           v.cantidad, v.total, v.asientos
+                    FROM {self._ventas} v
+                    JOIN eventos e ON v.evento_id = e.id
+                    JOIN usuarios u ON v.user_id = u.id
+                    {where}
+                    ORDER BY v.fecha_compra, v.id
+                    LIMIT ?
+                ''', (*params, *ultima, lote)).fetchall()
+            finally:
+                conn.close()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < lote:
+                return
+            ultima = (rows[-1]['fecha_compra'], rows[-1]['id'])
+    
+    def obtener_ultimas_ventas(self, limite=10):
+        """Obtener las ventas más recientes"""
+        conn = self._conexion_ventas()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT v.*, e.nombre as evento_nombre, u.nombre as usuario_nombre, u.email as usuario_email
+            FROM {self._ventas} v
+            JOIN eventos e ON v.evento_id = e.id
+            JOIN usuarios u ON v.user_id = u.id
+            ORDER BY v.fecha_compra DESC
+            LIMIT ?
+        ''', (limite,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+    
     def obtener_ventas_por_usuario(self, user_id):
         """Obtener ventas de un usuario"""
-        conn = self.get_connection()
+        conn = self._conexion_ventas()
         cursor = conn.cursor()
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT v.*, e.nombre as evento_nombre, e.fecha, e.hora, e.lugar
-            FROM ventas v
+            FROM {self._ventas} v
             JOIN eventos e ON v.evento_id = e.id
             WHERE v.user_id = ?
             ORDER BY v.fecha_compra DESC
@@ -389,17 +905,147 @@ class Database:
         return [dict(row) for row in rows]
     
     def obtener_ventas_por_email(self, email):
-        """Obtener ventas por email del usuario"""
-        conn = self.get_connection()
+        """Obtener ventas por email del usuario (sin distinguir mayúsculas)"""
+        conn = self._conexion_ventas()
         cursor = conn.cursor()
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT v.*, e.nombre as evento_nombre, e.fecha, e.hora, e.lugar, u.nombre as usuario_nombre
-            FROM ventas v
+            FROM {self._ventas} v
             JOIN eventos e ON v.evento_id = e.id
             JOIN usuarios u ON v.user_id = u.id
-            WHERE u.email = ?
+            WHERE v.user_id = (SELECT id FROM usuarios WHERE email = ?)
             ORDER BY v.fecha_compra DESC
-        ''', (email,))
+        ''', (normalizar_email(email),))
         rows = cursor.fetchall()
         conn.close()
         return [dict(row) for row in rows]
+    
+    # ==================== INGRESOS ====================
+    
+    def obtener_entradas_evento(self, evento_id):
+        """(venta_id, cantidad) de todas las ventas de un evento, para precargar el control de acceso"""
+        conn = self._conexion_ventas()
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT v.id, v.cantidad FROM {self._ventas} v WHERE v.evento_id = ?', (evento_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [(row[0], row[1]) for row in rows]
+    
+    def obtener_ingresos_evento(self, evento_id):
+        """(venta_id, numero) de las entradas de un evento que ya ingresaron"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT venta_id, numero FROM ingresos WHERE evento_id = ?', (evento_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [(row[0], row[1]) for row in rows]
+    
+    def registrar_ingresos(self, ingresos):
+        """Guardar un lote de ingresos (evento_id, venta_id, numero, momento, puerta).
+        
+        Devuelve los ingresos que ya estaban registrados por otra puerta, con
+        el momento y la puerta del registro anterior, o None si no se pudo
+        guardar el lote.
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            repetidos = []
+            for ingreso in ingresos:
+                cursor = conn.execute('''
+                    INSERT INTO ingresos (evento_id, venta_id, numero, momento, puerta)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT DO NOTHING
+                ''', ingreso)
+                if cursor.rowcount == 0:
+                    anterior = conn.execute('''
+                        SELECT momento, puerta FROM ingresos
+                        WHERE evento_id = ? AND venta_id = ? AND numero = ?
+                    ''', ingreso[:3]).fetchone()
+                    repetidos.append((*ingreso[:3], anterior[0], anterior[1]))
+            conn.commit()
+            return repetidos
+        except Exception as e:
+            print(f"Error al registrar ingresos: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    # ==================== RESÚMENES ====================
+    
+    def obtener_resumen_ventas(self):
+        """Totales globales de ventas (num_ventas, total_ventas, total_entradas)"""
+        conn = self._conexion_ventas()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT SUM(num_ventas) AS num_ventas, SUM(total_ventas) AS total_ventas,
+                   SUM(total_entradas) AS total_entradas
+            FROM {self._resumen}
+        ''')
+        row = cursor.fetchone()
+        conn.close()
+        
+        if row and row['num_ventas'] is not None:
+            return dict(row)
+        return {'num_ventas': 0, 'total_ventas': 0, 'total_entradas': 0}
+    
+    def obtener_resumen_evento(self, evento_id):
+        """Totales de ventas de un evento"""
+        conn = self._conexion_ventas()
+        cursor = conn.cursor()
+        # Con particiones el evento puede tener ventas en más de una (si se movió)
+        cursor.execute(f'''
+            SELECT SUM(num_ventas) AS num_ventas, SUM(total_ventas) AS total_ventas,
+                   SUM(total_entradas) AS total_entradas
+            FROM {self._resumen_evento} WHERE evento_id = ?
+        ''', (evento_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        if row and row['num_ventas'] is not None:
+            return dict(row)
+        return {'num_ventas': 0, 'total_ventas': 0, 'total_entradas': 0}
+    
+    def obtener_usuarios_por_rol(self):
+        """Cantidad de usuarios por rol"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT rol, cantidad FROM resumen_usuarios_rol WHERE cantidad > 0 ORDER BY rol')
+        rows = cursor.fetchall()
+        conn.close()
+        return {row['rol']: row['cantidad'] for row in rows}
+    
+    def _bases_resumenes(self):
+        """(partición, pool) de teatro.db y de cada partición de ventas"""
+        if self.particiones is None:
+            return [(0, self.pool)]
+        return [(particion.numero, particion.pool) for particion in self.particiones.particiones]
+    
+    def reconstruir_resumenes(self):
+        """Recalcular los agregados desde las tablas base (también en cada partición)"""
+        for numero, pool in self._bases_resumenes():
+            conn = pool.obtener()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                resumenes.reconstruir(conn.cursor(), usuarios=numero == 0)
+                conn.commit()
+            finally:
+                conn.close()
+    
+    def verificar_resumenes(self):
+        """Comparar los agregados con las tablas base (lista de diferencias).
+        
+        Las diferencias de una partición de ventas llevan su número adelante.
+        """
+        diferencias = []
+        for numero, pool in self._bases_resumenes():
+            conn = pool.obtener()
+            try:
+                # Una sola transacción de lectura por base para comparar contra la misma foto
+                conn.execute('BEGIN')
+                prefijo = f'partición {numero}, ' if numero else ''
+                diferencias += [prefijo + diferencia
+                                for diferencia in resumenes.verificar(conn.cursor(), usuarios=numero == 0)]
+            finally:
+                conn.close()
+        return diferencias
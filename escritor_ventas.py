@@ -0,0 +1,176 @@
+"""Escritor único de ventas con commits agrupados.
+
+En los picos de venta cada compra que confirma su propia transacción paga
+un fsync, y como SQLite admite un solo escritor el throughput queda atado
+a la velocidad del disco. EscritorVentas encola las compras del proceso y
+un hilo escritor las aplica en lotes: muchas ventas por transacción, cada
+una dentro de su propio savepoint, de modo que una compra sin stock se
+revierte sola sin afectar a las demás del lote. Quien compra sigue
+esperando sincrónicamente su venta_id (o None si no había stock).
+"""
+import queue
+import sqlite3
+import threading
+import time
+
+from reservas import _es_bloqueo
+
+
+class _Pedido:
+    __slots__ = ('args', 'listo', 'resultado', 'error', 'tomado', 'cancelado')
+
+    def __init__(self, args):
+        self.args = args
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+        self.tomado = False  # el escritor empezó a aplicarlo
+        self.cancelado = False  # quien compraba dejó de esperar antes
+
+
+class EscritorVentas:
+    """Cola de compras aplicada por un único hilo en transacciones agrupadas.
+
+    tamano_lote es la cantidad máxima de ventas por transacción y
+    espera_maxima los segundos que el escritor espera a que se sumen más
+    compras después de recibir la primera (0 = aplicar lo que ya está en
+    la cola).
+    """
+
+    def __init__(self, reservas, tamano_lote=64, espera_maxima=0.0, max_cola=10000, timeout=30.0):
+        self.reservas = reservas
+        self.tamano_lote = tamano_lote
+        self.espera_maxima = espera_maxima
+        self.timeout = timeout
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._lock = threading.Lock()
+        self._hilo = None
+        # Métricas
+        self.lotes = 0
+        self.ventas = 0
+        self.rechazadas = 0
+        self.errores = 0
+        self.canceladas = 0
+        self.tamanos_lote = {}  # tamaño -> cantidad de lotes
+        self.profundidad_maxima = 0
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name='escritor-ventas', daemon=True)
+                self._hilo.start()
+
+    def reservar(self, evento_id, user_id, cantidad, total, asientos=None):
+        """Encolar una compra y esperar su resultado: venta_id o None sin stock"""
+        if cantidad <= 0 and not asientos:
+            return None
+        self._iniciar()
+        pedido = _Pedido((evento_id, user_id, cantidad, total, asientos))
+        self._cola.put(pedido, timeout=self.timeout)
+        profundidad = self._cola.qsize()
+        if profundidad > self.profundidad_maxima:
+            self.profundidad_maxima = profundidad
+        if not pedido.listo.wait(self.timeout):
+            with self._lock:
+                if not pedido.tomado:
+                    # Sigue en la cola: se cancela para que el escritor no la aplique después
+                    pedido.cancelado = True
+            if pedido.cancelado:
+                raise TimeoutError('La venta no se aplicó a tiempo')
+            # Ya está en una transacción: su resultado llega con el commit
+            pedido.listo.wait()
+        if pedido.error is not None:
+            raise pedido.error
+        return pedido.resultado
+
+    # ---- Hilo escritor ----
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self.espera_maxima
+            while len(lote) < self.tamano_lote:
+                try:
+                    restante = limite - time.monotonic()
+                    lote.append(self._cola.get(timeout=restante) if restante > 0
+                                else self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            self._aplicar(lote)
+
+    def _aplicar(self, lote):
+        with self._lock:
+            cancelados = [pedido for pedido in lote if pedido.cancelado]
+            lote = [pedido for pedido in lote if not pedido.cancelado]
+            for pedido in lote:
+                pedido.tomado = True
+        self.canceladas += len(cancelados)
+        if not lote:
+            return
+
+        for intento in range(self.reservas.reintentos):
+            conn = None
+            try:
+                # Sin conexión libre falla el lote, no el hilo escritor
+                conn = self.reservas.pool.obtener()
+                self.reservas.comenzar(conn)
+                resultados = [self._aplicar_pedido(conn, pedido) for pedido in lote]
+                conn.commit()
+                break
+            except sqlite3.OperationalError as e:
+                if conn is not None and conn.in_transaction:
+                    conn.rollback()
+                if not _es_bloqueo(e) or intento == self.reservas.reintentos - 1:
+                    resultados = [(None, e)] * len(lote)
+                    break
+                self.reservas.contar_reintento()
+            except Exception as e:
+                if conn is not None and conn.in_transaction:
+                    conn.rollback()
+                resultados = [(None, e)] * len(lote)
+                break
+            finally:
+                if conn is not None:
+                    conn.close()
+            time.sleep(self.reservas.espera_reintento * (2 ** intento))
+
+        self.lotes += 1
+        self.tamanos_lote[len(lote)] = self.tamanos_lote.get(len(lote), 0) + 1
+        for pedido, (resultado, error) in zip(lote, resultados):
+            if error is not None:
+                self.errores += 1
+            elif resultado is None:
+                self.rechazadas += 1
+            else:
+                self.ventas += 1
+            pedido.resultado, pedido.error = resultado, error
+            pedido.listo.set()
+
+    def _aplicar_pedido(self, conn, pedido):
+        """(venta_id, None), (None, None) sin stock o (None, error) de la venta"""
+        conn.execute('SAVEPOINT venta')
+        try:
+            venta_id = self.reservas.registrar_venta(conn, *pedido.args)
+        except sqlite3.OperationalError:
+            # Base bloqueada o disco: falla el lote completo y se reintenta
+            raise
+        except Exception as e:
+            conn.execute('ROLLBACK TO venta')
+            conn.execute('RELEASE venta')
+            return None, e
+        if venta_id is None:
+            conn.execute('ROLLBACK TO venta')
+        conn.execute('RELEASE venta')
+        return venta_id, None
+
+    def estadisticas(self):
+        return {
+            'lotes': self.lotes,
+            'ventas': self.ventas,
+            'rechazadas': self.rechazadas,
+            'errores': self.errores,
+            'canceladas': self.canceladas,
+            'profundidad_cola': self._cola.qsize(),
+            'profundidad_maxima': self.profundidad_maxima,
+            'tamanos_lote': dict(sorted(self.tamanos_lote.items())),
+        }
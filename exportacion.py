@@ -0,0 +1,70 @@
+"""Exportación de ventas en CSV o JSON Lines, en streaming.
+
+Los escritores consumen el generador Database.iterar_ventas y producen el
+archivo en bloques de texto, así lo mismo sirve para una respuesta HTTP
+que se va enviando mientras se lee la base y para escribir un archivo
+desde la línea de comandos.
+"""
+import csv
+import io
+import json
+
+COLUMNAS = ['id', 'fecha_compra', 'evento_id', 'evento_nombre', 'user_id',
+            'usuario_nombre', 'usuario_email', 'cantidad', 'total', 'asientos']
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Filas por bloque de texto emitido
+_FILAS_POR_BLOQUE = 500
+
+# Una planilla interpreta como fórmula la celda que empieza con estos caracteres
+_INICIOS_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _celda(valor):
+    """Valor de texto neutralizado para abrir el CSV en una planilla"""
+    if isinstance(valor, str) and valor.startswith(_INICIOS_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def bloques_csv(ventas):
+    """Bloques de texto CSV (con encabezado) a partir de un iterable de ventas.
+
+    Los textos que empiezan como una fórmula (nombres de eventos y usuarios
+    los cargan terceros) se prefijan con ' para que la planilla no los evalúe.
+    """
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=COLUMNAS, extrasaction='ignore')
+    escritor.writeheader()
+    for i, venta in enumerate(ventas, start=1):
+        escritor.writerow({c: _celda(venta.get(c)) for c in COLUMNAS})
+        if i % _FILAS_POR_BLOQUE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def bloques_jsonl(ventas):
+    """Bloques de texto JSON Lines (un objeto por venta)"""
+    lineas = []
+    for venta in ventas:
+        lineas.append(json.dumps({c: venta.get(c) for c in COLUMNAS}, ensure_ascii=False))
+        if len(lineas) == _FILAS_POR_BLOQUE:
+            yield '\n'.join(lineas) + '\n'
+            lineas = []
+    if lineas:
+        yield '\n'.join(lineas) + '\n'
+
+
+def exportar(ventas, formato):
+    """Generador de bloques de texto en el formato pedido ('csv' o 'jsonl')"""
+    if formato == 'csv':
+        return bloques_csv(ventas)
+    if formato == 'jsonl':
+        return bloques_jsonl(ventas)
+    raise ValueError(f'Formato de exportación desconocido: {formato}')
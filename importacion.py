@@ -0,0 +1,291 @@
+"""Importación masiva de eventos y usuarios desde CSV o JSON.
+
+Las filas se leen en streaming y se procesan en lotes: cada lote se valida,
+se inserta con executemany en una sola transacción IMMEDIATE y se confirma,
+así importar una temporada o una lista de clientes cuesta un commit por
+lote y no uno por fila. Las filas inválidas o duplicadas se reportan con su
+número y no cortan la importación. Las contraseñas de cada lote se hashean
+en paralelo en un pool de procesos.
+"""
+import csv
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
+
+from asientos import MapaAsientos, guardar_mapa, parsear_secciones
+from models import normalizar_email
+from passwords import calcular_hash
+
+ROLES = ('cliente', 'admin', 'director', 'actor', 'superuser')
+
+_FECHA = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_HORA = re.compile(r'^\d{2}:\d{2}$')
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+# Por debajo de esta cantidad no vale la pena repartir el hash entre procesos
+_MIN_HASH_PARALELO = 8
+
+
+@dataclass
+class ResultadoImportacion:
+    insertados: int = 0
+    errores: list = field(default_factory=list)  # (número de fila, mensaje)
+
+    @property
+    def procesados(self):
+        return self.insertados + len(self.errores)
+
+
+# ==================== LECTURA ====================
+
+def leer_filas(archivo, formato=None):
+    """Iterar las filas de un CSV, JSON Lines o JSON (lista de objetos) como dicts.
+
+    El formato se deduce de la extensión si no se indica. CSV y JSON Lines
+    se leen en streaming; un JSON con una lista se carga completo. Una línea
+    de JSON Lines que no se puede leer se entrega como ValueError, que se
+    reporta como error de esa fila.
+    """
+    if formato is None:
+        extension = os.path.splitext(archivo)[1].lower()
+        formato = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(extension, 'json')
+    with open(archivo, encoding='utf-8-sig', newline='') as f:
+        if formato == 'csv':
+            for fila in csv.DictReader(f):
+                yield {k.strip(): (v.strip() if isinstance(v, str) else v)
+                       for k, v in fila.items() if k}
+        elif formato == 'jsonl':
+            for numero_linea, linea in enumerate(f, start=1):
+                if not linea.strip():
+                    continue
+                try:
+                    fila = json.loads(linea)
+                except json.JSONDecodeError as e:
+                    fila = ValueError(f'JSON inválido en la línea {numero_linea}: {e.msg}')
+                yield fila
+        elif formato == 'json':
+            datos = json.load(f)
+            if not isinstance(datos, list):
+                raise ValueError('El JSON debe ser una lista de objetos')
+            yield from datos
+        else:
+            raise ValueError(f'Formato desconocido: {formato}')
+
+
+def _lotes(filas, tamano):
+    """Agrupar las filas en lotes de (número de fila, fila), numeradas desde 1"""
+    numeradas = enumerate(filas, start=1)
+    while True:
+        lote = list(islice(numeradas, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+# ==================== VALIDACIÓN ====================
+
+def _texto(fila, campo, obligatorio=True):
+    valor = fila.get(campo)
+    valor = str(valor).strip() if valor is not None else ''
+    if obligatorio and not valor:
+        raise ValueError(f'falta el campo {campo}')
+    return valor or None
+
+
+def validar_usuario(fila):
+    """(nombre, email, password, telefono, rol) de una fila o ValueError"""
+    nombre = _texto(fila, 'nombre')
+    email = normalizar_email(_texto(fila, 'email'))
+    if not _EMAIL.match(email):
+        raise ValueError(f'email inválido: {email}')
+    password = _texto(fila, 'password')
+    rol = _texto(fila, 'rol', obligatorio=False) or 'cliente'
+    if rol not in ROLES:
+        raise ValueError(f'rol inválido: {rol}')
+    return nombre, email, password, _texto(fila, 'telefono', obligatorio=False), rol
+
+
+def validar_evento(fila):
+    """(nombre, fecha, hora, lugar, precio, entradas, descripcion, imagen_url, mapa) o ValueError"""
+    nombre = _texto(fila, 'nombre')
+    fecha = _texto(fila, 'fecha')
+    if not _FECHA.match(fecha):
+        raise ValueError(f'fecha inválida (AAAA-MM-DD): {fecha}')
+    hora = _texto(fila, 'hora')
+    if not _HORA.match(hora):
+        raise ValueError(f'hora inválida (HH:MM): {hora}')
+    lugar = _texto(fila, 'lugar')
+    try:
+        precio = float(fila.get('precio'))
+    except (TypeError, ValueError):
+        raise ValueError(f"precio inválido: {fila.get('precio')}")
+    if precio < 0:
+        raise ValueError(f'precio negativo: {precio}')
+
+    # Asientos numerados: layout en JSON o el formato del formulario ("Platea: A-J x 20; ...")
+    secciones = fila.get('secciones') or None
+    mapa = None
+    if isinstance(secciones, str):
+        secciones = parsear_secciones(secciones.replace(';', '\n'))
+    if secciones:
+        try:
+            mapa = MapaAsientos(secciones)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('secciones inválidas')
+
+    if mapa is not None:
+        entradas = mapa.capacidad
+    else:
+        try:
+            entradas = int(fila.get('entradas_disponibles'))
+        except (TypeError, ValueError):
+            raise ValueError(f"entradas_disponibles inválido: {fila.get('entradas_disponibles')}")
+        if entradas < 0:
+            raise ValueError(f'entradas_disponibles negativo: {entradas}')
+
+    return (nombre, fecha, hora, lugar, precio, entradas,
+            _texto(fila, 'descripcion', obligatorio=False),
+            _texto(fila, 'imagen_url', obligatorio=False), mapa)
+
+
+def _validar_lote(lote, validar, resultado):
+    validas = []
+    for numero, fila in lote:
+        try:
+            if isinstance(fila, ValueError):
+                raise fila
+            if not isinstance(fila, dict):
+                raise ValueError('la fila no es un objeto')
+            validas.append((numero, validar(fila)))
+        except ValueError as e:
+            resultado.errores.append((numero, str(e)))
+    return validas
+
+
+# ==================== INSERCIÓN ====================
+
+def _insertar_lote(conn, sql, numerados, resultado):
+    """Insertar un lote con executemany; si una fila viola una restricción,
+    reintentar fila por fila con savepoints para aislar la culpable."""
+    # executemany no deshace las filas que ya insertó antes de la que falló
+    conn.execute('SAVEPOINT lote')
+    try:
+        conn.executemany(sql, [valores for _, valores in numerados])
+        conn.execute('RELEASE lote')
+        resultado.insertados += len(numerados)
+        return
+    except sqlite3.IntegrityError:
+        conn.execute('ROLLBACK TO lote')
+        conn.execute('RELEASE lote')
+    for numero, valores in numerados:
+        conn.execute('SAVEPOINT fila')
+        try:
+            conn.execute(sql, valores)
+            conn.execute('RELEASE fila')
+            resultado.insertados += 1
+        except sqlite3.IntegrityError as e:
+            conn.execute('ROLLBACK TO fila')
+            conn.execute('RELEASE fila')
+            resultado.errores.append((numero, str(e)))
+
+
+def _en_transaccion(db, funcion):
+    conn = db.get_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        funcion(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def importar_usuarios(db, filas, tamano_lote=1000, procesos=None, informar=None):
+    """Importar usuarios; los emails ya registrados o repetidos se reportan como error"""
+    resultado = ResultadoImportacion()
+    procesos = procesos or os.cpu_count() or 1
+    hashear_password = partial(calcular_hash, **db.passwords.parametros)
+    pool = ProcessPoolExecutor(max_workers=procesos) if procesos > 1 else None
+    try:
+        for lote in _lotes(filas, tamano_lote):
+            validas = _validar_lote(lote, validar_usuario, resultado)
+
+            # Duplicados dentro del lote: se queda la primera aparición
+            vistos = set()
+            unicas = []
+            for numero, usuario in validas:
+                if usuario[1] in vistos:
+                    resultado.errores.append((numero, f'email repetido en el archivo: {usuario[1]}'))
+                else:
+                    vistos.add(usuario[1])
+                    unicas.append((numero, usuario))
+
+            passwords = [usuario[2] for _, usuario in unicas]
+            if pool is not None and len(passwords) >= _MIN_HASH_PARALELO:
+                hashes = list(pool.map(hashear_password, passwords,
+                                       chunksize=max(1, len(passwords) // (procesos * 4))))
+            else:
+                hashes = [hashear_password(p) for p in passwords]
+            numerados = [(numero, (nombre, email, hash_, telefono, rol))
+                         for (numero, (nombre, email, _, telefono, rol)), hash_ in zip(unicas, hashes)]
+
+            _en_transaccion(db, lambda conn: _insertar_lote(conn, '''
+                INSERT INTO usuarios (nombre, email, password, telefono, rol)
+                VALUES (?, ?, ?, ?, ?)
+            ''', numerados, resultado))
+            if informar:
+                informar(resultado)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    resultado.errores.sort()
+    return resultado
+
+
+def importar_eventos(db, filas, tamano_lote=500, informar=None):
+    """Importar eventos; los que traen secciones se crean con su mapa de asientos.
+
+    Con ventas particionadas cada evento importado se aloja en su partición,
+    igual que crear_evento.
+    """
+    resultado = ResultadoImportacion()
+    sql = '''
+        INSERT INTO eventos (nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    def insertar(conn, validas):
+        anterior = conn.execute('SELECT COALESCE(MAX(id), 0) FROM eventos').fetchone()[0]
+        sin_mapa = [(numero, evento[:-1]) for numero, evento in validas if evento[-1] is None]
+        _insertar_lote(conn, sql, sin_mapa, resultado)
+        # Con mapa hace falta el id de cada evento: una sentencia por fila, mismo commit
+        mapas = {}
+        for numero, evento in validas:
+            if evento[-1] is not None:
+                cursor = conn.execute(sql, evento[:-1])
+                guardar_mapa(conn, cursor.lastrowid, evento[-1])
+                mapas[cursor.lastrowid] = evento[-1]
+                resultado.insertados += 1
+        if db.particiones is not None:
+            # Los ids nuevos de este lote: la transacción tiene el lock de escritura
+            nuevos = conn.execute('SELECT id, entradas_disponibles FROM eventos WHERE id > ?', (anterior,))
+            db.particiones.alojar_lote(conn, [(evento_id, entradas, mapas.get(evento_id))
+                                              for evento_id, entradas in nuevos.fetchall()])
+
+    try:
+        for lote in _lotes(filas, tamano_lote):
+            validas = _validar_lote(lote, validar_evento, resultado)
+            _en_transaccion(db, lambda conn: insertar(conn, validas))
+            if informar:
+                informar(resultado)
+    finally:
+        db.catalogo.invalidar()
+    resultado.errores.sort()
+    return resultado
@@ -0,0 +1,136 @@
+"""Límites de tasa por IP y por email compartidos entre procesos.
+
+Cada límite es un token bucket: `capacidad` solicitudes seguidas y después
+`por_segundo` de recarga. Los buckets viven en una tabla de tamaño fijo
+mapeada en memoria (un archivo en /dev/shm), así los comparten todos los
+procesos worker del host y la memoria no crece con la cantidad de IPs o
+emails: cada clave cae en un grupo de `vias` casilleros y, si el grupo
+está lleno, se desaloja el bucket usado hace más tiempo.
+
+Cada casillero ocupa 24 bytes: hash de la clave, tokens y última
+actualización. Las actualizaciones se serializan con un lock de registro
+POSIX sobre el archivo (entre procesos) y un lock de hilos (dentro del
+proceso); ninguna operación consulta la base de datos.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+_CASILLERO = struct.Struct('<Qdd')  # hash de la clave, tokens, última actualización
+
+
+class Limite:
+    """Token bucket: `capacidad` solicitudes seguidas y `por_segundo` de recarga"""
+
+    __slots__ = ('nombre', 'capacidad', 'por_segundo')
+
+    def __init__(self, nombre, capacidad, por_segundo):
+        self.nombre = nombre
+        self.capacidad = capacidad
+        self.por_segundo = por_segundo
+
+    @classmethod
+    def desde_texto(cls, nombre, texto):
+        """Límite desde 'solicitudes/segundos' (p. ej. '10/60'); None si está vacío o es 0"""
+        if not texto or not texto.strip():
+            return None
+        solicitudes, _, segundos = texto.partition('/')
+        solicitudes = int(solicitudes)
+        if solicitudes <= 0:
+            return None
+        return cls(nombre, solicitudes, solicitudes / float(segundos or 1))
+
+
+class LimitadorTasa:
+    """Tabla de token buckets en memoria compartida.
+
+    ruta: archivo de la tabla; los procesos que abren el mismo archivo
+    comparten los límites. None usa memoria anónima (solo este proceso).
+    casilleros: buckets que entran en la tabla (24 bytes cada uno).
+    """
+
+    def __init__(self, ruta=None, casilleros=2 ** 16, vias=8):
+        self.vias = vias
+        self.grupos = max(1, casilleros // vias)
+        tamano = self.grupos * vias * _CASILLERO.size
+        self._fd = None
+        if ruta is None:
+            self._mm = mmap.mmap(-1, tamano)
+        else:
+            self._fd = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._fd).st_size < tamano:
+                    os.ftruncate(self._fd, tamano)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+            self._mm = mmap.mmap(self._fd, tamano)
+        self._grupo = struct.Struct('<' + 'Qdd' * vias)
+        self._lock = threading.Lock()
+        # Métricas de este proceso
+        self.permitidas = {}  # nombre del límite -> solicitudes
+        self.rechazadas = {}
+        self.desalojos = 0
+
+    @staticmethod
+    def ruta_compartida(nombre):
+        """Archivo en /dev/shm (o el directorio temporal) para compartir la tabla"""
+        directorio = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        return os.path.join(directorio, nombre)
+
+    def consumir(self, limite, clave, costo=1):
+        """Descontar `costo` del bucket de la clave: 0 si se permite o los
+        segundos que faltan para que alcance"""
+        h = int.from_bytes(hashlib.blake2b(f'{limite.nombre}\0{clave}'.encode(), digest_size=8).digest(),
+                           'little') or 1
+        offset = (h % self.grupos) * self.vias * _CASILLERO.size
+        with self._lock:
+            if self._fd is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                ahora = time.time()
+                grupo = self._grupo.unpack_from(self._mm, offset)
+                via = None
+                for i in range(self.vias):
+                    if grupo[3 * i] == h:
+                        via = i
+                        tokens = min(limite.capacidad,
+                                     grupo[3 * i + 1] + (ahora - grupo[3 * i + 2]) * limite.por_segundo)
+                        break
+                else:
+                    # Clave nueva: casillero libre o el usado hace más tiempo
+                    via = min(range(self.vias), key=lambda i: (grupo[3 * i] != 0, grupo[3 * i + 2]))
+                    if grupo[3 * via] != 0:
+                        self.desalojos += 1
+                    tokens = limite.capacidad
+
+                espera = 0.0
+                if tokens >= costo:
+                    tokens -= costo
+                else:
+                    espera = (costo - tokens) / limite.por_segundo
+                _CASILLERO.pack_into(self._mm, offset + via * _CASILLERO.size, h, tokens, ahora)
+            finally:
+                if self._fd is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN)
+            contador = self.rechazadas if espera else self.permitidas
+            contador[limite.nombre] = contador.get(limite.nombre, 0) + 1
+        return espera
+
+    def estadisticas(self):
+        return {
+            'permitidas': dict(self.permitidas),
+            'rechazadas': dict(self.rechazadas),
+            'desalojos': self.desalojos,
+        }
+
+    def cerrar(self):
+        self._mm.close()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,242 @@
+"""Comandos de mantenimiento de la base de datos.
+
+Uso: python manage.py <comando> [opciones]
+"""
+import argparse
+import os
+import sys
+
+import accesos
+import exportacion
+import importacion
+import migraciones
+from database import Database
+
+
+def cmd_migrar(db, args):
+    """Aplicar las migraciones de esquema pendientes"""
+    conn = db.get_connection()
+    try:
+        actual = migraciones.version_actual(conn)
+        pendientes = migraciones.pendientes(conn)
+    finally:
+        conn.close()
+    print(f'Versión de esquema actual: {actual}')
+    if args.estado:
+        for version, descripcion, _ in pendientes:
+            print(f'   pendiente {version}: {descripcion}')
+        return 0
+    if not pendientes:
+        print('✅ El esquema está al día')
+        return 0
+    db.migrar(informar=lambda version, descripcion, segundos:
+              print(f'   ✅ {version}: {descripcion} ({segundos:.2f}s)'))
+    print(f'✅ Esquema actualizado a la versión {migraciones.MIGRACIONES[-1][0]}')
+    return 0
+
+
+def cmd_resumenes(db, args):
+    """Verificar o reconstruir los agregados de ventas y usuarios"""
+    if args.reconstruir:
+        db.reconstruir_resumenes()
+        print('✅ Resúmenes reconstruidos')
+    diferencias = db.verificar_resumenes()
+    for diferencia in diferencias:
+        print(f'❌ {diferencia}')
+    if diferencias:
+        print('Ejecuta "python manage.py resumenes --reconstruir" para corregirlos')
+        return 1
+    print('✅ Resúmenes consistentes')
+    return 0
+
+
+def cmd_importar(db, args):
+    """Importar eventos o usuarios desde un archivo CSV, JSON o JSON Lines"""
+    filas = importacion.leer_filas(args.archivo, args.formato)
+    informar = lambda resultado: print(f'   {resultado.procesados} filas procesadas, '
+                                       f'{resultado.insertados} insertadas', flush=True)
+    if args.tipo == 'usuarios':
+        resultado = importacion.importar_usuarios(db, filas, tamano_lote=args.lote,
+                                                  procesos=args.procesos, informar=informar)
+    else:
+        resultado = importacion.importar_eventos(db, filas, tamano_lote=args.lote, informar=informar)
+    for numero, mensaje in resultado.errores:
+        print(f'❌ fila {numero}: {mensaje}')
+    print(f'✅ {resultado.insertados} {args.tipo} importados, {len(resultado.errores)} con errores')
+    return 1 if resultado.errores else 0
+
+
+def cmd_exportar_ventas(db, args):
+    """Exportar ventas filtradas a CSV o JSON Lines (a un archivo o a stdout)"""
+    ventas = db.iterar_ventas(evento_id=args.evento, desde=args.desde, hasta=args.hasta,
+                              email_prefijo=args.email, user_id=args.usuario)
+    salida = open(args.salida, 'w', encoding='utf-8', newline='') if args.salida else sys.stdout
+    try:
+        for bloque in exportacion.exportar(ventas, args.formato):
+            salida.write(bloque)
+    finally:
+        if args.salida:
+            salida.close()
+    return 0
+
+
+def cmd_particiones(db, args):
+    """Ver, mover o rebalancear los eventos entre las particiones de ventas"""
+    if db.particiones is None:
+        print('❌ No hay particiones configuradas (--particiones o VENTAS_PARTICIONES)')
+        return 1
+    if args.mover:
+        evento_id, destino = args.mover
+        origen = db.particiones.mover_evento(evento_id, destino)
+        print(f'✅ Evento {evento_id}: partición {origen} → {destino}')
+        return 0
+
+    conn = db.get_connection()
+    try:
+        filas = conn.execute('''
+            SELECT id, particion FROM eventos WHERE inicio >= datetime('now', 'localtime')
+        ''').fetchall()
+    finally:
+        conn.close()
+    # Carga de cada evento próximo: sus ventas hasta ahora (las de teatro.db y las de su partición)
+    cargas = {row['id']: (db.obtener_resumen_evento(row['id'])['num_ventas'] + 1, row['particion'])
+              for row in filas}
+    for numero in range(len(db.particiones.particiones)):
+        propios = [carga for carga, actual in cargas.values() if actual == numero]
+        print(f'   partición {numero}: {len(propios)} eventos próximos, carga {sum(propios)}')
+
+    if args.rebalancear:
+        movimientos = db.particiones.plan_rebalanceo(cargas)
+        for evento_id, destino in sorted(movimientos.items()):
+            print(f'   evento {evento_id}: {cargas[evento_id][1]} → {destino}')
+            if args.aplicar:
+                db.particiones.mover_evento(evento_id, destino)
+        if movimientos and not args.aplicar:
+            print('Ejecuta con --aplicar para mover los eventos')
+        else:
+            print(f'✅ {len(movimientos)} eventos movidos')
+    return 0
+
+
+def _secreto_entradas():
+    # El mismo que usa app.py para firmar los códigos de entrada
+    return os.environ.get('ENTRADAS_SECRETO') or os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+
+
+def cmd_checkin(db, args):
+    """Preparar una puerta sin conexión o conciliar sus ingresos con la base"""
+    if args.snapshot:
+        evento_id, ruta = int(args.snapshot[0]), args.snapshot[1]
+        control = accesos.ControlAcceso.desde_db(db, evento_id, _secreto_entradas())
+        control.guardar_snapshot(ruta)
+        estadisticas = control.estadisticas()
+        print(f'✅ Evento {evento_id}: {estadisticas["entradas"]} entradas, '
+              f'{estadisticas["ingresados"]} ya ingresadas → {ruta}')
+        return 0
+    if args.conciliar:
+        guardados, conflictos = accesos.conciliar(db, args.conciliar)
+        print(f'✅ {guardados} ingresos guardados')
+        for evento_id, venta_id, numero, momento, puerta in conflictos:
+            print(f'   ⚠️  compra #{venta_id} entrada {numero}: ya había ingresado por {puerta or "otra puerta"} ({momento})')
+        return 1 if conflictos else 0
+    print('❌ Indica --snapshot EVENTO ARCHIVO o --conciliar ARCHIVO')
+    return 1
+
+
+def cmd_puerta(db, args):
+    """Validar códigos leídos por stdin contra un snapshot, sin conexión a la base"""
+    control = accesos.ControlAcceso.desde_snapshot(args.archivo, puerta=args.nombre,
+                                                   diario=args.archivo + '.diario')
+    try:
+        for linea in sys.stdin:
+            if not linea.strip():
+                continue
+            lectura = control.validar(linea)
+            if lectura.resultado == accesos.VALIDO:
+                print(f'✅ compra #{lectura.venta_id} entrada {lectura.numero}', flush=True)
+            elif lectura.resultado == accesos.REPETIDO:
+                print(f'⚠️  YA INGRESÓ compra #{lectura.venta_id} entrada {lectura.numero} '
+                      f'({lectura.momento or "otra puerta"})', flush=True)
+            else:
+                print('❌ código inválido', flush=True)
+    finally:
+        control.cerrar()
+    estadisticas = control.estadisticas()
+    print(f'{estadisticas["ingresados"]} de {estadisticas["entradas"]} entradas ingresadas', file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mantenimiento de la base de datos del teatro')
+    parser.add_argument('--db', default=os.environ.get('DATABASE_PATH', 'teatro.db'),
+                        help='Ruta de la base SQLite (por defecto DATABASE_PATH o teatro.db)')
+    parser.add_argument('--particiones', default=os.environ.get('VENTAS_PARTICIONES', ''),
+                        help='Archivos de ventas particionadas separados por comas (por defecto VENTAS_PARTICIONES)')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    migrar = comandos.add_parser('migrar', help=cmd_migrar.__doc__)
+    migrar.add_argument('--estado', action='store_true',
+                        help='Solo mostrar la versión actual y las migraciones pendientes')
+    migrar.set_defaults(funcion=cmd_migrar)
+
+    resumenes = comandos.add_parser('resumenes', help=cmd_resumenes.__doc__)
+    resumenes.add_argument('--reconstruir', action='store_true',
+                           help='Recalcular los agregados antes de verificarlos')
+    resumenes.set_defaults(funcion=cmd_resumenes)
+
+    importar = comandos.add_parser('importar', help=cmd_importar.__doc__)
+    importar.add_argument('tipo', choices=['eventos', 'usuarios'])
+    importar.add_argument('archivo')
+    importar.add_argument('--formato', choices=['csv', 'json', 'jsonl'],
+                          help='Formato del archivo (por defecto según la extensión)')
+    importar.add_argument('--lote', type=int, default=1000,
+                          help='Filas por transacción (por defecto 1000)')
+    importar.add_argument('--procesos', type=int,
+                          help='Procesos para hashear contraseñas (por defecto uno por CPU)')
+    importar.set_defaults(funcion=cmd_importar)
+
+    exportar = comandos.add_parser('exportar-ventas', help=cmd_exportar_ventas.__doc__)
+    exportar.add_argument('--formato', choices=sorted(exportacion.FORMATOS), default='csv')
+    exportar.add_argument('--salida', help='Archivo de salida (por defecto stdout)')
+    exportar.add_argument('--evento', type=int, help='Solo ventas de este evento')
+    exportar.add_argument('--usuario', type=int, help='Solo ventas de este usuario (id)')
+    exportar.add_argument('--email', help='Solo compradores cuyo email comienza con este prefijo')
+    exportar.add_argument('--desde', help='Fecha de compra desde (AAAA-MM-DD)')
+    exportar.add_argument('--hasta', help='Fecha de compra hasta (AAAA-MM-DD, inclusive)')
+    exportar.set_defaults(funcion=cmd_exportar_ventas)
+
+    particiones = comandos.add_parser('particiones', help=cmd_particiones.__doc__)
+    particiones.add_argument('--mover', nargs=2, type=int, metavar=('EVENTO', 'PARTICION'),
+                             help='Mover el stock de un evento a otra partición (0 = la base principal)')
+    particiones.add_argument('--rebalancear', action='store_true',
+                             help='Repartir los eventos próximos entre las particiones según sus ventas')
+    particiones.add_argument('--aplicar', action='store_true',
+                             help='Con --rebalancear, mover los eventos en lugar de solo mostrar el plan')
+    particiones.set_defaults(funcion=cmd_particiones)
+
+    checkin = comandos.add_parser('checkin', help=cmd_checkin.__doc__)
+    checkin.add_argument('--snapshot', nargs=2, metavar=('EVENTO', 'ARCHIVO'),
+                         help='Guardar los códigos válidos del evento para una puerta sin conexión')
+    checkin.add_argument('--conciliar', metavar='ARCHIVO',
+                         help='Guardar en la base los ingresos anotados por la puerta de ese snapshot')
+    checkin.set_defaults(funcion=cmd_checkin)
+
+    puerta = comandos.add_parser('puerta', help=cmd_puerta.__doc__)
+    puerta.add_argument('archivo', help='Snapshot generado con checkin --snapshot')
+    puerta.add_argument('--nombre', help='Nombre de la puerta en los ingresos')
+    puerta.set_defaults(funcion=cmd_puerta, sin_base=True)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'sin_base', False):
+        return args.funcion(None, args)
+    db = Database(args.db, particiones=[ruta for ruta in args.particiones.split(',') if ruta.strip()])
+    if args.funcion is not cmd_migrar:
+        db.migrar()
+    try:
+        return args.funcion(db, args)
+    finally:
+        db.cerrar()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""Instrumentación por request y por consulta en formato de texto de Prometheus.
+
+Cada request registra su latencia por ruta, cuántas sentencias SQL emitió y
+cuánto tiempo tuvo conexiones del pool prestadas (el tiempo "dentro de la
+base", incluido el armado de filas). Las sentencias se cuentan en los
+cursores de las conexiones de los pools instrumentados (ConnectionPool.
+al_ejecutar): cada execute() o executemany() cuenta una vez, sin las
+sentencias de los triggers. El progress handler cuenta las instrucciones de
+la VM de SQLite como medida del costo de las consultas; como corre muy
+seguido, los contadores calientes son por hilo y se suman al exponerlos.
+
+Una sentencia dura hasta la siguiente sentencia del mismo hilo o hasta que
+la conexión vuelve al pool; si supera `consulta_lenta` se registra en el
+log con sus parámetros.
+
+El resto de los componentes (caches, escritor de ventas, límites de tasa,
+particiones) se publican con registrar(): una función que devuelve su
+diccionario de estadisticas(). Las métricas son de este proceso: con
+varios workers Prometheus debe consultar cada uno.
+"""
+import bisect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LIMITES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LIMITES_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{clave}="{_escapar(valor)}"' for clave, valor in pares) + '}'
+
+
+class Histograma:
+    """Histograma acumulativo con límites fijos"""
+
+    __slots__ = ('limites', 'cuentas', 'suma', 'total')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.cuentas[bisect.bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def lineas(self, nombre, pares):
+        acumulado = 0
+        for limite, cuenta in zip(self.limites, self.cuentas):
+            acumulado += cuenta
+            yield f'{nombre}_bucket{_etiquetas(pares + [("le", limite)])} {acumulado}'
+        yield f'{nombre}_bucket{_etiquetas(pares + [("le", "+Inf")])} {self.total}'
+        yield f'{nombre}_sum{_etiquetas(pares)} {round(self.suma, 6)}'
+        yield f'{nombre}_count{_etiquetas(pares)} {self.total}'
+
+
+class _Request:
+    __slots__ = ('inicio', 'consultas', 'segundos_db')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.segundos_db = 0.0
+
+
+class _ContadoresHilo:
+    """Contadores que solo escribe su hilo (sin lock)"""
+
+    __slots__ = ('hilo', 'consultas', 'pasos_vm')
+
+    def __init__(self):
+        self.hilo = threading.current_thread()
+        self.consultas = 0
+        self.pasos_vm = 0
+
+
+class Metricas:
+    """Contadores e histogramas del proceso.
+
+    consulta_lenta: segundos a partir de los que una sentencia se registra
+    en el log (0 = no registrar).
+    pasos_progreso: instrucciones de la VM entre llamadas al progress handler.
+    """
+
+    def __init__(self, prefijo='teatro', consulta_lenta=0.1, pasos_progreso=1000):
+        self.prefijo = prefijo
+        self.consulta_lenta = consulta_lenta
+        self.pasos_progreso = pasos_progreso
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._fuentes = []  # (nombre, función que devuelve estadísticas)
+        self._hilos = []  # _ContadoresHilo de los hilos vivos
+        self.requests = {}  # (ruta, método, estado) -> cantidad
+        self.duraciones = {}  # (ruta, método) -> Histograma
+        self.consultas_request = {}  # ruta -> Histograma
+        self.segundos_db_request = {}  # ruta -> Histograma
+        # consultas y pasos_vm: lo acumulado por hilos que ya terminaron
+        self.consultas = 0
+        self.consultas_lentas = 0
+        self.segundos_db = 0.0
+        self.pasos_vm = 0
+
+    def registrar(self, nombre, estadisticas):
+        """Publicar el diccionario que devuelve estadisticas() como teatro_<nombre>_*"""
+        self._fuentes.append((nombre, estadisticas))
+
+    # ---- Conexiones ----
+
+    def instrumentar(self, pool):
+        """Instalar los hooks en las conexiones del pool"""
+        pool.al_conectar(self._conectar)
+        pool.al_ejecutar(self._sentencia)
+        pool.al_prestar(self._prestar)
+        pool.al_devolver(self._devolver)
+        # Las conexiones ociosas abiertas antes no tienen los hooks: se reabren
+        pool.cerrar_todas()
+
+    def _conectar(self, conn):
+        if self.pasos_progreso:
+            conn.set_progress_handler(self._progreso, self.pasos_progreso)
+
+    def _contadores(self):
+        contadores = getattr(self._local, 'contadores', None)
+        if contadores is None:
+            contadores = self._local.contadores = _ContadoresHilo()
+            with self._lock:
+                self._plegar_terminados()
+                self._hilos.append(contadores)
+        return contadores
+
+    def _plegar_terminados(self):
+        """Pasar a los totales los contadores de los hilos terminados (con el lock tomado)"""
+        vivos = []
+        for contadores in self._hilos:
+            if contadores.hilo.is_alive():
+                vivos.append(contadores)
+            else:
+                self.consultas += contadores.consultas
+                self.pasos_vm += contadores.pasos_vm
+        self._hilos = vivos
+
+    def _sentencia(self, conn, sql, parametros):
+        ahora = time.perf_counter()
+        self._terminar_sentencia(ahora)
+        self._local.sentencia = (sql, parametros, ahora)
+        self._contadores().consultas += 1
+        actual = getattr(self._local, 'request', None)
+        if actual is not None:
+            actual.consultas += 1
+
+    def _terminar_sentencia(self, ahora):
+        sentencia = getattr(self._local, 'sentencia', None)
+        if sentencia is None:
+            return
+        self._local.sentencia = None
+        sql, parametros, inicio = sentencia
+        if self.consulta_lenta and ahora - inicio >= self.consulta_lenta:
+            with self._lock:
+                self.consultas_lentas += 1
+            logger.warning('Consulta lenta (%.1f ms): %s; parámetros: %r',
+                           (ahora - inicio) * 1000, ' '.join(sql.split()), parametros)
+
+    def _progreso(self):
+        self._contadores().pasos_vm += self.pasos_progreso
+        return 0
+
+    def _prestar(self, conn):
+        prestadas = getattr(self._local, 'prestadas', 0)
+        if prestadas == 0:
+            self._local.desde = time.perf_counter()
+        self._local.prestadas = prestadas + 1
+
+    def _devolver(self, conn):
+        ahora = time.perf_counter()
+        self._terminar_sentencia(ahora)
+        prestadas = getattr(self._local, 'prestadas', 0) - 1
+        self._local.prestadas = max(prestadas, 0)
+        if prestadas == 0:
+            # Tiempo con al menos una conexión prestada (sin contar dos veces las anidadas)
+            duracion = ahora - self._local.desde
+            with self._lock:
+                self.segundos_db += duracion
+            actual = getattr(self._local, 'request', None)
+            if actual is not None:
+                actual.segundos_db += duracion
+
+    # ---- Requests ----
+
+    def iniciar_request(self):
+        self._local.request = _Request()
+
+    def consultas_en_request(self):
+        """Sentencias que lleva el request en curso de este hilo (None fuera de un request)"""
+        actual = getattr(self._local, 'request', None)
+        return None if actual is None else actual.consultas
+
+    def terminar_request(self, ruta, metodo, estado):
+        actual = getattr(self._local, 'request', None)
+        if actual is None:
+            return
+        self._local.request = None
+        duracion = time.perf_counter() - actual.inicio
+        with self._lock:
+            clave = (ruta, metodo, estado)
+            self.requests[clave] = self.requests.get(clave, 0) + 1
+            for tabla, clave, limites, valor in (
+                (self.duraciones, (ruta, metodo), LIMITES_SEGUNDOS, duracion),
+                (self.consultas_request, ruta, LIMITES_CONSULTAS, actual.consultas),
+                (self.segundos_db_request, ruta, LIMITES_SEGUNDOS, actual.segundos_db),
+            ):
+                histograma = tabla.get(clave)
+                if histograma is None:
+                    histograma = tabla[clave] = Histograma(limites)
+                histograma.observar(valor)
+
+    # ---- Exposición ----
+
+    def texto(self):
+        """Todas las métricas en el formato de texto de Prometheus"""
+        p = self.prefijo
+        lineas = [f'# HELP {p}_requests_total Requests atendidos por ruta, método y estado',
+                  f'# TYPE {p}_requests_total counter']
+        with self._lock:
+            for (ruta, metodo, estado), cantidad in sorted(self.requests.items()):
+                lineas.append(f'{p}_requests_total'
+                              f'{_etiquetas([("ruta", ruta), ("metodo", metodo), ("estado", estado)])} {cantidad}')
+            for nombre, ayuda, tabla, etiquetas in (
+                ('request_duracion_segundos', 'Latencia de los requests', self.duraciones, ('ruta', 'metodo')),
+                ('request_consultas', 'Sentencias SQL por request', self.consultas_request, ('ruta',)),
+                ('request_db_segundos', 'Tiempo con conexiones prestadas por request',
+                 self.segundos_db_request, ('ruta',)),
+            ):
+                lineas += [f'# HELP {p}_{nombre} {ayuda}', f'# TYPE {p}_{nombre} histogram']
+                for clave, histograma in sorted(tabla.items()):
+                    valores = clave if isinstance(clave, tuple) else (clave,)
+                    lineas.extend(histograma.lineas(f'{p}_{nombre}', list(zip(etiquetas, valores))))
+
+        with self._lock:
+            self._plegar_terminados()
+            consultas = self.consultas + sum(c.consultas for c in self._hilos)
+            pasos_vm = self.pasos_vm + sum(c.pasos_vm for c in self._hilos)
+            totales = (
+                ('db_consultas_total', 'Sentencias SQL ejecutadas', consultas),
+                ('db_consultas_lentas_total', 'Sentencias más lentas que el umbral', self.consultas_lentas),
+                ('db_segundos_total', 'Tiempo con conexiones prestadas', round(self.segundos_db, 6)),
+                ('db_pasos_vm_total', 'Instrucciones de la VM de SQLite (aproximado)', pasos_vm),
+            )
+        for nombre, ayuda, valor in totales:
+            lineas += [f'# HELP {p}_{nombre} {ayuda}', f'# TYPE {p}_{nombre} counter', f'{p}_{nombre} {valor}']
+
+        for fuente, estadisticas in self._fuentes:
+            try:
+                valores = estadisticas()
+            except Exception as e:
+                logger.warning('No se pudieron leer las estadísticas de %s: %s', fuente, e)
+                continue
+            for clave, valor in sorted(valores.items()):
+                nombre = f'{p}_{fuente}_{clave}'
+                if isinstance(valor, dict):
+                    lineas.append(f'# TYPE {nombre} untyped')
+                    for etiqueta, cantidad in sorted(valor.items(), key=lambda item: str(item[0])):
+                        lineas.append(f'{nombre}{_etiquetas([("clave", etiqueta)])} {cantidad}')
+                elif isinstance(valor, (int, float)):
+                    lineas += [f'# TYPE {nombre} untyped', f'{nombre} {valor}']
+        return '\n'.join(lineas) + '\n'
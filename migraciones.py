@@ -0,0 +1,372 @@
+"""Migraciones versionadas del esquema de teatro.db.
+
+Cada migración tiene un número de versión y una función que recibe un
+cursor. Se aplican en orden, cada una en su propia transacción IMMEDIATE
+junto con el registro en schema_version, de modo que una migración queda
+aplicada por completo o no se aplica. Todas son idempotentes (IF NOT
+EXISTS, columnas verificadas) para poder correr sobre bases creadas antes
+de que existiera el versionado.
+
+Los índices van en migraciones separadas: cada CREATE INDEX bloquea las
+escrituras solo mientras se construye ese índice y se confirma enseguida,
+así la actualización de una base en producción no corta la venta por
+más de unos instantes.
+"""
+import sqlite3
+import time
+
+import resumenes
+
+
+def agregar_columna(cursor, tabla, columna, definicion):
+    """Agregar una columna a una tabla existente si todavía no la tiene"""
+    # table_xinfo también lista las columnas generadas
+    cursor.execute(f'PRAGMA table_xinfo({tabla})')
+    if columna not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}')
+
+
+def _tablas_base(cursor):
+    # Tabla de usuarios
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            telefono TEXT,
+            rol TEXT DEFAULT 'cliente',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tabla de eventos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS eventos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            fecha TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            lugar TEXT NOT NULL,
+            precio REAL NOT NULL,
+            entradas_disponibles INTEGER NOT NULL,
+            descripcion TEXT,
+            imagen_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tabla de ventas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ventas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            evento_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            total REAL NOT NULL,
+            fecha_compra TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (evento_id) REFERENCES eventos (id),
+            FOREIGN KEY (user_id) REFERENCES usuarios (id)
+        )
+    ''')
+
+
+def _asientos_numerados(cursor):
+    agregar_columna(cursor, 'ventas', 'asientos', 'TEXT')
+
+    # Mapas de asientos numerados (un BLOB con un byte de estado por asiento)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mapas_asientos (
+            evento_id INTEGER PRIMARY KEY,
+            layout TEXT NOT NULL,
+            estados BLOB NOT NULL,
+            FOREIGN KEY (evento_id) REFERENCES eventos (id)
+        )
+    ''')
+
+
+def _version_rol(cursor):
+    # Se incrementa en cada cambio de rol para invalidar permisos cacheados
+    agregar_columna(cursor, 'usuarios', 'rol_version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def _versiones_eventos(cursor):
+    # Versión por evento y versión global del catálogo, para ETags y caches de
+    # fragmentos. Cualquier cambio en eventos (incluido el stock) las incrementa.
+    agregar_columna(cursor, 'eventos', 'version', 'INTEGER NOT NULL DEFAULT 1')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalogo_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 1,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO catalogo_version (id) VALUES (1)')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_eventos_version AFTER UPDATE ON eventos
+        WHEN NEW.version = OLD.version
+        BEGIN
+            UPDATE eventos SET version = OLD.version + 1 WHERE id = NEW.id;
+            UPDATE catalogo_version
+            SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+        END
+    ''')
+    for operacion in ('INSERT', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_catalogo_{operacion.lower()} AFTER {operacion} ON eventos
+            BEGIN
+                UPDATE catalogo_version
+                SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+            END
+        ''')
+
+
+def _version_contenido_eventos(cursor):
+    # La versión de cada evento cambia solo con su contenido (la usan las caches
+    # de HTML renderizado); el stock sigue cambiando la versión del catálogo.
+    cursor.execute('DROP TRIGGER IF EXISTS trg_eventos_version')
+    cursor.execute('''
+        CREATE TRIGGER trg_eventos_version
+        AFTER UPDATE OF nombre, fecha, hora, lugar, precio, descripcion, imagen_url ON eventos
+        BEGIN
+            UPDATE eventos SET version = OLD.version + 1 WHERE id = NEW.id;
+            UPDATE catalogo_version
+            SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_catalogo_stock AFTER UPDATE OF entradas_disponibles ON eventos
+        BEGIN
+            UPDATE catalogo_version
+            SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+        END
+    ''')
+
+
+def _busqueda_eventos(cursor):
+    # Índice de texto completo sobre nombre, descripción y lugar. Es de
+    # contenido externo (no duplica los textos) y los triggers lo mantienen
+    # al día; los cambios de stock no lo tocan.
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS eventos_fts USING fts5(
+            nombre, descripcion, lugar,
+            content='eventos', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_eventos_fts_insert AFTER INSERT ON eventos
+        BEGIN
+            INSERT INTO eventos_fts (rowid, nombre, descripcion, lugar)
+            VALUES (NEW.id, NEW.nombre, NEW.descripcion, NEW.lugar);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_eventos_fts_delete AFTER DELETE ON eventos
+        BEGIN
+            INSERT INTO eventos_fts (eventos_fts, rowid, nombre, descripcion, lugar)
+            VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion, OLD.lugar);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_eventos_fts_update
+        AFTER UPDATE OF nombre, descripcion, lugar ON eventos
+        BEGIN
+            INSERT INTO eventos_fts (eventos_fts, rowid, nombre, descripcion, lugar)
+            VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion, OLD.lugar);
+            INSERT INTO eventos_fts (rowid, nombre, descripcion, lugar)
+            VALUES (NEW.id, NEW.nombre, NEW.descripcion, NEW.lugar);
+        END
+    ''')
+    cursor.execute("INSERT INTO eventos_fts (eventos_fts) VALUES ('rebuild')")
+    # Ranking: pesa más una coincidencia en el nombre que en el lugar o la descripción
+    cursor.execute("INSERT INTO eventos_fts (eventos_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 4.0)')")
+
+
+def _inicio_eventos(cursor):
+    # fecha y hora son texto libre: inicio es el mismo instante normalizado y
+    # ordenable ('AAAA-MM-DD HH:MM:SS', NULL si no es una fecha válida). Es una
+    # columna generada, así que nunca queda desfasada de fecha y hora.
+    agregar_columna(cursor, 'eventos', 'inicio',
+                    "TEXT GENERATED ALWAYS AS (datetime(fecha || ' ' || hora)) VIRTUAL")
+
+
+def _particion_eventos(cursor):
+    # Partición de ventas dueña del stock de cada evento (0 = esta base)
+    agregar_columna(cursor, 'eventos', 'particion', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def _ingresos(cursor):
+    # Entradas que ya pasaron por la puerta (una fila por entrada de una venta)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingresos (
+            evento_id INTEGER NOT NULL,
+            venta_id INTEGER NOT NULL,
+            numero INTEGER NOT NULL,
+            momento TEXT NOT NULL,
+            puerta TEXT,
+            PRIMARY KEY (evento_id, venta_id, numero)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _versiones_cartelera(cursor):
+    # Momento del último cambio de cada evento (Last-Modified de su página) y
+    # versión del catálogo sin el stock: la cartelera se revalida con
+    # `contenido` y completa el stock aparte, así una venta no la invalida.
+    agregar_columna(cursor, 'eventos', 'actualizado_en', 'TIMESTAMP')
+    cursor.execute('UPDATE eventos SET actualizado_en = CURRENT_TIMESTAMP')
+    agregar_columna(cursor, 'catalogo_version', 'contenido', 'INTEGER NOT NULL DEFAULT 1')
+    agregar_columna(cursor, 'catalogo_version', 'contenido_en', 'TIMESTAMP')
+    cursor.execute('UPDATE catalogo_version SET contenido_en = actualizado_en')
+    for trigger in ('trg_eventos_version', 'trg_catalogo_stock', 'trg_catalogo_insert', 'trg_catalogo_delete'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    contenido = '''
+            UPDATE catalogo_version
+            SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP,
+                contenido = contenido + 1, contenido_en = CURRENT_TIMESTAMP
+            WHERE id = 1;
+    '''
+    cursor.execute(f'''
+        CREATE TRIGGER trg_eventos_version
+        AFTER UPDATE OF nombre, fecha, hora, lugar, precio, descripcion, imagen_url ON eventos
+        BEGIN
+            UPDATE eventos SET version = OLD.version + 1, actualizado_en = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;
+            {contenido}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_catalogo_insert AFTER INSERT ON eventos
+        BEGIN
+            UPDATE eventos SET actualizado_en = CURRENT_TIMESTAMP WHERE id = NEW.id;
+            {contenido}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_catalogo_delete AFTER DELETE ON eventos
+        BEGIN
+            {contenido}
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER trg_catalogo_stock AFTER UPDATE OF entradas_disponibles ON eventos
+        BEGIN
+            UPDATE eventos SET actualizado_en = CURRENT_TIMESTAMP WHERE id = NEW.id;
+            UPDATE catalogo_version
+            SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+        END
+    ''')
+
+
+def _emails_minusculas(cursor):
+    # Los emails se guardan y se buscan normalizados (models.normalizar_email).
+    # Los que al normalizarse chocarían con otra cuenta quedan como están
+    cursor.execute('''
+        UPDATE usuarios SET email = lower(trim(email))
+        WHERE email != lower(trim(email))
+          AND lower(trim(email)) IN (
+              SELECT lower(trim(email)) FROM usuarios GROUP BY lower(trim(email)) HAVING COUNT(*) = 1
+          )
+    ''')
+
+
+def _indice(nombre, tabla, columnas):
+    def crear(cursor):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({columnas})')
+    return crear
+
+
+MIGRACIONES = [
+    (1, 'Tablas base: usuarios, eventos y ventas', _tablas_base),
+    (2, 'Asientos numerados', _asientos_numerados),
+    (3, 'Resúmenes de ventas y usuarios', resumenes.crear_resumenes),
+    # obtener_ventas_por_usuario / por_email: filtro por usuario, orden por fecha
+    (4, 'Índice ventas(user_id, fecha_compra)',
+     _indice('idx_ventas_usuario_fecha', 'ventas', 'user_id, fecha_compra')),
+    # Ventas por evento (filtro de admin, reconstrucción de resúmenes)
+    (5, 'Índice ventas(evento_id, fecha_compra)',
+     _indice('idx_ventas_evento_fecha', 'ventas', 'evento_id, fecha_compra')),
+    # obtener_todas_ventas / obtener_ventas_pagina / últimas ventas
+    (6, 'Índice ventas(fecha_compra)',
+     _indice('idx_ventas_fecha', 'ventas', 'fecha_compra')),
+    # obtener_eventos: ORDER BY fecha, hora sin ordenamiento temporal
+    (7, 'Índice eventos(fecha, hora)',
+     _indice('idx_eventos_fecha_hora', 'eventos', 'fecha, hora')),
+    # obtener_todos_usuarios / obtener_usuarios_pagina
+    (8, 'Índice usuarios(created_at)',
+     _indice('idx_usuarios_created', 'usuarios', 'created_at')),
+    # obtener_usuarios_pagina filtrando por rol
+    (9, 'Índice usuarios(rol, created_at)',
+     _indice('idx_usuarios_rol_created', 'usuarios', 'rol, created_at')),
+    (10, 'Versión de rol de usuarios', _version_rol),
+    # Lectura del stock del catálogo sin tocar las filas completas de eventos
+    (11, 'Índice eventos(entradas_disponibles)',
+     _indice('idx_eventos_stock', 'eventos', 'entradas_disponibles')),
+    (12, 'Versiones de eventos y del catálogo', _versiones_eventos),
+    (13, 'Versión de eventos solo por cambios de contenido', _version_contenido_eventos),
+    (14, 'Búsqueda de texto completo en eventos', _busqueda_eventos),
+    (15, 'Inicio normalizado de eventos', _inicio_eventos),
+    # Próximos eventos y ventanas de fechas
+    (16, 'Índice eventos(inicio)', _indice('idx_eventos_inicio', 'eventos', 'inicio')),
+    # Próximos eventos de una sala
+    (17, 'Índice eventos(lugar, inicio)',
+     _indice('idx_eventos_lugar_inicio', 'eventos', 'lugar, inicio')),
+    (18, 'Partición de ventas de cada evento', _particion_eventos),
+    (19, 'Ingresos registrados en la puerta', _ingresos),
+    (20, 'Versión de contenido del catálogo y último cambio de cada evento', _versiones_cartelera),
+    (21, 'Emails de usuarios en minúsculas', _emails_minusculas),
+]
+
+
+def _preparar(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT NOT NULL,
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def version_actual(conn):
+    """Versión de esquema aplicada (0 si la base no tiene versionado)"""
+    _preparar(conn)
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def pendientes(conn):
+    """Migraciones que todavía no se aplicaron, en orden"""
+    actual = version_actual(conn)
+    return [m for m in MIGRACIONES if m[0] > actual]
+
+
+def migrar(conn, hasta=None, informar=None):
+    """Aplicar las migraciones pendientes; devuelve las versiones aplicadas"""
+    aplicadas = []
+    for version, descripcion, aplicar in pendientes(conn):
+        if hasta is not None and version > hasta:
+            break
+        inicio = time.perf_counter()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            # Otro proceso pudo aplicarla mientras esperábamos el lock
+            cursor.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,))
+            if cursor.fetchone() is None:
+                aplicar(cursor)
+                cursor.execute('INSERT INTO schema_version (version, descripcion) VALUES (?, ?)',
+                               (version, descripcion))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        aplicadas.append(version)
+        if informar:
+            informar(version, descripcion, time.perf_counter() - inicio)
+    if aplicadas:
+        # Actualizar estadísticas del planificador para los índices nuevos
+        conn.execute('PRAGMA optimize')
+    return aplicadas
@@ -1,17 +1,32 @@
-from dataclasses import dataclass
+from dataclasses import MISSING, dataclass, fields
+from operator import itemgetter
 from typing import Optional
+from asientos import MapaAsientos
 
-@dataclass
+
+def normalizar_email(email):
+    """Forma en que se guardan y se buscan los emails: sin espacios y en minúsculas"""
+    return email.strip().lower()
+
+@dataclass(slots=True)
 class Usuario:
     id: int
     nombre: str
     email: str
-    password: str
+    password: Optional[str] = None  # None en las proyecciones de listados
     telefono: Optional[str] = None
     rol: str = 'cliente'
     created_at: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
+class Principal:
+    """Identidad mínima del usuario en sesión para chequeos de permisos"""
+    id: int
+    nombre: str
+    rol: str
+    rol_version: int = 0
+
+@dataclass(slots=True)
 class Evento:
     id: int
     nombre: str
@@ -22,8 +37,11 @@ class Evento:
     entradas_disponibles: int
     descripcion: Optional[str] = None
     imagen_url: Optional[str] = None
+    mapa: Optional[MapaAsientos] = None
+    version: int = 0
+    inicio: Optional[str] = None  # 'AAAA-MM-DD HH:MM:SS' calculado por la base
 
-@dataclass
+@dataclass(slots=True)
 class Venta:
     id: int
     evento_id: int
@@ -31,3 +49,42 @@ class Venta:
     cantidad: int
     total: float
     fecha_compra: str
+    asientos: Optional[str] = None
+
+
+def mapeador(cls, cursor):
+    """Función fila -> modelo para el resultado de `cursor`.
+
+    Resuelve una sola vez qué columnas del SELECT son campos del modelo; las
+    demás (alias de un JOIN, columnas nuevas del esquema) se ignoran y los
+    campos que la consulta no trae quedan con su valor por defecto.
+    """
+    columnas = {}
+    for i, descripcion in enumerate(cursor.description):
+        columnas.setdefault(descripcion[0], i)
+    campos = fields(cls)
+    presentes = [i for i, campo in enumerate(campos) if campo.name in columnas]
+    if not presentes:
+        return lambda row: cls()
+
+    # Argumentos posicionales hasta el último campo que trae la consulta: los
+    # que faltan en el medio toman su valor por defecto, agregado al final de
+    # la fila, y un solo itemgetter arma la tupla (sin dict por fila)
+    posiciones = []
+    faltantes = []
+    for campo in campos[:presentes[-1] + 1]:
+        if campo.name in columnas:
+            posiciones.append(columnas[campo.name])
+        elif campo.default is not MISSING:
+            posiciones.append(len(cursor.description) + len(faltantes))
+            faltantes.append(campo.default)
+        else:
+            raise TypeError(f'La consulta no trae {campo.name}, obligatorio en {cls.__name__}')
+    if len(posiciones) == 1:
+        posicion = posiciones[0]
+        return lambda row: cls(row[posicion])
+    valores = itemgetter(*posiciones)
+    if not faltantes:
+        return lambda row: cls(*valores(row))
+    extra = tuple(faltantes)
+    return lambda row: cls(*valores((*row, *extra)))
@@ -0,0 +1,454 @@
+"""Ventas particionadas en varios archivos SQLite por evento.
+
+SQLite admite un solo escritor por archivo: con todas las ventas en
+teatro.db una avalancha de compras para una función bloquea las compras de
+todas las demás. Con particiones, el stock (y el mapa de asientos) de cada
+evento vive en uno de varios archivos de ventas y sus compras escriben
+solo ahí, así los eventos de particiones distintas se venden en paralelo.
+
+- teatro.db es la partición 0: conserva el catálogo, los usuarios y las
+  ventas de los eventos que no se asignaron a otra partición.
+- eventos.particion en teatro.db dice qué partición es dueña del stock de
+  cada evento. Cada partición solo tiene filas de stock de los eventos que
+  le pertenecen y cada MotorReservas verifica la pertenencia dentro de la
+  transacción de compra, así un proceso con la asignación desactualizada
+  nunca vende sobre la copia equivocada: ve el rechazo, relee la asignación
+  y reintenta.
+- Las páginas leen el stock y los asientos de la partición dueña de cada
+  evento (ver ParticionesVentas.columna), así muestran la disponibilidad al
+  día. Cada partición cuenta sus cambios de stock en version_stock, que
+  entra en la versión del catálogo. Un hilo además copia el stock a
+  teatro.db cada `sincronizar_cada` segundos (un commit por ronda, solo si
+  algo cambió) para los informes y lecturas que van directo a teatro.db.
+- Las lecturas de ventas y de totales se resuelven con vistas UNION ALL
+  sobre las particiones adjuntas a un pool de lectura aparte; SQLite
+  combina en orden los resultados de cada partición usando sus índices.
+- Cada partición numera sus ventas desde numero << 40, así los ids no se
+  repiten entre particiones. Al mover un evento se mueve su stock; las
+  ventas ya hechas quedan donde se vendieron.
+"""
+import sqlite3
+import threading
+import time
+
+import resumenes
+from asientos import LIBRE, MapaAsientos, cargar_mapa, guardar_mapa
+from escritor_ventas import EscritorVentas
+from pool import ConnectionPool
+from reservas import MotorReservas
+
+# Bits bajos de los ids de venta de cada partición
+BITS_ID_PARTICION = 40
+
+# Las particiones tienen solo lo que toca una compra: stock, mapa de asientos,
+# ventas y sus agregados (mismas columnas y triggers que en teatro.db)
+_ESQUEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS eventos (
+        id INTEGER PRIMARY KEY,
+        entradas_disponibles INTEGER NOT NULL,
+        particion INTEGER NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS ventas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        evento_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        cantidad INTEGER NOT NULL,
+        total REAL NOT NULL,
+        fecha_compra TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        asientos TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS mapas_asientos (
+        evento_id INTEGER PRIMARY KEY,
+        layout TEXT NOT NULL,
+        estados BLOB NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_ventas_usuario_fecha ON ventas (user_id, fecha_compra)',
+    'CREATE INDEX IF NOT EXISTS idx_ventas_evento_fecha ON ventas (evento_id, fecha_compra)',
+    'CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas (fecha_compra)',
+    '''
+    CREATE TABLE IF NOT EXISTS version_stock (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_eventos_version_stock
+    AFTER UPDATE OF entradas_disponibles ON eventos
+    WHEN NEW.entradas_disponibles != OLD.entradas_disponibles
+    BEGIN
+        UPDATE version_stock SET version = version + 1 WHERE id = 1;
+    END
+    ''',
+] + resumenes.TABLAS_VENTAS + resumenes.TRIGGERS_VENTAS
+
+_COLUMNAS_VENTA = 'id, evento_id, user_id, cantidad, total, fecha_compra, asientos'
+
+# Vistas de lectura sobre todas las particiones (ver ParticionesVentas.adjuntar)
+VISTA_VENTAS = 'todas_ventas'
+VISTA_RESUMEN = 'todos_resumen_ventas'
+VISTA_RESUMEN_EVENTO = 'todos_resumen_ventas_evento'
+VISTA_VERSIONES_STOCK = 'todas_versiones_stock'
+
+
+class Particion:
+    """Un archivo de ventas con su pool, su motor de reservas y su escritor"""
+
+    def __init__(self, numero, pool, reservas, escritor=None):
+        self.numero = numero
+        self.pool = pool
+        self.reservas = reservas
+        self.escritor = escritor
+
+    def es_duenia(self, evento_id):
+        """¿Esta partición administra hoy el stock del evento?"""
+        conn = self.pool.obtener()
+        try:
+            return self.reservas.es_propio(conn, evento_id)
+        finally:
+            conn.close()
+
+
+class ParticionesVentas:
+    """Enrutamiento de compras por evento y lecturas combinadas.
+
+    principal es la Particion de teatro.db (número 0); rutas, los archivos
+    de las particiones 1..n, que se crean si no existen.
+    """
+
+    def __init__(self, principal, rutas, max_conexiones=8, timeout=10.0, pragmas=None,
+                 lote_ventas=0, espera_lote=0.0, sincronizar_cada=1.0):
+        self.principal = principal
+        self.particiones = [principal]
+        for numero, ruta in enumerate(rutas, start=1):
+            pool = ConnectionPool(ruta, max_conexiones=max_conexiones, timeout=timeout, pragmas=pragmas)
+            _crear_esquema(pool, numero)
+            reservas = MotorReservas(pool, particion=numero)
+            escritor = None
+            if lote_ventas > 0:
+                escritor = EscritorVentas(reservas, tamano_lote=lote_ventas, espera_maxima=espera_lote)
+            self.particiones.append(Particion(numero, pool, reservas, escritor))
+        self.rutas = list(rutas)
+
+        # Lecturas de ventas: conexiones a teatro.db con las particiones adjuntas.
+        # Es un pool aparte porque BEGIN IMMEDIATE en una conexión con bases
+        # adjuntas toma el lock de escritura de todas ellas.
+        self.lecturas = ConnectionPool(principal.pool.db_path, max_conexiones=max_conexiones,
+                                       timeout=timeout, pragmas=pragmas)
+        self.lecturas.al_conectar(self.adjuntar)
+
+        self.sincronizar_cada = sincronizar_cada
+        self._asignaciones = {}  # evento_id -> partición (cache local)
+        self._sincronizado = {}  # evento_id -> stock ya copiado a teatro.db
+        self._lock = threading.Lock()
+        self._hilo = None
+        # Métricas
+        self.reintentos = 0
+        self.sincronizaciones = 0
+
+    # ---- Lecturas combinadas ----
+
+    def adjuntar(self, conn):
+        """Adjuntar las particiones a una conexión de lectura y crear las vistas"""
+        esquemas = ['main']
+        for particion, ruta in zip(self.particiones[1:], self.rutas):
+            conn.execute('ATTACH DATABASE ? AS ?', (ruta, f'p{particion.numero}'))
+            esquemas.append(f'p{particion.numero}')
+
+        def union(columnas, tabla):
+            return ' UNION ALL '.join(f'SELECT {columnas} FROM {esquema}.{tabla}' for esquema in esquemas)
+
+        conn.execute(f'CREATE TEMP VIEW {VISTA_VENTAS} AS {union(_COLUMNAS_VENTA, "ventas")}')
+        conn.execute(f'''CREATE TEMP VIEW {VISTA_RESUMEN} AS
+                         {union("num_ventas, total_ventas, total_entradas", "resumen_ventas")}''')
+        conn.execute(f'''CREATE TEMP VIEW {VISTA_RESUMEN_EVENTO} AS
+                         {union("evento_id, num_ventas, total_ventas, total_entradas", "resumen_ventas_evento")}''')
+        conn.execute(f'''CREATE TEMP VIEW {VISTA_VERSIONES_STOCK} AS
+                         {' UNION ALL '.join(f'SELECT version FROM {esquema}.version_stock'
+                                             for esquema in esquemas[1:])}''')
+
+    def columna(self, tabla, columna, clave, respaldo):
+        """Expresión SQL con `columna` de la fila del evento `e` en su partición dueña.
+
+        Para las conexiones de `lecturas`: cada rama es una búsqueda por clave
+        primaria en una partición adjunta y SQLite evalúa solo la que toca a
+        e.particion. Los eventos de teatro.db (o sin fila en la partición,
+        durante una mudanza) usan `respaldo`.
+        """
+        ramas = ' '.join(f'WHEN {particion.numero} THEN (SELECT {columna} FROM p{particion.numero}.{tabla} '
+                         f'WHERE {clave} = e.id)' for particion in self.particiones[1:])
+        return f'COALESCE(CASE e.particion {ramas} END, {respaldo})'
+
+    # ---- Enrutamiento ----
+
+    def numero(self, evento_id, refrescar=False):
+        """Partición dueña del stock del evento (0 si no existe)"""
+        if not refrescar:
+            numero = self._asignaciones.get(evento_id)
+            if numero is not None:
+                return numero
+        conn = self.principal.pool.obtener()
+        try:
+            row = conn.execute('SELECT particion FROM eventos WHERE id = ?', (evento_id,)).fetchone()
+        finally:
+            conn.close()
+        numero = row[0] if row else 0
+        if numero >= len(self.particiones):
+            raise ValueError(f'El evento {evento_id} está en la partición {numero}, que no está configurada')
+        self._asignaciones[evento_id] = numero
+        return numero
+
+    def ejecutar(self, evento_id, operacion):
+        """operacion(particion) en la partición dueña del evento.
+
+        Un resultado None puede significar que el evento se movió a otra
+        partición desde otro proceso: en ese caso se relee la asignación y
+        se reintenta una vez.
+        """
+        self._iniciar()
+        particion = self.particiones[self.numero(evento_id)]
+        resultado = operacion(particion)
+        if resultado is None and not particion.es_duenia(evento_id):
+            self.reintentos += 1
+            resultado = operacion(self.particiones[self.numero(evento_id, refrescar=True)])
+        return resultado
+
+    def alojar(self, conn, evento_id, entradas, mapa=None):
+        """Asignar a un evento nuevo una partición y crear allí su stock.
+
+        conn es la transacción de teatro.db que creó el evento; la fila de
+        stock de la partición se confirma antes, así si teatro.db no llega a
+        confirmar solo queda una fila huérfana que nadie usa.
+        """
+        return self.alojar_lote(conn, [(evento_id, entradas, mapa)])[evento_id]
+
+    def alojar_lote(self, conn, eventos):
+        """alojar para varios eventos nuevos (evento_id, entradas, mapa): una
+        transacción por partición de destino. Devuelve {evento_id: partición}."""
+        destinos = {}
+        for evento in eventos:
+            destinos.setdefault(1 + evento[0] % (len(self.particiones) - 1), []).append(evento)
+        for numero, alojados in sorted(destinos.items()):
+            destino = self.particiones[numero].pool.obtener()
+            try:
+                destino.execute('BEGIN IMMEDIATE')
+                for evento_id, entradas, mapa in alojados:
+                    _copiar_stock(destino, evento_id, entradas, mapa, numero)
+                destino.commit()
+            finally:
+                destino.close()
+        asignaciones = {evento[0]: numero for numero, alojados in destinos.items() for evento in alojados}
+        conn.executemany('UPDATE eventos SET particion = ? WHERE id = ?',
+                         [(numero, evento_id) for evento_id, numero in asignaciones.items()])
+        self._asignaciones.update(asignaciones)
+        return asignaciones
+
+    def fijar_stock(self, evento_id, entradas):
+        """Corregir el stock de un evento en su partición (edición desde administración).
+
+        Con asientos numerados `entradas` se ignora: el stock son los libres
+        del mapa, leídos en la misma transacción. Devuelve el stock que
+        quedó, para copiarlo a teatro.db.
+        """
+        numero = self.numero(evento_id, refrescar=True)
+        if numero == 0:
+            return entradas
+        conn = self.particiones[numero].pool.obtener()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            mapa = cargar_mapa(conn, evento_id)
+            if mapa is not None:
+                entradas = mapa.contar(LIBRE)
+            conn.execute('UPDATE eventos SET entradas_disponibles = ? WHERE id = ?', (entradas, evento_id))
+            conn.commit()
+        finally:
+            conn.close()
+        self._sincronizado[evento_id] = entradas
+        return entradas
+
+    def desalojar(self, evento_id, numero):
+        """Borrar el stock y el mapa de un evento eliminado de su partición"""
+        self._asignaciones.pop(evento_id, None)
+        self._sincronizado.pop(evento_id, None)
+        if numero == 0:
+            return
+        conn = self.particiones[numero].pool.obtener()
+        try:
+            conn.execute('DELETE FROM eventos WHERE id = ?', (evento_id,))
+            conn.execute('DELETE FROM mapas_asientos WHERE evento_id = ?', (evento_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ---- Rebalanceo ----
+
+    def mover_evento(self, evento_id, destino):
+        """Pasar el stock de un evento a otra partición (0 = teatro.db).
+
+        Bloquea teatro.db, la partición de origen y la de destino mientras
+        copia: las compras del evento esperan unos instantes y después
+        siguen en la partición nueva. Las ventas ya hechas no se mueven.
+        Devuelve la partición de origen.
+        """
+        if not 0 <= destino < len(self.particiones):
+            raise ValueError(f'Partición inexistente: {destino}')
+        origen = self.numero(evento_id, refrescar=True)
+        if origen == destino:
+            return origen
+        conexiones = {}
+        try:
+            # Siempre teatro.db primero y después por número, el mismo orden que
+            # crear_evento (que escribe en teatro.db antes de alojar): dos
+            # escritores que toman los locks al revés se esperan mutuamente
+            for numero in sorted({0, origen, destino}):
+                conexiones[numero] = self.particiones[numero].pool.obtener()
+                conexiones[numero].execute('BEGIN IMMEDIATE')
+            principal, desde, hacia = conexiones[0], conexiones[origen], conexiones[destino]
+
+            row = desde.execute('SELECT entradas_disponibles, particion FROM eventos WHERE id = ?',
+                                (evento_id,)).fetchone()
+            if row is None or row[1] != origen:
+                raise ValueError(f'El evento {evento_id} no está en la partición {origen}')
+            mapa = desde.execute('SELECT layout, estados FROM mapas_asientos WHERE evento_id = ?',
+                                 (evento_id,)).fetchone()
+            mapa = MapaAsientos.desde_db(mapa[0], mapa[1]) if mapa else None
+
+            if destino == 0:
+                hacia.execute('UPDATE eventos SET entradas_disponibles = ? WHERE id = ?', (row[0], evento_id))
+                if mapa is not None:
+                    guardar_mapa(hacia, evento_id, mapa)
+            else:
+                _copiar_stock(hacia, evento_id, row[0], mapa, destino)
+            if origen != 0:
+                desde.execute('DELETE FROM eventos WHERE id = ?', (evento_id,))
+                desde.execute('DELETE FROM mapas_asientos WHERE evento_id = ?', (evento_id,))
+            principal.execute('UPDATE eventos SET particion = ? WHERE id = ?', (destino, evento_id))
+
+            # Primero deja de ser dueño el origen: ante una falla a mitad de
+            # camino el evento queda sin ventas, nunca con dos dueños
+            for numero in dict.fromkeys([origen, 0, destino]):
+                conexiones[numero].commit()
+        finally:
+            for conn in conexiones.values():
+                conn.close()
+        self._asignaciones[evento_id] = destino
+        self._sincronizado.pop(evento_id, None)
+        return origen
+
+    def plan_rebalanceo(self, cargas, tolerancia=0.1):
+        """Asignación que reparte la carga entre las particiones 1..n.
+
+        cargas: {evento_id: (carga, partición actual)}. De la mayor carga a
+        la menor, cada evento se queda donde está mientras su partición no
+        supere el promedio en más de `tolerancia`; si no, va a la partición
+        menos cargada. Devuelve {evento_id: partición nueva} solo para los
+        eventos que cambian.
+        """
+        destinos = range(1, len(self.particiones))
+        acumulado = {numero: 0 for numero in destinos}
+        limite = sum(carga for carga, _ in cargas.values()) / len(destinos) * (1 + tolerancia)
+        movimientos = {}
+        for evento_id, (carga, actual) in sorted(cargas.items(), key=lambda item: -item[1][0]):
+            numero = actual
+            if actual not in acumulado or acumulado[actual] + carga > limite:
+                numero = min(destinos, key=acumulado.get)
+            acumulado[numero] += carga
+            if numero != actual:
+                movimientos[evento_id] = numero
+        return movimientos
+
+    # ---- Sincronización del stock visible ----
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name='sincronizar-stock', daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.sincronizar_cada)
+            try:
+                self.sincronizar()
+            except sqlite3.Error as e:
+                print(f"Error al sincronizar el stock de las particiones: {e}")
+
+    def sincronizar(self):
+        """Copiar a teatro.db el stock y los asientos que cambiaron en las particiones"""
+        stock, mapas = [], []
+        for particion in self.particiones[1:]:
+            conn = particion.pool.obtener()
+            try:
+                conn.execute('BEGIN')
+                cambiados = [(entradas, evento_id, particion.numero) for evento_id, entradas
+                             in conn.execute('SELECT id, entradas_disponibles FROM eventos')
+                             if self._sincronizado.get(evento_id) != entradas]
+                for _, evento_id, _ in cambiados:
+                    row = conn.execute('SELECT estados FROM mapas_asientos WHERE evento_id = ?',
+                                       (evento_id,)).fetchone()
+                    if row is not None:
+                        mapas.append((row[0], evento_id))
+            finally:
+                conn.close()
+            stock.extend(cambiados)
+        if not stock:
+            return 0
+
+        conn = self.principal.pool.obtener()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''
+                UPDATE eventos SET entradas_disponibles = ?
+                WHERE id = ? AND particion = ? AND entradas_disponibles != ?
+            ''', [(entradas, evento_id, numero, entradas) for entradas, evento_id, numero in stock])
+            conn.executemany('UPDATE mapas_asientos SET estados = ? WHERE evento_id = ?', mapas)
+            conn.commit()
+        finally:
+            conn.close()
+        for entradas, evento_id, _ in stock:
+            self._sincronizado[evento_id] = entradas
+        self.sincronizaciones += 1
+        return len(stock)
+
+    def estadisticas(self):
+        return {
+            'particiones': len(self.particiones),
+            'eventos_asignados': len(self._asignaciones),
+            'reintentos': self.reintentos,
+            'sincronizaciones': self.sincronizaciones,
+        }
+
+    def cerrar(self):
+        self.lecturas.cerrar_todas()
+        for particion in self.particiones[1:]:
+            particion.pool.cerrar_todas()
+
+
+def _crear_esquema(pool, numero):
+    conn = pool.obtener()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for sql in _ESQUEMA:
+            conn.execute(sql)
+        conn.execute('INSERT OR IGNORE INTO resumen_ventas (id) VALUES (1)')
+        conn.execute('INSERT OR IGNORE INTO version_stock (id) VALUES (1)')
+        # Rango propio de ids de venta: numero << 40 en adelante
+        if conn.execute("SELECT 1 FROM sqlite_sequence WHERE name = 'ventas'").fetchone() is None:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('ventas', ?)",
+                         (numero << BITS_ID_PARTICION,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _copiar_stock(conn, evento_id, entradas, mapa, numero):
+    conn.execute('INSERT OR REPLACE INTO eventos (id, entradas_disponibles, particion) VALUES (?, ?, ?)',
+                 (evento_id, entradas, numero))
+    if mapa is not None:
+        conn.execute('INSERT OR REPLACE INTO mapas_asientos (evento_id, layout, estados) VALUES (?, ?, ?)',
+                     (evento_id, mapa.layout_json(), mapa.estados_blob()))
@@ -0,0 +1,131 @@
+"""Hash de contraseñas con scrypt en un pool de procesos acotado.
+
+Los hashes se guardan como ``scrypt$n$r$p$sal$hash`` (sal y hash en
+base64), así cada uno lleva los parámetros con que se calculó y se pueden
+endurecer los costos sin invalidar los existentes. Los hashes viejos
+(SHA-256 sin sal, 64 caracteres hexadecimales) se siguen aceptando y
+Database los reemplaza en el siguiente login exitoso.
+
+El KDF es deliberadamente lento y usa memoria, por eso no corre en los
+hilos de Flask: HasherPasswords lo delega a un pool de procesos con una
+cola acotada. Si la cola está llena o el cálculo no termina a tiempo se
+levanta HashOcupadoError en lugar de dejar el hilo bloqueado.
+"""
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturoTimeout
+
+_LEGACY = re.compile(r'^[0-9a-f]{64}$')
+
+# Costos por defecto: 32 MB de memoria por hash (128 * n * r bytes)
+N_POR_DEFECTO = 2 ** 15
+R_POR_DEFECTO = 8
+P_POR_DEFECTO = 1
+_LARGO_SAL = 16
+_LARGO_HASH = 32
+
+
+class HashOcupadoError(Exception):
+    """El pool de hash está saturado o no respondió a tiempo"""
+
+
+def calcular_hash(password, n=N_POR_DEFECTO, r=R_POR_DEFECTO, p=P_POR_DEFECTO, sal=None):
+    """Hash scrypt con sal aleatoria en formato scrypt$n$r$p$sal$hash"""
+    sal = sal if sal is not None else os.urandom(_LARGO_SAL)
+    clave = hashlib.scrypt(password.encode('utf-8'), salt=sal, n=n, r=r, p=p,
+                           maxmem=256 * n * r * p, dklen=_LARGO_HASH)
+    return 'scrypt${}${}${}${}${}'.format(n, r, p, base64.b64encode(sal).decode(),
+                                          base64.b64encode(clave).decode())
+
+
+def comprobar_hash(password, almacenado):
+    """¿Corresponde password al hash guardado? (scrypt o SHA-256 heredado)"""
+    if not almacenado:
+        return False
+    if _LEGACY.match(almacenado):
+        calculado = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(calculado, almacenado)
+    try:
+        esquema, n, r, p, sal, _ = almacenado.split('$')
+        if esquema != 'scrypt':
+            return False
+        calculado = calcular_hash(password, int(n), int(r), int(p), base64.b64decode(sal))
+    except ValueError:
+        return False
+    return hmac.compare_digest(calculado, almacenado)
+
+
+class HasherPasswords:
+    """Calcula y verifica hashes en un pool de procesos con cola acotada.
+
+    procesos=0 calcula en el hilo que llama (scripts, tests). El pool se
+    crea en el primer uso, después de que el servidor haya forkeado sus
+    workers.
+    """
+
+    def __init__(self, procesos=None, max_cola=64, timeout=5.0,
+                 n=N_POR_DEFECTO, r=R_POR_DEFECTO, p=P_POR_DEFECTO):
+        self.procesos = (os.cpu_count() or 1) if procesos is None else procesos
+        self.timeout = timeout
+        self.parametros = {'n': n, 'r': r, 'p': p}
+        self._cupos = threading.BoundedSemaphore(self.procesos + max_cola)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _ejecutor(self):
+        with self._lock:
+            if self._pool is None:
+                # forkserver: los workers no heredan locks tomados por otros hilos
+                contexto = multiprocessing.get_context('forkserver')
+                self._pool = ProcessPoolExecutor(max_workers=self.procesos, mp_context=contexto)
+            return self._pool
+
+    def _ejecutar(self, funcion, *args, **kwargs):
+        if not self.procesos:
+            return funcion(*args, **kwargs)
+        if not self._cupos.acquire(timeout=self.timeout):
+            raise HashOcupadoError('Cola de hash de contraseñas llena')
+        try:
+            futuro = self._ejecutor().submit(funcion, *args, **kwargs)
+        except Exception:
+            self._cupos.release()
+            raise
+        futuro.add_done_callback(lambda _: self._cupos.release())
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturoTimeout:
+            futuro.cancel()
+            raise HashOcupadoError('El hash de la contraseña no terminó a tiempo')
+
+    def hashear(self, password):
+        """Hash nuevo con los parámetros configurados"""
+        return self._ejecutar(calcular_hash, password, **self.parametros)
+
+    def verificar(self, password, almacenado):
+        """¿Corresponde password al hash guardado?"""
+        if almacenado and _LEGACY.match(almacenado):
+            # SHA-256 heredado: barato, no hace falta ir al pool
+            return comprobar_hash(password, almacenado)
+        return self._ejecutar(comprobar_hash, password, almacenado)
+
+    def necesita_rehash(self, almacenado):
+        """¿El hash es heredado o se calculó con parámetros distintos a los actuales?"""
+        if not almacenado or _LEGACY.match(almacenado):
+            return True
+        partes = almacenado.split('$')
+        if len(partes) != 6 or partes[0] != 'scrypt':
+            return True
+        actuales = self.parametros
+        return partes[1:4] != [str(actuales['n']), str(actuales['r']), str(actuales['p'])]
+
+    def cerrar(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,213 @@
+import sqlite3
+import threading
+import time
+
+# Pragmas de producción que se aplican una sola vez al abrir cada conexión
+PRAGMAS_POR_DEFECTO = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 268435456,
+    'cache_size': -16000,
+    'temp_store': 'MEMORY',
+}
+
+
+class PoolAgotadoError(sqlite3.OperationalError):
+    """No se obtuvo una conexión libre dentro del tiempo de espera"""
+
+
+class _Cursor(sqlite3.Cursor):
+    """Cursor que avisa cada sentencia a los hooks de su conexión"""
+
+    def execute(self, sql, parametros=()):
+        for hook in self.connection.hooks_sentencia:
+            hook(self.connection, sql, parametros)
+        return super().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        for hook in self.connection.hooks_sentencia:
+            hook(self.connection, sql, None)
+        return super().executemany(sql, parametros)
+
+
+class _Conexion(sqlite3.Connection):
+    """Conexión cuyas sentencias pasan por _Cursor, también las de execute()"""
+
+    hooks_sentencia = ()
+
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+
+class ConexionPool:
+    """Conexión prestada por el pool.
+
+    Se comporta como un sqlite3.Connection; close() la devuelve al pool en
+    lugar de cerrarla, así el código existente no necesita cambios.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, nombre):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('La conexión ya fue devuelta al pool')
+        return getattr(self._conn, nombre)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self):
+        """Devolver la conexión al pool"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.liberar(conn)
+
+    def __del__(self):
+        # Red de seguridad si alguien olvida cerrar la conexión
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite reutilizables entre requests.
+
+    Cada hilo reutiliza preferentemente la última conexión que devolvió, las
+    conexiones ociosas se verifican antes de prestarse y nunca hay más de
+    ``max_conexiones`` abiertas a la vez.
+    """
+
+    def __init__(self, db_path, max_conexiones=8, timeout=10.0,
+                 intervalo_verificacion=30.0, pragmas=None):
+        self.db_path = db_path
+        self.max_conexiones = max_conexiones
+        self.timeout = timeout
+        self.intervalo_verificacion = intervalo_verificacion
+        self.pragmas = dict(PRAGMAS_POR_DEFECTO if pragmas is None else pragmas)
+        self._cupos = threading.BoundedSemaphore(max_conexiones)
+        self._lock = threading.Lock()
+        self._ociosas = {}  # conexión -> momento en que se devolvió
+        self._local = threading.local()
+        self._hooks = []
+        self._hooks_prestamo = []
+        self._hooks_devolucion = []
+        self._hooks_sentencia = []
+
+    def al_conectar(self, hook):
+        """Registrar una función que se llama con cada conexión nueva"""
+        self._hooks.append(hook)
+        return hook
+
+    def al_prestar(self, hook):
+        """Registrar una función que se llama con cada conexión prestada"""
+        self._hooks_prestamo.append(hook)
+        return hook
+
+    def al_devolver(self, hook):
+        """Registrar una función que se llama con cada conexión devuelta"""
+        self._hooks_devolucion.append(hook)
+        return hook
+
+    def al_ejecutar(self, hook):
+        """Registrar una función que se llama con (conexión, sql, parámetros) antes de cada sentencia.
+
+        Las sentencias que ejecutan los triggers no pasan por acá: cuenta
+        cada execute() o executemany() una vez, aunque se repita el mismo SQL.
+        """
+        self._hooks_sentencia.append(hook)
+        return hook
+
+    def _conectar(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.pragmas.get('busy_timeout', 5000) / 1000,
+            check_same_thread=False,
+            factory=_Conexion,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma, valor in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {valor}')
+        for hook in self._hooks:
+            hook(conn)
+        # Las sentencias de preparación de la conexión no se informan
+        conn.hooks_sentencia = self._hooks_sentencia
+        return conn
+
+    def _sana(self, conn, liberada_en):
+        if time.monotonic() - liberada_en < self.intervalo_verificacion:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _tomar_ociosa(self):
+        with self._lock:
+            propia = getattr(self._local, 'conn', None)
+            if propia is not None and propia in self._ociosas:
+                return propia, self._ociosas.pop(propia)
+            if self._ociosas:
+                return self._ociosas.popitem()
+        return None, None
+
+    def obtener(self):
+        """Prestar una conexión del pool"""
+        if not self._cupos.acquire(timeout=self.timeout):
+            raise PoolAgotadoError('No hay conexiones disponibles en el pool')
+        try:
+            conn, liberada_en = self._tomar_ociosa()
+            if conn is not None and not self._sana(conn, liberada_en):
+                self._cerrar(conn)
+                conn = None
+            if conn is None:
+                conn = self._conectar()
+        except Exception:
+            self._cupos.release()
+            raise
+        self._local.conn = conn
+        for hook in self._hooks_prestamo:
+            hook(conn)
+        return ConexionPool(self, conn)
+
+    def liberar(self, conn):
+        """Recibir una conexión devuelta, dejándola limpia para el próximo uso"""
+        try:
+            for hook in self._hooks_devolucion:
+                hook(conn)
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            self._cerrar(conn)
+        else:
+            with self._lock:
+                self._ociosas[conn] = time.monotonic()
+        finally:
+            self._cupos.release()
+
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def cerrar_todas(self):
+        """Cerrar las conexiones ociosas (por ejemplo al apagar el proceso)"""
+        with self._lock:
+            ociosas, self._ociosas = list(self._ociosas), {}
+        for conn in ociosas:
+            self._cerrar(conn)
@@ -0,0 +1,204 @@
+import sqlite3
+import threading
+import time
+
+from asientos import LIBRE, RETENIDO, VENDIDO, cargar_mapa, guardar_mapa
+
+
+def _es_bloqueo(error):
+    mensaje = str(error).lower()
+    return 'locked' in mensaje or 'busy' in mensaje
+
+
+class MotorReservas:
+    """Venta de entradas sin sobreventa bajo alta concurrencia.
+
+    El stock se descuenta con un UPDATE condicional dentro de una
+    transacción IMMEDIATE, que toma el lock de escritura antes de leer, así
+    que dos compradores nunca pueden pasar el mismo control de stock. Dentro
+    del proceso las compras de un mismo evento se serializan con un lock por
+    franja de eventos: los hilos esperan su turno en Python en lugar de
+    pelear por el lock de SQLite, y los eventos distintos no se bloquean
+    entre sí.
+
+    Con ventas particionadas (ver particiones.py) `particion` es el número
+    de la base del motor: antes de vender o cambiar asientos se verifica que
+    el evento siga perteneciendo a esa partición.
+    """
+
+    def __init__(self, pool, franjas=64, reintentos=5, espera_reintento=0.05, particion=None):
+        self.pool = pool
+        self.particion = particion
+        self.reintentos = reintentos
+        self.espera_reintento = espera_reintento
+        self._locks = [threading.Lock() for _ in range(franjas)]
+        # Métricas de espera por el lock de escritura de SQLite; las actualizan
+        # los hilos de todos los requests y el escritor de ventas, bajo _lock_metricas
+        self._lock_metricas = threading.Lock()
+        self.transacciones = 0
+        self.esperas_bloqueo = 0  # BEGIN IMMEDIATE que tuvieron que esperar
+        self.segundos_bloqueo = 0.0
+        self.reintentos_bloqueo = 0
+
+    def comenzar(self, conn, umbral=0.001):
+        """BEGIN IMMEDIATE midiendo cuánto se esperó el lock de escritura"""
+        inicio = time.perf_counter()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+        finally:
+            espera = time.perf_counter() - inicio
+            with self._lock_metricas:
+                self.transacciones += 1
+                if espera >= umbral:
+                    self.esperas_bloqueo += 1
+                    self.segundos_bloqueo += espera
+
+    def contar_reintento(self):
+        """Registrar un reintento por base bloqueada"""
+        with self._lock_metricas:
+            self.reintentos_bloqueo += 1
+
+    def lock_evento(self, evento_id):
+        """Lock de la franja a la que pertenece el evento"""
+        return self._locks[hash(evento_id) % len(self._locks)]
+
+    def es_propio(self, conn, evento_id):
+        """¿El stock del evento se administra en la base de este motor?"""
+        if self.particion is None:
+            return True
+        row = conn.execute('SELECT particion FROM eventos WHERE id = ?', (evento_id,)).fetchone()
+        return row is not None and row[0] == self.particion
+
+    def descontar_stock(self, conn, evento_id, cantidad):
+        """Descontar entradas dentro de una transacción abierta.
+
+        Devuelve False si el evento no existe o no tiene stock suficiente.
+        """
+        cursor = conn.execute('''
+            UPDATE eventos
+            SET entradas_disponibles = entradas_disponibles - ?
+            WHERE id = ? AND entradas_disponibles >= ?
+        ''', (cantidad, evento_id, cantidad))
+        return cursor.rowcount == 1
+
+    def devolver_stock(self, conn, evento_id, cantidad):
+        """Reponer entradas dentro de una transacción abierta"""
+        conn.execute('''
+            UPDATE eventos
+            SET entradas_disponibles = entradas_disponibles + ?
+            WHERE id = ?
+        ''', (cantidad, evento_id))
+
+    def registrar_venta(self, conn, evento_id, user_id, cantidad, total, asientos=None):
+        """Descontar stock e insertar la venta dentro de una transacción abierta.
+
+        Si el evento tiene asientos numerados se venden los asientos pedidos
+        (offsets del mapa) o, si no se indican, los mejores disponibles.
+        """
+        if not self.es_propio(conn, evento_id):
+            return None
+        etiquetas = None
+        mapa = cargar_mapa(conn, evento_id)
+        if mapa is not None:
+            posiciones = sorted(set(asientos)) if asientos else mapa.mejores_libres(cantidad)
+            # El total lo calculó quien llama para `cantidad` entradas: si los
+            # asientos no coinciden se rechaza en vez de cobrar otro importe
+            if not posiciones or len(posiciones) != cantidad:
+                return None
+            # Los retenidos (prensa, taquilla) no se venden hasta que se liberan
+            libres = mapa.cambiar(posiciones, VENDIDO, (LIBRE,))
+            if libres is None:
+                return None
+            if not self.descontar_stock(conn, evento_id, libres):
+                return None
+            guardar_mapa(conn, evento_id, mapa)
+            etiquetas = ', '.join(mapa.etiqueta(p) for p in posiciones)
+        elif asientos:
+            return None
+        elif not self.descontar_stock(conn, evento_id, cantidad):
+            return None
+        cursor = conn.execute('''
+            INSERT INTO ventas (evento_id, user_id, cantidad, total, asientos)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (evento_id, user_id, cantidad, total, etiquetas))
+        return cursor.lastrowid
+
+    def cambiar_asientos(self, conn, evento_id, posiciones, nuevo, permitidos):
+        """Cambiar el estado de varios asientos dentro de una transacción abierta.
+
+        El stock del evento se mantiene igual a la cantidad de asientos libres.
+        """
+        if not self.es_propio(conn, evento_id):
+            return None
+        mapa = cargar_mapa(conn, evento_id)
+        if mapa is None:
+            return None
+        posiciones = sorted(set(posiciones))
+        libres = mapa.cambiar(posiciones, nuevo, permitidos)
+        if libres is None:
+            return None
+        if nuevo == LIBRE:
+            self.devolver_stock(conn, evento_id, len(posiciones) - libres)
+        elif libres and not self.descontar_stock(conn, evento_id, libres):
+            return None
+        guardar_mapa(conn, evento_id, mapa)
+        return len(posiciones)
+
+    def en_transaccion(self, evento_id, operacion):
+        """Ejecutar operacion(conn) en una transacción IMMEDIATE serializada por evento.
+
+        Si operacion devuelve None la transacción se revierte. Los errores de
+        base bloqueada se reintentan con espera creciente.
+        """
+        with self.lock_evento(evento_id):
+            for intento in range(self.reintentos):
+                conn = self.pool.obtener()
+                try:
+                    self.comenzar(conn)
+                    resultado = operacion(conn)
+                    if resultado is None:
+                        conn.rollback()
+                    else:
+                        conn.commit()
+                    return resultado
+                except sqlite3.OperationalError as e:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    if not _es_bloqueo(e) or intento == self.reintentos - 1:
+                        raise
+                    self.contar_reintento()
+                finally:
+                    conn.close()
+                time.sleep(self.espera_reintento * (2 ** intento))
+
+    def reservar(self, evento_id, user_id, cantidad, total, asientos=None):
+        """Vender entradas; devuelve el id de la venta o None si no hay stock"""
+        if cantidad <= 0 and not asientos:
+            return None
+        return self.en_transaccion(
+            evento_id,
+            lambda conn: self.registrar_venta(conn, evento_id, user_id, cantidad, total, asientos),
+        )
+
+    def retener_asientos(self, evento_id, posiciones):
+        """Retener asientos libres (por ejemplo para prensa o taquilla)"""
+        return self.en_transaccion(
+            evento_id,
+            lambda conn: self.cambiar_asientos(conn, evento_id, posiciones, RETENIDO, (LIBRE,)),
+        )
+
+    def liberar_asientos(self, evento_id, posiciones):
+        """Volver a poner a la venta asientos retenidos o vendidos"""
+        return self.en_transaccion(
+            evento_id,
+            lambda conn: self.cambiar_asientos(conn, evento_id, posiciones, LIBRE, (RETENIDO, VENDIDO)),
+        )
+
+    def estadisticas(self):
+        with self._lock_metricas:
+            return {
+                'transacciones': self.transacciones,
+                'esperas_bloqueo': self.esperas_bloqueo,
+                'segundos_bloqueo': round(self.segundos_bloqueo, 6),
+                'reintentos_bloqueo': self.reintentos_bloqueo,
+            }
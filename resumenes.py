@@ -0,0 +1,178 @@
+"""Agregados de ventas y usuarios mantenidos de forma incremental.
+
+Los triggers actualizan los resúmenes dentro de la misma transacción que
+inserta la venta o crea/modifica el usuario, de modo que los dashboards
+leen totales en O(1) en lugar de recorrer todas las ventas.
+"""
+
+# Agregados de ventas: también los tiene cada partición de ventas
+TABLAS_VENTAS = [
+    '''
+    CREATE TABLE IF NOT EXISTS resumen_ventas (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        num_ventas INTEGER NOT NULL DEFAULT 0,
+        total_ventas REAL NOT NULL DEFAULT 0,
+        total_entradas INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS resumen_ventas_evento (
+        evento_id INTEGER PRIMARY KEY,
+        num_ventas INTEGER NOT NULL DEFAULT 0,
+        total_ventas REAL NOT NULL DEFAULT 0,
+        total_entradas INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+]
+
+TABLAS_USUARIOS = [
+    '''
+    CREATE TABLE IF NOT EXISTS resumen_usuarios_rol (
+        rol TEXT PRIMARY KEY,
+        cantidad INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+]
+
+TRIGGERS_VENTAS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_venta_insert AFTER INSERT ON ventas
+    BEGIN
+        UPDATE resumen_ventas
+        SET num_ventas = num_ventas + 1,
+            total_ventas = total_ventas + NEW.total,
+            total_entradas = total_entradas + NEW.cantidad
+        WHERE id = 1;
+        INSERT INTO resumen_ventas_evento (evento_id, num_ventas, total_ventas, total_entradas)
+        VALUES (NEW.evento_id, 1, NEW.total, NEW.cantidad)
+        ON CONFLICT(evento_id) DO UPDATE SET
+            num_ventas = num_ventas + 1,
+            total_ventas = total_ventas + excluded.total_ventas,
+            total_entradas = total_entradas + excluded.total_entradas;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_venta_delete AFTER DELETE ON ventas
+    BEGIN
+        UPDATE resumen_ventas
+        SET num_ventas = num_ventas - 1,
+            total_ventas = total_ventas - OLD.total,
+            total_entradas = total_entradas - OLD.cantidad
+        WHERE id = 1;
+        UPDATE resumen_ventas_evento
+        SET num_ventas = num_ventas - 1,
+            total_ventas = total_ventas - OLD.total,
+            total_entradas = total_entradas - OLD.cantidad
+        WHERE evento_id = OLD.evento_id;
+    END
+    ''',
+]
+
+TRIGGERS_USUARIOS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_usuario_insert AFTER INSERT ON usuarios
+    BEGIN
+        INSERT INTO resumen_usuarios_rol (rol, cantidad) VALUES (NEW.rol, 1)
+        ON CONFLICT(rol) DO UPDATE SET cantidad = cantidad + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_usuario_delete AFTER DELETE ON usuarios
+    BEGIN
+        UPDATE resumen_usuarios_rol SET cantidad = cantidad - 1 WHERE rol = OLD.rol;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_usuario_rol AFTER UPDATE OF rol ON usuarios
+    WHEN OLD.rol IS NOT NEW.rol
+    BEGIN
+        UPDATE resumen_usuarios_rol SET cantidad = cantidad - 1 WHERE rol = OLD.rol;
+        INSERT INTO resumen_usuarios_rol (rol, cantidad) VALUES (NEW.rol, 1)
+        ON CONFLICT(rol) DO UPDATE SET cantidad = cantidad + 1;
+    END
+    ''',
+]
+
+TABLAS = TABLAS_VENTAS + TABLAS_USUARIOS
+TRIGGERS = TRIGGERS_VENTAS + TRIGGERS_USUARIOS
+
+# Cálculo completo de cada agregado a partir de las tablas base
+_CALCULO_GLOBAL = '''
+    SELECT COUNT(*), COALESCE(SUM(total), 0), COALESCE(SUM(cantidad), 0) FROM ventas
+'''
+_CALCULO_EVENTO = '''
+    SELECT evento_id, COUNT(*), COALESCE(SUM(total), 0), COALESCE(SUM(cantidad), 0)
+    FROM ventas GROUP BY evento_id
+'''
+_CALCULO_ROL = 'SELECT rol, COUNT(*) FROM usuarios GROUP BY rol'
+
+# Tolerancia para comparar sumas de montos en coma flotante
+TOLERANCIA = 0.005
+
+
+def crear_resumenes(cursor):
+    """Crear tablas y triggers; inicializar los agregados si son nuevos"""
+    for sql in TABLAS + TRIGGERS:
+        cursor.execute(sql)
+    cursor.execute('SELECT 1 FROM resumen_ventas WHERE id = 1')
+    if cursor.fetchone() is None:
+        reconstruir(cursor)
+
+
+def reconstruir(cursor, usuarios=True):
+    """Recalcular todos los agregados desde cero (en la transacción en curso).
+
+    usuarios=False para una partición de ventas, que solo tiene los de ventas.
+    """
+    cursor.execute('DELETE FROM resumen_ventas')
+    cursor.execute('DELETE FROM resumen_ventas_evento')
+    cursor.execute(f'''
+        INSERT INTO resumen_ventas (id, num_ventas, total_ventas, total_entradas)
+        SELECT 1, * FROM ({_CALCULO_GLOBAL})
+    ''')
+    cursor.execute(f'''
+        INSERT INTO resumen_ventas_evento (evento_id, num_ventas, total_ventas, total_entradas)
+        {_CALCULO_EVENTO}
+    ''')
+    if usuarios:
+        cursor.execute('DELETE FROM resumen_usuarios_rol')
+        cursor.execute(f'INSERT INTO resumen_usuarios_rol (rol, cantidad) {_CALCULO_ROL}')
+
+
+def verificar(cursor, usuarios=True):
+    """Comparar los agregados con las tablas base; devuelve las diferencias"""
+    diferencias = []
+
+    cursor.execute(_CALCULO_GLOBAL)
+    real = tuple(cursor.fetchone())
+    cursor.execute('SELECT num_ventas, total_ventas, total_entradas FROM resumen_ventas WHERE id = 1')
+    row = cursor.fetchone()
+    guardado = tuple(row) if row else (0, 0, 0)
+    if not _iguales(real, guardado):
+        diferencias.append(f'global: guardado {guardado}, real {real}')
+
+    cursor.execute(_CALCULO_EVENTO)
+    reales = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    cursor.execute('SELECT evento_id, num_ventas, total_ventas, total_entradas FROM resumen_ventas_evento')
+    guardados = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    for evento_id in sorted(set(reales) | set(guardados)):
+        real = reales.get(evento_id, (0, 0, 0))
+        guardado = guardados.get(evento_id, (0, 0, 0))
+        if not _iguales(real, guardado):
+            diferencias.append(f'evento {evento_id}: guardado {guardado}, real {real}')
+
+    if not usuarios:
+        return diferencias
+    cursor.execute(_CALCULO_ROL)
+    reales = dict(cursor.fetchall())
+    cursor.execute('SELECT rol, cantidad FROM resumen_usuarios_rol')
+    guardados = dict(cursor.fetchall())
+    for rol in sorted(set(reales) | set(guardados), key=str):
+        if reales.get(rol, 0) != guardados.get(rol, 0):
+            diferencias.append(f'rol {rol}: guardado {guardados.get(rol, 0)}, real {reales.get(rol, 0)}')
+
+    return diferencias
+
+
+def _iguales(a, b):
+    return all(abs(x - y) <= TOLERANCIA for x, y in zip(a, b))
@@ -0,0 +1,294 @@
+"""Sala de espera virtual y control de admisión por evento.
+
+Cuando sale a la venta una función muy demandada, solo `capacidad`
+compradores por evento pueden estar a la vez en el proceso de compra; el
+resto recibe un turno numerado y espera en una página liviana que se
+refresca sola. Los turnos se atienden en orden.
+
+El estado de la cola vive en una base SQLite propia (no en teatro.db), así
+lo comparten todos los procesos worker del host y las consultas de la
+cola no compiten con las ventas. Cada evento lleva el último turno
+entregado y hasta qué turno se admitió: consultar la posición es una
+lectura que compara el turno propio con ese contador. Las admisiones las
+avanza un solo escritor periódico (el proceso que tiene el turno de
+admisor, renovado cada `intervalo` segundos); fuera de él solo escriben
+la llegada de un visitante nuevo y la primera consulta tras ser admitido.
+
+Al ser admitido el comprador recibe un token firmado con HMAC que incluye
+su usuario y se valida sin consultar ninguna base: mientras el token esté
+vigente sus requests pasan directo. Una admisión que nadie retira en
+`ttl_turno` segundos (pestaña cerrada) y las admisiones vencidas se
+descartan solas, liberando el lugar.
+"""
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from pool import ConnectionPool
+
+_ESQUEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS contadores_turnos (
+        evento_id INTEGER PRIMARY KEY,
+        ultimo_turno INTEGER NOT NULL,
+        admitido_hasta INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS turnos (
+        evento_id INTEGER NOT NULL,
+        turno INTEGER NOT NULL,
+        visitante TEXT NOT NULL,
+        admitido INTEGER NOT NULL DEFAULT 0,
+        visto REAL NOT NULL,  -- llegada a la fila; al retirar la admisión pasa a ser vence
+        vence REAL,
+        PRIMARY KEY (evento_id, turno)
+    )
+    ''',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_turnos_visitante ON turnos (evento_id, visitante)',
+    'CREATE INDEX IF NOT EXISTS idx_turnos_cola ON turnos (evento_id, admitido, turno)',
+    # Proceso que avanza las admisiones mientras su turno no venza
+    '''
+    CREATE TABLE IF NOT EXISTS admisor (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        proceso TEXT NOT NULL,
+        vence REAL NOT NULL
+    )
+    ''',
+]
+
+
+@dataclass(slots=True)
+class Turno:
+    numero: int
+    posicion: int  # 0 si ya fue admitido
+    en_espera: int
+    token: Optional[str] = None
+
+
+class SalaEspera:
+    """Cola de compradores por evento compartida entre procesos del host.
+
+    capacidad: compradores admitidos a la vez por evento.
+    ttl_admision: segundos que dura una admisión (y su token).
+    ttl_turno: segundos que espera una admisión a que el visitante la retire.
+    intervalo: segundos entre rondas del escritor que avanza las admisiones.
+    """
+
+    def __init__(self, db_path, secreto, capacidad=100, ttl_admision=600.0, ttl_turno=60.0, intervalo=1.0):
+        self.capacidad = capacidad
+        self.ttl_admision = ttl_admision
+        self.ttl_turno = ttl_turno
+        self.intervalo = intervalo
+        self._secreto = secreto.encode() if isinstance(secreto, str) else secreto
+        self._proceso = f'{os.getpid()}-{id(self)}'
+        self._lock = threading.Lock()
+        self._hilo = None
+        self.pool = ConnectionPool(db_path, max_conexiones=4)
+        conn = self.pool.obtener()
+        try:
+            for sql in _ESQUEMA:
+                conn.execute(sql)
+            # Bases de cola creadas antes del contador de admitidos
+            columnas = [row[1] for row in conn.execute('PRAGMA table_info(contadores_turnos)')]
+            if 'admitido_hasta' not in columnas:
+                conn.execute('ALTER TABLE contadores_turnos '
+                             'ADD COLUMN admitido_hasta INTEGER NOT NULL DEFAULT 0')
+            conn.commit()
+        finally:
+            conn.close()
+        # Métricas
+        self.rondas = 0
+
+    # ---- Tokens de admisión ----
+
+    def _firma(self, datos):
+        return hmac.new(self._secreto, datos.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def firmar(self, evento_id, turno, vence, visitante):
+        datos = f'{evento_id}.{turno}.{int(vence)}.{visitante}'
+        return f'{datos}.{self._firma(datos)}'
+
+    def leer_token(self, token):
+        """(evento_id, turno, vence, visitante) de un token con firma válida, o None"""
+        try:
+            evento, turno, vence, visitante, firma = token.split('.')
+            datos = (int(evento), int(turno), int(vence), visitante)
+        except (AttributeError, ValueError):
+            return None
+        if not hmac.compare_digest(firma, self._firma(f'{evento}.{turno}.{vence}.{visitante}')):
+            return None
+        return datos
+
+    def validar(self, token, evento_id, visitante):
+        """¿El token admite a este visitante en la compra del evento? (sin consultar la base)
+
+        El token solo sirve a quien fue admitido: copiado a otra sesión no
+        deja pasar a nadie.
+        """
+        datos = self.leer_token(token)
+        return (datos is not None and datos[0] == evento_id and datos[2] > time.time()
+                and hmac.compare_digest(datos[3], visitante))
+
+    # ---- Cola ----
+
+    def turno(self, evento_id, visitante):
+        """Tomar o consultar el turno del visitante; si le toca, el Turno trae el token.
+
+        Consultar un turno en espera es una lectura: no toma el lock de
+        escritura de la base de la cola.
+        """
+        self._iniciar()
+        ahora = time.time()
+        conn = self.pool.obtener()
+        try:
+            row = conn.execute('''
+                SELECT t.turno, t.admitido, t.visto, t.vence, c.admitido_hasta, c.ultimo_turno
+                FROM turnos t
+                JOIN contadores_turnos c ON c.evento_id = t.evento_id
+                WHERE t.evento_id = ? AND t.visitante = ?
+            ''', (evento_id, visitante)).fetchone()
+            if row is None or (row[1] and row[3] <= ahora):
+                # Llega por primera vez (o perdió su admisión): al final de la fila
+                return self._tomar_turno(conn, evento_id, visitante, ahora)
+            numero, admitido, visto, vence, admitido_hasta, ultimo_turno = row
+            if not admitido:
+                return Turno(numero, max(1, numero - admitido_hasta), ultimo_turno - admitido_hasta)
+            if visto < vence - self.ttl_admision:
+                # Primera consulta tras la admisión: la retira antes de que se descarte
+                cursor = conn.execute('''
+                    UPDATE turnos SET visto = vence WHERE evento_id = ? AND turno = ? AND admitido = 1
+                ''', (evento_id, numero))
+                conn.commit()
+                if cursor.rowcount == 0:
+                    return self._tomar_turno(conn, evento_id, visitante, ahora)
+            return Turno(numero, 0, ultimo_turno - admitido_hasta, self.firmar(evento_id, numero, vence, visitante))
+        finally:
+            conn.close()
+
+    def _tomar_turno(self, conn, evento_id, visitante, ahora):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM turnos WHERE evento_id = ? AND visitante = ?', (evento_id, visitante))
+            numero = conn.execute('''
+                INSERT INTO contadores_turnos (evento_id, ultimo_turno) VALUES (?, 1)
+                ON CONFLICT(evento_id) DO UPDATE SET ultimo_turno = ultimo_turno + 1
+                RETURNING ultimo_turno
+            ''', (evento_id,)).fetchone()[0]
+            conn.execute('INSERT INTO turnos (evento_id, turno, visitante, visto) VALUES (?, ?, ?, ?)',
+                         (evento_id, numero, visitante, ahora))
+            # Con lugar libre y sin fila no hace falta esperar al escritor
+            self._admitir(conn, evento_id, ahora)
+            # Si entró directo, la admisión ya queda retirada
+            admitido, vence = conn.execute('''
+                UPDATE turnos SET visto = COALESCE(vence, visto) WHERE evento_id = ? AND turno = ?
+                RETURNING admitido, vence
+            ''', (evento_id, numero)).fetchone()
+            admitido_hasta = conn.execute('SELECT admitido_hasta FROM contadores_turnos WHERE evento_id = ?',
+                                          (evento_id,)).fetchone()[0]
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        if admitido:
+            return Turno(numero, 0, numero - admitido_hasta, self.firmar(evento_id, numero, vence, visitante))
+        return Turno(numero, numero - admitido_hasta, numero - admitido_hasta)
+
+    def _admitir(self, conn, evento_id, ahora):
+        """Descartar admisiones vencidas o no retiradas y admitir en orden a los
+        primeros de la fila si hay lugar (transacción de escritura abierta)"""
+        conn.execute('''
+            DELETE FROM turnos
+            WHERE evento_id = ? AND admitido = 1
+              AND (vence < ? OR (visto < vence - ? AND vence - ? + ? < ?))
+        ''', (evento_id, ahora, self.ttl_admision, self.ttl_admision, self.ttl_turno, ahora))
+        admitidos = conn.execute('SELECT COUNT(*) FROM turnos WHERE evento_id = ? AND admitido = 1',
+                                 (evento_id,)).fetchone()[0]
+        if admitidos >= self.capacidad:
+            return 0
+        nuevos = conn.execute('''
+            UPDATE turnos SET admitido = 1, vence = ?
+            WHERE evento_id = ? AND turno IN (
+                SELECT turno FROM turnos WHERE evento_id = ? AND admitido = 0
+                ORDER BY turno LIMIT ?
+            )
+            RETURNING turno
+        ''', (ahora + self.ttl_admision, evento_id, evento_id, self.capacidad - admitidos)).fetchall()
+        if nuevos:
+            conn.execute('''
+                UPDATE contadores_turnos SET admitido_hasta = MAX(admitido_hasta, ?) WHERE evento_id = ?
+            ''', (max(turno for turno, in nuevos), evento_id))
+        return len(nuevos)
+
+    # ---- Escritor de admisiones ----
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name='sala-espera', daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.avanzar()
+            except sqlite3.Error as e:
+                print(f"Error al avanzar la sala de espera: {e}")
+
+    def avanzar(self):
+        """Una ronda del escritor: admite en los eventos con gente esperando.
+
+        Solo la hace el proceso con el turno de admisor vigente (o el que lo
+        toma si venció); los demás lo ven con una lectura y no escriben.
+        Devuelve cuántos visitantes se admitieron.
+        """
+        ahora = time.time()
+        conn = self.pool.obtener()
+        try:
+            row = conn.execute('SELECT proceso, vence FROM admisor WHERE id = 1').fetchone()
+            if row is not None and row[0] != self._proceso and row[1] > ahora:
+                return 0
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.execute('''
+                INSERT INTO admisor (id, proceso, vence) VALUES (1, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET proceso = excluded.proceso, vence = excluded.vence
+                WHERE admisor.proceso = excluded.proceso OR admisor.vence <= ?
+            ''', (self._proceso, ahora + 3 * self.intervalo, ahora))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return 0
+            eventos = [evento_id for evento_id, in conn.execute(
+                'SELECT evento_id FROM contadores_turnos WHERE ultimo_turno > admitido_hasta')]
+            admitidos = sum(self._admitir(conn, evento_id, ahora) for evento_id in eventos)
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self.rondas += 1
+        return admitidos
+
+    def liberar(self, token):
+        """Liberar el lugar de una admisión (compra terminada)"""
+        datos = self.leer_token(token)
+        if datos is None:
+            return
+        evento_id, turno, _, _ = datos
+        conn = self.pool.obtener()
+        try:
+            conn.execute('DELETE FROM turnos WHERE evento_id = ? AND turno = ?', (evento_id, turno))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def cerrar(self):
+        self.pool.cerrar_todas()
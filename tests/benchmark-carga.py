@@ -0,0 +1,296 @@
+"""Benchmark de carga de las rutas de navegación y compra.
+
+Genera un dataset sintético (ver datos_sinteticos.py), levanta la app en un
+proceso aparte con el servidor threaded de Werkzeug y lanza clientes
+concurrentes contra cada escenario durante unos segundos: cartelera,
+detalle de evento, login, compra y dashboards. Informa latencia p50/p95/p99,
+requests por segundo, errores y las esperas por el lock de escritura de
+SQLite que midió el servidor (MotorReservas.estadisticas()).
+
+Con --guardar escribe los resultados como línea base; sin él los compara
+con la línea base y falla si algún escenario tuvo errores, perdió más de
+--tolerancia de throughput o subió su p95 en esa misma proporción. Las
+líneas base solo son comparables en la misma máquina y configuración.
+
+Uso: python tests/benchmark-carga.py [--duracion 5] [--clientes 8]
+                                     [--escenarios index,comprar] [--env VENTAS_LOTE=64]
+                                     [--linea-base tests/linea-base-carga.json] [--guardar]
+"""
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import Database  # noqa: E402
+from passwords import HasherPasswords  # noqa: E402
+from datos_sinteticos import PASSWORD, email_usuario, generar_datos  # noqa: E402
+
+LINEA_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'linea-base-carga.json')
+DASHBOARDS = ['/dashboard/superuser', '/dashboard/director', '/dashboard/actor']
+
+
+# ==================== SERVIDOR ====================
+
+def esperas_escritura(db):
+    """Esperas por el lock de escritura sumadas entre todas las particiones"""
+    motores = [p.reservas for p in db.particiones.particiones] if db.particiones else [db.reservas]
+    total = {}
+    for motor in motores:
+        for clave, valor in motor.estadisticas().items():
+            total[clave] = total.get(clave, 0) + valor
+    return total
+
+
+def servir(entorno, conexion):
+    """Proceso servidor: app.py con el servidor threaded de Werkzeug"""
+    os.environ.update(entorno)
+    from werkzeug.serving import make_server
+    import app as aplicacion
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    servidor = make_server('127.0.0.1', 0, aplicacion.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    conexion.send(servidor.server_port)
+    while conexion.recv() != 'fin':
+        conexion.send(esperas_escritura(aplicacion.db))
+    servidor.shutdown()
+    aplicacion.db.cerrar()
+
+
+# ==================== CLIENTES ====================
+
+class Cliente:
+    """Cliente HTTP mínimo que conserva la cookie de sesión"""
+
+    def __init__(self, puerto):
+        self.puerto = puerto
+        self.cookie = None
+
+    def pedir(self, metodo, ruta, datos=None):
+        cabeceras = {}
+        cuerpo = None
+        if datos is not None:
+            cuerpo = urlencode(datos)
+            cabeceras['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            cabeceras['Cookie'] = self.cookie
+        conn = http.client.HTTPConnection('127.0.0.1', self.puerto, timeout=60)
+        try:
+            conn.request(metodo, ruta, cuerpo, cabeceras)
+            respuesta = conn.getresponse()
+            respuesta.read()
+        finally:
+            conn.close()
+        galleta = respuesta.getheader('Set-Cookie')
+        if galleta:
+            self.cookie = galleta.split(';', 1)[0]
+        return respuesta.status
+
+    def iniciar_sesion(self, email, password):
+        if self.pedir('POST', '/login', {'email': email, 'password': password}) != 302:
+            raise RuntimeError(f'No se pudo iniciar sesión como {email}')
+
+
+def _login_generado(cliente, i, datos):
+    cliente.iniciar_sesion(email_usuario(i % datos['usuarios']), PASSWORD)
+
+
+def _login_superuser(cliente, i, datos):
+    cliente.iniciar_sesion('superuser@teatro.com', 'super123')
+
+
+# Escenario -> (preparación del cliente o None, pedido que devuelve True si salió bien)
+ESCENARIOS = {
+    'index': (None, lambda c, rnd, d: c.pedir('GET', '/') == 200),
+    'detalle_evento': (None, lambda c, rnd, d: c.pedir('GET', f'/evento/{rnd.choice(d["eventos"])}') == 200),
+    'login': (None, lambda c, rnd, d: c.pedir('POST', '/login', {
+        'email': email_usuario(rnd.randrange(d['usuarios'])), 'password': PASSWORD}) == 302),
+    'comprar': (_login_generado, lambda c, rnd, d: c.pedir(
+        'POST', f'/comprar/{rnd.choice(d["eventos"])}', {'cantidad': 1 + rnd.randrange(3)}) == 302),
+    'dashboards': (_login_superuser, lambda c, rnd, d: c.pedir('GET', rnd.choice(DASHBOARDS)) == 200),
+}
+
+
+def percentil(cuantiles, p):
+    return round(cuantiles[p - 1] * 1000, 2)
+
+
+def ejecutar_escenario(nombre, puerto, datos, clientes, duracion, semilla):
+    """Carga concurrente durante `duracion` segundos; devuelve las métricas del cliente"""
+    preparar, pedido = ESCENARIOS[nombre]
+    marcas = []
+    barrera = threading.Barrier(clientes, action=lambda: marcas.append(time.perf_counter()))
+
+    def trabajar(i):
+        rnd = random.Random(semilla + i)
+        cliente = Cliente(puerto)
+        if preparar:
+            preparar(cliente, i, datos)
+        barrera.wait()
+        fin = marcas[0] + duracion
+        latencias, errores = [], 0
+        while time.perf_counter() < fin:
+            inicio = time.perf_counter()
+            try:
+                correcto = pedido(cliente, rnd, datos)
+            except (OSError, http.client.HTTPException):
+                correcto = False
+            latencias.append(time.perf_counter() - inicio)
+            errores += not correcto
+        return latencias, errores, time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=clientes) as ejecutor:
+        resultados = list(ejecutor.map(trabajar, range(clientes)))
+    latencias = [t for propias, _, _ in resultados for t in propias]
+    transcurrido = max(fin for _, _, fin in resultados) - marcas[0]
+    cuantiles = statistics.quantiles(latencias, n=100) if len(latencias) > 1 else [latencias[0]] * 99
+    return {
+        'solicitudes': len(latencias),
+        'errores': sum(errores for _, errores, _ in resultados),
+        'rps': round(len(latencias) / transcurrido, 1),
+        'p50_ms': percentil(cuantiles, 50),
+        'p95_ms': percentil(cuantiles, 95),
+        'p99_ms': percentil(cuantiles, 99),
+    }
+
+
+# ==================== LÍNEA BASE ====================
+
+def comparar(resultados, base, tolerancia):
+    """Regresiones respecto de la línea base"""
+    fallas = []
+    for nombre, actual in resultados.items():
+        if actual['errores']:
+            fallas.append(f'{nombre}: {actual["errores"]} requests con error')
+        anterior = base.get(nombre)
+        if anterior is None:
+            continue
+        if actual['rps'] < anterior['rps'] * (1 - tolerancia):
+            fallas.append(f'{nombre}: {actual["rps"]} req/s contra {anterior["rps"]} de la línea base')
+        if actual['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+            fallas.append(f'{nombre}: p95 de {actual["p95_ms"]} ms contra {anterior["p95_ms"]} ms '
+                          f'de la línea base')
+    return fallas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--eventos', type=int, default=500)
+    parser.add_argument('--usuarios', type=int, default=5000)
+    parser.add_argument('--ventas', type=int, default=50000)
+    parser.add_argument('--clientes', type=int, default=8, help='Clientes concurrentes por escenario')
+    parser.add_argument('--duracion', type=float, default=5.0, help='Segundos de carga por escenario')
+    parser.add_argument('--escenarios', default=','.join(ESCENARIOS),
+                        help=f'Lista separada por comas de {", ".join(ESCENARIOS)}')
+    parser.add_argument('--env', action='append', default=[], metavar='CLAVE=VALOR',
+                        help='Variable de entorno para la app (p. ej. VENTAS_LOTE=64)')
+    parser.add_argument('--linea-base', default=LINEA_BASE)
+    parser.add_argument('--guardar', action='store_true', help='Guardar los resultados como línea base')
+    parser.add_argument('--tolerancia', type=float, default=0.25)
+    args = parser.parse_args()
+
+    escenarios = [nombre.strip() for nombre in args.escenarios.split(',') if nombre.strip()]
+    desconocidos = set(escenarios) - set(ESCENARIOS)
+    if desconocidos:
+        parser.error(f'escenarios desconocidos: {", ".join(sorted(desconocidos))}')
+    entorno_app = dict(variable.split('=', 1) for variable in args.env)
+    configuracion = {
+        'eventos': args.eventos, 'usuarios': args.usuarios, 'ventas': args.ventas,
+        'clientes': args.clientes, 'duracion': args.duracion, 'entorno': entorno_app,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, 'teatro.db')
+        db = Database(ruta, hasher=HasherPasswords(procesos=0))
+        db.inicializar_db()
+        inicio = time.perf_counter()
+        generar_datos(db, args.eventos, args.usuarios, args.ventas,
+                      fecha_inicio=time.strftime('%Y-%m-%d'), dias=365,
+                      password_hash=db.passwords.hashear(PASSWORD))
+        conn = db.get_connection()
+        eventos = [r[0] for r in conn.execute('SELECT id FROM eventos')]
+        conn.close()
+        db.cerrar()
+        print(f'▶ Dataset: {args.eventos} eventos, {args.usuarios} usuarios, {args.ventas} ventas '
+              f'({time.perf_counter() - inicio:.1f}s)')
+
+        entorno = {
+            'DATABASE_PATH': ruta,
+            'SECRET_KEY': 'benchmark',
+            'SALA_ESPERA_PATH': os.path.join(tmp, 'espera.db'),
+            'LIMITES_PATH': os.path.join(tmp, 'limites'),
+            # Todos los clientes salen de la misma IP
+            'LIMITE_LOGIN_IP': '', 'LIMITE_LOGIN_EMAIL': '',
+        }
+        entorno.update(entorno_app)
+        conexion, extremo = multiprocessing.Pipe()
+        # No es daemon: el hasher de contraseñas de la app abre su propio pool de procesos
+        servidor = multiprocessing.Process(target=servir, args=(entorno, extremo))
+        servidor.start()
+        puerto = conexion.recv()
+
+        datos = {'eventos': eventos, 'usuarios': args.usuarios}
+        resultados = {}
+        try:
+            for semilla, nombre in enumerate(escenarios):
+                conexion.send('esperas')
+                antes = conexion.recv()
+                metricas = ejecutar_escenario(nombre, puerto, datos, args.clientes, args.duracion,
+                                              semilla * 1000)
+                conexion.send('esperas')
+                despues = conexion.recv()
+                metricas['esperas_bloqueo'] = despues['esperas_bloqueo'] - antes['esperas_bloqueo']
+                metricas['ms_bloqueo'] = round((despues['segundos_bloqueo'] - antes['segundos_bloqueo']) * 1000, 1)
+                metricas['reintentos_bloqueo'] = despues['reintentos_bloqueo'] - antes['reintentos_bloqueo']
+                resultados[nombre] = metricas
+                print(f'{nombre:>15}: {metricas["rps"]:8.1f} req/s  p50 {metricas["p50_ms"]:7.2f} ms  '
+                      f'p95 {metricas["p95_ms"]:7.2f} ms  p99 {metricas["p99_ms"]:7.2f} ms  '
+                      f'errores {metricas["errores"]}  esperas de escritura {metricas["esperas_bloqueo"]} '
+                      f'({metricas["ms_bloqueo"]} ms, {metricas["reintentos_bloqueo"]} reintentos)')
+        finally:
+            conexion.send('fin')
+            servidor.join(10)
+            if servidor.is_alive():
+                servidor.terminate()
+
+    if args.guardar:
+        with open(args.linea_base, 'w', encoding='utf-8') as f:
+            json.dump({'configuracion': configuracion, 'escenarios': resultados},
+                      f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f'\n✅ Línea base guardada en {args.linea_base}')
+        return
+
+    base = {}
+    if os.path.exists(args.linea_base):
+        with open(args.linea_base, encoding='utf-8') as f:
+            guardada = json.load(f)
+        if guardada['configuracion'] != configuracion:
+            print(f'\n⚠️ La línea base se midió con otra configuración: {guardada["configuracion"]}')
+        base = guardada['escenarios']
+    else:
+        print(f'\n⚠️ No hay línea base en {args.linea_base}; usa --guardar para crearla')
+
+    fallas = comparar(resultados, base, args.tolerancia)
+    print()
+    if fallas:
+        for falla in fallas:
+            print(f'❌ {falla}')
+        sys.exit(1)
+    print('✅ Sin regresiones respecto de la línea base')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Micro-benchmark del mapeo de filas a modelos.
+
+Compara, por cada 100k filas de eventos y de usuarios, el tiempo de mapeo y
+la memoria retenida por la lista resultante entre:
+
+  - antes: SELECT * y dataclass sin slots armada campo por campo
+  - completo: SELECT * con models.mapeador y modelos con __slots__
+  - resumen: la proyección de listado de database.py con models.mapeador
+
+Uso: python tests/benchmark-modelos.py [--filas 100000]
+"""
+import argparse
+import dataclasses
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database  # noqa: E402
+from models import Evento, Usuario, mapeador  # noqa: E402
+
+
+def sin_slots(cls):
+    """Copia del modelo como dataclass común (con __dict__), como eran antes"""
+    campos = [(f.name, f.type, f) for f in dataclasses.fields(cls)]
+    return dataclasses.make_dataclass(cls.__name__ + 'Antes', campos)
+
+
+EventoAntes = sin_slots(Evento)
+UsuarioAntes = sin_slots(Usuario)
+
+
+def eventos_antes(cursor):
+    cursor.execute('SELECT * FROM eventos')
+    eventos = []
+    for row in cursor.fetchall():
+        eventos.append(EventoAntes(
+            id=row['id'],
+            nombre=row['nombre'],
+            fecha=row['fecha'],
+            hora=row['hora'],
+            lugar=row['lugar'],
+            precio=row['precio'],
+            entradas_disponibles=row['entradas_disponibles'],
+            descripcion=row['descripcion'],
+            imagen_url=row['imagen_url'] if 'imagen_url' in row.keys() else None
+        ))
+    return eventos
+
+
+def usuarios_antes(cursor):
+    cursor.execute('SELECT * FROM usuarios')
+    usuarios = []
+    for row in cursor.fetchall():
+        usuarios.append(UsuarioAntes(
+            id=row['id'],
+            nombre=row['nombre'],
+            email=row['email'],
+            password=row['password'],
+            telefono=row['telefono'],
+            rol=row['rol'],
+            created_at=row['created_at']
+        ))
+    return usuarios
+
+
+def proyectado(cls, columnas, tabla):
+    def cargar(cursor):
+        cursor.execute(f'SELECT {columnas} FROM {tabla}')
+        convertir = mapeador(cls, cursor)
+        return [convertir(row) for row in cursor.fetchall()]
+    return cargar
+
+
+VARIANTES = [
+    ('eventos', 'antes', eventos_antes),
+    ('eventos', 'completo', proyectado(Evento, '*', 'eventos')),
+    ('eventos', 'resumen', proyectado(Evento, database._EVENTO_RESUMEN, 'eventos')),
+    ('usuarios', 'antes', usuarios_antes),
+    ('usuarios', 'completo', proyectado(Usuario, '*', 'usuarios')),
+    ('usuarios', 'resumen', proyectado(Usuario, database._USUARIO_RESUMEN, 'usuarios')),
+]
+
+
+def generar(path, filas):
+    db = database.Database(path)
+    db.migrar()
+    conn = db.get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    conn.executemany('''
+        INSERT INTO eventos (nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion, imagen_url)
+        VALUES (?, '2030-01-01', '20:00', ?, 25.0, 100, ?, ?)
+    ''', ((f'Obra {i}', f'Sala {i % 50}', 'Descripción larga de la obra. ' * 15,
+           f'https://img.ejemplo.com/{i}.jpg') for i in range(filas)))
+    conn.executemany('''
+        INSERT INTO usuarios (nombre, email, password, telefono, rol) VALUES (?, ?, ?, ?, 'cliente')
+    ''', ((f'Usuario {i}', f'usuario{i}@ejemplo.com', 'x' * 64, '555-0000') for i in range(filas)))
+    conn.commit()
+    conn.close()
+    db.cerrar()
+
+
+def medir(path, cargar, filas):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cargar(cursor)  # calentar la cache de páginas de SQLite
+
+    gc.collect()
+    inicio = time.perf_counter()
+    cargar(cursor)
+    segundos = time.perf_counter() - inicio
+
+    gc.collect()
+    tracemalloc.start()
+    resultado = cargar(cursor)
+    retenido = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del resultado
+    conn.close()
+    escala = 100000 / filas
+    return segundos * escala * 1000, retenido * escala / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filas', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'modelos.db')
+        generar(path, args.filas)
+        print(f'Por cada 100k filas ({args.filas} medidas):')
+        print(f'{"tabla":<10}{"variante":<10}{"ms":>10}{"MB retenidos":>15}')
+        for tabla, variante, cargar in VARIANTES:
+            ms, mb = medir(path, cargar, args.filas)
+            print(f'{tabla:<10}{variante:<10}{ms:>10.1f}{mb:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark de logins por segundo con el KDF de passwords.py.
+
+Verifica contraseñas contra hashes scrypt desde varios hilos (como los
+workers de Flask) a través de HasherPasswords, con 1 proceso y con uno
+por CPU, e informa logins por segundo en total y por núcleo. Sirve para
+elegir los parámetros de costo: a más n, más seguro y menos logins.
+
+Uso: python tests/benchmark-passwords.py [--n 32768] [--r 8] [--p 1]
+                                         [--logins 200] [--hilos 32]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from passwords import HasherPasswords, calcular_hash  # noqa: E402
+
+
+def medir(hasher, hashes, logins, hilos):
+    """Logins por segundo verificando `logins` contraseñas desde `hilos` hilos"""
+    def login(i):
+        password, almacenado = hashes[i % len(hashes)]
+        if not hasher.verificar(password, almacenado):
+            raise AssertionError('La verificación falló')
+
+    hasher.verificar(*hashes[0])  # levantar los procesos del pool
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        list(ejecutor.map(login, range(logins)))
+    return logins / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--n', type=int, default=2 ** 15)
+    parser.add_argument('--r', type=int, default=8)
+    parser.add_argument('--p', type=int, default=1)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--hilos', type=int, default=32)
+    args = parser.parse_args()
+
+    parametros = {'n': args.n, 'r': args.r, 'p': args.p}
+    hashes = [(f'clave{i}', calcular_hash(f'clave{i}', **parametros)) for i in range(8)]
+    inicio = time.perf_counter()
+    calcular_hash('clave', **parametros)
+    print(f'scrypt n={args.n} r={args.r} p={args.p}: {128 * args.n * args.r // 2 ** 20} MB, '
+          f'{(time.perf_counter() - inicio) * 1000:.0f} ms por hash en un núcleo')
+
+    cpus = os.cpu_count() or 1
+    for procesos in sorted({1, cpus}):
+        hasher = HasherPasswords(procesos=procesos, max_cola=args.hilos, timeout=60, **parametros)
+        try:
+            por_segundo = medir(hasher, hashes, args.logins, args.hilos)
+        finally:
+            hasher.cerrar()
+        print(f'{procesos:>3} procesos: {por_segundo:8.1f} logins/s, {por_segundo / procesos:6.1f} por núcleo')
+
+
+if __name__ == '__main__':
+    main()
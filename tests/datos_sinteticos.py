@@ -0,0 +1,90 @@
+"""Generador del dataset sintético para los tests de planes y los benchmarks.
+
+Carga N eventos, M usuarios y K ventas directamente con executemany en una
+sola transacción (sin pasar por Database.crear_*), así un dataset de cientos
+de miles de ventas se genera en segundos. Los resúmenes de ventas se
+mantienen con los triggers de siempre.
+
+También se puede usar como script para poblar una base existente:
+
+Uso: python tests/datos_sinteticos.py --db teatro.db [--eventos 2000]
+                                      [--usuarios 20000] [--ventas 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import Database  # noqa: E402
+from passwords import HasherPasswords  # noqa: E402
+
+PASSWORD = 'clave-sintetica'
+
+
+def email_usuario(i):
+    """Email del i-ésimo usuario generado"""
+    return f'usuario{i:06d}@ejemplo.com'
+
+
+def generar_datos(db, eventos, usuarios, ventas, semilla=42,
+                  fecha_inicio='2020-01-01', dias=3650, password_hash='x' * 64):
+    """Cargar el dataset sintético directamente con executemany.
+
+    Los eventos caen en los `dias` siguientes a fecha_inicio. Con un
+    password_hash real (db.passwords.hashear(PASSWORD)) los usuarios
+    generados pueden iniciar sesión; el hash se calcula una sola vez.
+    """
+    rnd = random.Random(semilla)
+    conn = db.get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    conn.executemany('''
+        INSERT INTO usuarios (nombre, email, password, telefono, rol, created_at)
+        VALUES (?, ?, ?, ?, ?, datetime('2020-01-01', ? || ' minutes'))
+    ''', ((f'Usuario {i}', email_usuario(i), password_hash, None,
+           rnd.choice(['cliente'] * 20 + ['actor', 'director']), i) for i in range(usuarios)))
+    conn.executemany('''
+        INSERT INTO eventos (nombre, fecha, hora, lugar, precio, entradas_disponibles, descripcion)
+        VALUES (?, date(?, ? || ' days'), ?, ?, ?, ?, ?)
+    ''', ((f'Obra {i}', fecha_inicio, rnd.randrange(0, dias), rnd.choice(['19:00', '20:00', '21:30']),
+           f'Sala {rnd.randrange(50)}', rnd.choice([15.0, 20.0, 25.0, 30.0]), 10 ** 6,
+           'Descripción larga ' * 20) for i in range(eventos)))
+    ids_usuarios = [r[0] for r in conn.execute('SELECT id FROM usuarios')]
+    ids_eventos = [r[0] for r in conn.execute('SELECT id FROM eventos')]
+    conn.executemany('''
+        INSERT INTO ventas (evento_id, user_id, cantidad, total, fecha_compra)
+        VALUES (?, ?, ?, ?, datetime('2021-01-01', ? || ' seconds'))
+    ''', ((rnd.choice(ids_eventos), rnd.choice(ids_usuarios), c, c * 20.0, i * 60)
+          for i, c in ((i, rnd.randint(1, 4)) for i in range(ventas))))
+    conn.commit()
+    conn.close()
+    # Las escrituras directas no pasan por las caches de Database
+    db.catalogo.invalidar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help='Base a poblar (se crea o migra si hace falta)')
+    parser.add_argument('--eventos', type=int, default=2000)
+    parser.add_argument('--usuarios', type=int, default=20000)
+    parser.add_argument('--ventas', type=int, default=200000)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--desde', help='Fecha del primer evento (por defecto hoy)')
+    parser.add_argument('--dias', type=int, default=365, help='Días en los que se reparten los eventos')
+    args = parser.parse_args()
+
+    db = Database(args.db, hasher=HasherPasswords(procesos=0))
+    db.inicializar_db()
+    inicio = time.perf_counter()
+    generar_datos(db, args.eventos, args.usuarios, args.ventas, semilla=args.semilla,
+                  fecha_inicio=args.desde or time.strftime('%Y-%m-%d'), dias=args.dias,
+                  password_hash=db.passwords.hashear(PASSWORD))
+    db.cerrar()
+    print(f'✅ {args.eventos} eventos, {args.usuarios} usuarios y {args.ventas} ventas '
+          f'en {time.perf_counter() - inicio:.1f}s (contraseña de los usuarios: {PASSWORD})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Prueba de ventas particionadas: compras concurrentes mientras se mueven eventos.
+
+Crea varios eventos repartidos en particiones, lanza compras desde varios
+procesos y, al mismo tiempo, mueve eventos de una partición a otra desde
+otro proceso. Verifica que ningún evento se sobrevenda, que el stock de la
+partición dueña más lo vendido en todas las particiones dé la capacidad,
+que los ids de venta no se repitan, que las lecturas combinadas y los
+totales coincidan y que la sincronización deje al día el stock de teatro.db.
+
+Uso: python tests/test-particiones.py [--particiones 3] [--eventos 6]
+                                      [--capacidad 300] [--compras 1500]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import Database  # noqa: E402
+from passwords import HasherPasswords  # noqa: E402
+
+
+def abrir(ruta, particiones, **opciones):
+    return Database(ruta, particiones=particiones, hasher=HasherPasswords(procesos=0, n=2 ** 10), **opciones)
+
+
+def comprar(ruta, particiones, eventos, user_id, compras, hilos, semilla):
+    """Compras al azar sobre los eventos; devuelve la cantidad de exitosas"""
+    db = abrir(ruta, particiones, max_conexiones=hilos)
+    rnd = random.Random(semilla)
+    pedidos = [(rnd.choice(eventos), 1 + rnd.randrange(3)) for _ in range(compras)]
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        resultados = list(ejecutor.map(
+            lambda pedido: db.crear_venta(pedido[0], user_id, pedido[1], 10.0 * pedido[1]), pedidos))
+    db.cerrar()
+    return sum(1 for r in resultados if r)
+
+
+def mover(ruta, particiones, eventos, movimientos, semilla):
+    """Mover eventos al azar entre particiones (incluida teatro.db)"""
+    db = abrir(ruta, particiones)
+    rnd = random.Random(semilla)
+    for _ in range(movimientos):
+        db.particiones.mover_evento(rnd.choice(eventos), rnd.randrange(len(particiones) + 1))
+        time.sleep(0.01)
+    db.cerrar()
+    return movimientos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--particiones', type=int, default=3)
+    parser.add_argument('--eventos', type=int, default=6)
+    parser.add_argument('--capacidad', type=int, default=300)
+    parser.add_argument('--compras', type=int, default=1500, help='Compras por proceso')
+    parser.add_argument('--procesos', type=int, default=3)
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--movimientos', type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, 'teatro.db')
+        particiones = [os.path.join(tmp, f'ventas-{i}.db') for i in range(1, args.particiones + 1)]
+        # Sin sincronización periódica: las páginas tienen que ver el stock igual
+        db = abrir(ruta, particiones, sincronizar_cada=3600)
+        db.inicializar_db()
+        user_id = db.obtener_usuario_por_email('cliente@teatro.com').id
+        eventos = [db.crear_evento(f'Función {i}', '2030-01-01', '20:00', 'Sala', 10.0, args.capacidad, 'd')
+                   for i in range(args.eventos)]
+        print(f'▶ {args.eventos} eventos en {args.particiones} particiones: '
+              f'{[db.particiones.numero(e) for e in eventos]}')
+
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.procesos + 1) as ejecutor:
+            compradores = [ejecutor.submit(comprar, ruta, particiones, eventos, user_id,
+                                           args.compras, args.hilos, semilla)
+                           for semilla in range(args.procesos)]
+            movidos = ejecutor.submit(mover, ruta, particiones, eventos, args.movimientos, 99)
+            exitosas = sum(f.result() for f in compradores)
+            movidos.result()
+        duracion = time.perf_counter() - inicio
+        print(f'▶ {exitosas} compras exitosas de {args.compras * args.procesos} en {duracion:.2f}s '
+              f'({exitosas / duracion:.0f}/s) con {args.movimientos} movimientos')
+
+        errores = []
+        ventas = list(db.iterar_ventas())
+        if len(ventas) != exitosas:
+            errores.append(f'{len(ventas)} ventas leídas y {exitosas} compras exitosas')
+        if len({v['id'] for v in ventas}) != len(ventas):
+            errores.append('ids de venta repetidos entre particiones')
+        extra = db.crear_evento('Función extra', '2030-01-01', '20:00', 'Sala', 10.0, args.capacidad, 'd')
+        db.catalogo.invalidar()
+        version = db.version_catalogo()['version']
+        cartelera = {e.id: e.entradas_disponibles for e in db.obtener_eventos()}
+        for evento_id in eventos:
+            vendidas = sum(v['cantidad'] for v in ventas if v['evento_id'] == evento_id)
+            numero = db.particiones.numero(evento_id, refrescar=True)
+            conn = db.particiones.particiones[numero].pool.obtener()
+            stock = conn.execute('SELECT entradas_disponibles FROM eventos WHERE id = ?', (evento_id,)).fetchone()[0]
+            conn.close()
+            if vendidas + stock != args.capacidad:
+                errores.append(f'evento {evento_id}: {vendidas} vendidas + {stock} disponibles '
+                               f'!= {args.capacidad}')
+            if db.obtener_evento(evento_id).entradas_disponibles != stock or cartelera[evento_id] != stock:
+                errores.append(f'evento {evento_id}: las páginas no muestran el stock de la partición')
+            if db.obtener_resumen_evento(evento_id)['total_entradas'] != vendidas:
+                errores.append(f'evento {evento_id}: el resumen no coincide con las ventas')
+        if db.obtener_resumen_ventas()['num_ventas'] != len(ventas):
+            errores.append('el resumen global no coincide con las ventas')
+
+        db.crear_venta(extra, user_id, 1, 10.0)
+        db.catalogo.invalidar()
+        if db.version_catalogo()['version'] == version:
+            errores.append('una compra en una partición no cambia la versión del catálogo')
+        db.particiones.sincronizar()
+        conn = db.get_connection()
+        copiado = dict(conn.execute('SELECT id, entradas_disponibles FROM eventos').fetchall())
+        conn.close()
+        for evento in db.obtener_eventos():
+            if copiado[evento.id] != evento.entradas_disponibles:
+                errores.append(f'evento {evento.id}: stock de teatro.db sin sincronizar')
+        db.cerrar()
+
+    for error in errores:
+        print(f'❌ {error}')
+    if errores:
+        sys.exit(1)
+    print('✅ Sin sobreventa, ids únicos y lecturas combinadas consistentes')
+
+
+if __name__ == '__main__':
+    main()
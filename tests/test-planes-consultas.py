@@ -0,0 +1,217 @@
+"""Regresión de planes de consulta de database.Database.
+
+Genera un dataset grande, ejecuta cada método de Database capturando las
+sentencias SQL que emite (trace callback de las conexiones del pool) y
+registra su EXPLAIN QUERY PLAN. Falla si alguna consulta hace un scan
+completo de tabla, necesita un B-tree temporal para ordenar/agrupar o
+supera su presupuesto de tiempo. También falla si aparece un método
+público nuevo en Database que no esté cubierto por un escenario.
+
+Uso: python tests/test-planes-consultas.py [--eventos 2000] [--usuarios 20000]
+                                           [--ventas 200000] [--salida planes.json]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import Database  # noqa: E402
+from passwords import HasherPasswords  # noqa: E402
+from datos_sinteticos import generar_datos  # noqa: E402
+
+# Métodos que no emiten consultas propias o son de mantenimiento (scans a propósito)
+EXCLUIDOS = {
+    'get_connection', 'cerrar', 'inicializar_db', 'migrar',
+    'reconstruir_resumenes', 'verificar_resumenes',
+}
+
+TEMP_BTREE = 'USE TEMP B-TREE'
+SCAN_COMPLETO = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def por_filas(microsegundos, filas, minimo=5):
+    """Presupuesto en ms de una consulta que recorre `filas` filas"""
+    return max(minimo, round(microsegundos * filas / 1000))
+
+
+def escenarios(db, datos):
+    """(nombre del método, llamada, presupuesto en ms, scans permitidos)
+
+    Los presupuestos son unas tres veces lo medido en el dataset por defecto:
+    fijos para las consultas acotadas y, para las que recorren una tabla,
+    proporcionales a las filas generadas (por_filas). Los scans permitidos
+    son nombres de tabla o TEMP_BTREE.
+    """
+    evento_id = 7
+    user_id = 11
+    email = 'usuario000011@ejemplo.com'
+    return [
+        ('obtener_usuario_por_email', lambda: db.obtener_usuario_por_email(email), 5, ()),
+        ('obtener_usuario_por_id', lambda: db.obtener_usuario_por_id(user_id), 5, ()),
+        ('obtener_principal', lambda: (db.principales.limpiar(), db.obtener_principal(user_id)), 5, ()),
+        ('verificar_credenciales', lambda: db.verificar_credenciales(email, 'clave'), 5, ()),
+        # Listados completos: el scan por índice es esperable, el de tabla no
+        ('obtener_todos_usuarios', lambda: db.obtener_todos_usuarios(), por_filas(15, datos.usuarios), ()),
+        ('obtener_usuarios_pagina', lambda: db.obtener_usuarios_pagina(limite=50), 5, ()),
+        ('obtener_usuarios_pagina', lambda: db.obtener_usuarios_pagina(limite=50, rol='actor'), 5, ()),
+        ('obtener_usuarios_pagina', lambda: db.obtener_usuarios_pagina(limite=50, email_prefijo='usuario0001'), 5, ()),
+        ('obtener_eventos', lambda: db.obtener_eventos(), por_filas(45, datos.eventos), ()),
+        ('obtener_proximos_eventos', lambda: (db.catalogo.listados.limpiar(), db.obtener_proximos_eventos()), por_filas(20, datos.eventos), ()),
+        ('obtener_proximos_eventos', lambda: db.obtener_proximos_eventos(), por_filas(15, datos.eventos), ()),
+        ('obtener_proximos_eventos', lambda: db.obtener_proximos_eventos(desde='2027-01-01', hasta='2027-01-31'), 5, ()),
+        ('obtener_proximos_eventos', lambda: db.obtener_proximos_eventos(lugar='Sala 7', con_stock=True), 5, ()),
+        ('obtener_proximos_eventos', lambda: db.obtener_proximos_eventos(precio_min=20, precio_max=25, limite=20), 5, ()),
+        ('obtener_nombres_eventos', lambda: (db.catalogo.listados.limpiar(), db.obtener_nombres_eventos()), por_filas(8, datos.eventos), ()),
+        ('contar_eventos', lambda: db.contar_eventos(), 5, ()),
+        ('obtener_evento', lambda: db.obtener_evento(evento_id), 5, ()),
+        # Texto completo: FTS5 resuelve MATCH y el orden por relevancia; se
+        # recorre solo la página ya materializada
+        ('buscar_eventos', lambda: db.buscar_eventos('obra 12'), 10, ('coincidencias',)),
+        # Peor caso: todos los eventos coinciden y hay que rankearlos a todos
+        ('buscar_eventos', lambda: db.buscar_eventos('descripcion larga', pagina=3), por_filas(25, datos.eventos), ('coincidencias',)),
+        ('version_catalogo', lambda: (db.catalogo.version.limpiar(), db.version_catalogo()), 5, ()),
+        ('version_evento', lambda: (db.catalogo.version.limpiar(), db.version_evento(evento_id)), 5, ()),
+        ('obtener_mapa_asientos', lambda: db.obtener_mapa_asientos(evento_id), 5, ()),
+        ('obtener_venta', lambda: db.obtener_venta(1000), 5, ()),
+        ('obtener_recibo', lambda: db.obtener_recibo(1000), 5, ()),
+        ('obtener_todas_ventas', lambda: db.obtener_todas_ventas(), por_filas(20, datos.ventas), ()),
+        ('obtener_ventas_pagina', lambda: db.obtener_ventas_pagina(limite=50), 5, ()),
+        ('obtener_ventas_pagina', lambda: db.obtener_ventas_pagina(limite=50, evento_id=evento_id), 5, ()),
+        ('obtener_ventas_pagina', lambda: db.obtener_ventas_pagina(limite=50, desde='2021-02-01', hasta='2021-02-15'), 5, ()),
+        # Las compras de los usuarios del prefijo se ordenan juntas: el sort queda acotado a ellas
+        ('obtener_ventas_pagina', lambda: db.obtener_ventas_pagina(limite=50, email_prefijo='usuario0001'), 10,
+         (TEMP_BTREE,)),
+        # Exportaciones: recorren las ventas por índice en orden cronológico
+        ('iterar_ventas', lambda: sum(1 for _ in db.iterar_ventas()), por_filas(20, datos.ventas), ()),
+        ('iterar_ventas', lambda: sum(1 for _ in db.iterar_ventas(evento_id=evento_id)), 10, ()),
+        ('iterar_ventas', lambda: sum(1 for _ in db.iterar_ventas(user_id=user_id)), 5, ()),
+        ('iterar_ventas', lambda: sum(1 for _ in db.iterar_ventas(desde='2021-02-01', hasta='2021-02-15')), por_filas(4, datos.ventas), ()),
+        ('obtener_ultimas_ventas', lambda: db.obtener_ultimas_ventas(10), 5, ()),
+        ('obtener_ventas_por_usuario', lambda: db.obtener_ventas_por_usuario(user_id), 5, ()),
+        ('obtener_ventas_por_email', lambda: db.obtener_ventas_por_email(email), 5, ()),
+        # resumen_ventas tiene una fila por base (sumadas entre particiones)
+        ('obtener_resumen_ventas', lambda: db.obtener_resumen_ventas(), 5, ('resumen_ventas',)),
+        ('obtener_resumen_evento', lambda: db.obtener_resumen_evento(evento_id), 5, ()),
+        ('obtener_entradas_evento', lambda: db.obtener_entradas_evento(evento_id), 10, ()),
+        ('registrar_ingresos', lambda: db.registrar_ingresos(
+            [(evento_id, venta_id, 1, '2030-01-01 20:00:00', 'A') for venta_id in range(1, 200)]), 15, ()),
+        # Los mismos otra vez: cada repetido lee el ingreso anterior por clave primaria
+        ('registrar_ingresos', lambda: db.registrar_ingresos(
+            [(evento_id, venta_id, 1, '2030-01-01 20:05:00', 'B') for venta_id in range(1, 200)]), 15, ()),
+        ('obtener_ingresos_evento', lambda: db.obtener_ingresos_evento(evento_id), 5, ()),
+        # resumen_usuarios_rol tiene una fila por rol
+        ('obtener_usuarios_por_rol', lambda: db.obtener_usuarios_por_rol(), 5, ('resumen_usuarios_rol',)),
+        ('crear_usuario', lambda: db.crear_usuario('Nuevo', f'nuevo{time.time_ns()}@ejemplo.com', 'clave'), 15, ()),
+        ('cambiar_rol_usuario', lambda: db.cambiar_rol_usuario(user_id, 'actor'), 10, ()),
+        ('crear_evento', lambda: db.crear_evento('Nueva', '2030-01-01', '20:00', 'Sala', 10.0, 100, 'd',
+                                                 secciones=[{'nombre': 'Platea', 'filas': [['A', 10]]}]), 10, ()),
+        ('actualizar_evento', lambda: db.actualizar_evento(evento_id, 'Obra', '2030-01-01', '20:00', 'Sala',
+                                                           10.0, 10 ** 6, 'd'), 10, ()),
+        ('crear_venta', lambda: db.crear_venta(evento_id, user_id, 2, 40.0), 10, ()),
+        ('retener_asientos', lambda: db.retener_asientos(db_ultimo_evento(db), [0, 1]), 10, ()),
+        ('liberar_asientos', lambda: db.liberar_asientos(db_ultimo_evento(db), [0, 1]), 10, ()),
+        ('eliminar_evento', lambda: db.eliminar_evento(db_ultimo_evento(db)), 10, ()),
+    ]
+
+
+def db_ultimo_evento(db):
+    conn = db.get_connection()
+    evento_id = conn.execute('SELECT MAX(id) FROM eventos').fetchone()[0]
+    conn.close()
+    return evento_id
+
+
+def planificar(conn, sql):
+    """Filas de EXPLAIN QUERY PLAN de una sentencia ya expandida"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+
+
+def problemas_plan(plan, permitidos):
+    problemas = []
+    for paso in plan:
+        scan = SCAN_COMPLETO.match(paso)
+        if scan and scan.group(1) not in permitidos:
+            problemas.append(f'scan completo: {paso}')
+        if TEMP_BTREE in paso and TEMP_BTREE not in permitidos:
+            problemas.append(f'ordenamiento temporal: {paso}')
+    return problemas
+
+
+def es_consulta(sql):
+    primera = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+    return primera in ('SELECT', 'UPDATE', 'DELETE', 'WITH', 'INSERT')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--eventos', type=int, default=2000)
+    parser.add_argument('--usuarios', type=int, default=20000)
+    parser.add_argument('--ventas', type=int, default=200000)
+    parser.add_argument('--salida', help='Guardar los planes registrados en un archivo JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # KDF barato y en el mismo proceso: los presupuestos miden las consultas
+        db = Database(os.path.join(tmp, 'planes.db'), hasher=HasherPasswords(procesos=0, n=2 ** 10))
+        capturadas = []
+        db.pool.al_conectar(lambda conn: conn.set_trace_callback(capturadas.append))
+        db.inicializar_db()
+
+        inicio = time.perf_counter()
+        generar_datos(db, args.eventos, args.usuarios, args.ventas)
+        print(f'▶ Dataset: {args.eventos} eventos, {args.usuarios} usuarios, {args.ventas} ventas '
+              f'({time.perf_counter() - inicio:.1f}s)')
+
+        fallas = []
+        registro = []
+        cubiertos = set()
+        conn_plan = db.get_connection()
+        for nombre, llamada, presupuesto_ms, permitidos in escenarios(db, args):
+            cubiertos.add(nombre)
+            del capturadas[:]
+            inicio = time.perf_counter()
+            llamada()
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            # Los triggers repiten la sentencia que los disparó: se registra una vez
+            sentencias = [sql for i, sql in enumerate(capturadas)
+                          if es_consulta(sql) and 'EXPLAIN' not in sql
+                          and (i == 0 or capturadas[i - 1] != sql)]
+
+            print(f'\n{nombre}: {duracion_ms:.1f} ms (presupuesto {presupuesto_ms} ms)')
+            if duracion_ms > presupuesto_ms:
+                fallas.append(f'{nombre}: {duracion_ms:.1f} ms supera el presupuesto de {presupuesto_ms} ms')
+            for sql in sentencias:
+                plan = planificar(conn_plan, sql)
+                registro.append({'metodo': nombre, 'sql': ' '.join(sql.split()), 'plan': plan,
+                                 'ms': round(duracion_ms, 2)})
+                print(f'   {" ".join(sql.split())[:110]}')
+                for paso in plan:
+                    print(f'      {paso}')
+                for problema in problemas_plan(plan, permitidos):
+                    fallas.append(f'{nombre}: {problema}')
+        conn_plan.close()
+
+        publicos = {n for n in dir(db) if not n.startswith('_') and callable(getattr(db, n))}
+        for nombre in sorted(publicos - cubiertos - EXCLUIDOS):
+            fallas.append(f'{nombre}: método sin escenario en el test de planes')
+        db.cerrar()
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(registro, f, ensure_ascii=False, indent=2)
+
+    print()
+    if fallas:
+        for falla in fallas:
+            print(f'❌ {falla}')
+        sys.exit(1)
+    print('✅ Todos los planes usan índices y respetan su presupuesto')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Presupuestos de consultas SQL por request de las rutas de app.py.
+
+Levanta la app en modo testing sobre una base temporal con el dataset
+sintético y recorre con el test client cada ruta marcada con
+presupuesto_consultas, con la cache fría y caliente y con cada rol que la
+usa. En testing el decorador lanza AssertionError si el request emite más
+sentencias que su presupuesto; el test también falla si una ruta con
+presupuesto no tiene casos, o si alguna responde con error 5xx.
+
+Uso: python tests/test-presupuestos-consultas.py [--particiones 0] [--eventos 200]
+                                                 [--usuarios 1000] [--ventas 5000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from datos_sinteticos import generar_datos  # noqa: E402
+
+
+def casos(evento_id, numerado_id):
+    """(rol que inicia sesión o None, método, url, argumentos del test client)"""
+    return [
+        (None, 'GET', '/', {}),
+        (None, 'GET', '/cartelera/disponibilidad', {}),
+        (None, 'GET', '/buscar?q=Obra', {}),
+        (None, 'GET', '/registro', {}),
+        (None, 'POST', '/registro', {'data': {'nombre': 'Nueva', 'email': 'nueva@ejemplo.com',
+                                              'password': 'clave-nueva'}}),
+        (None, 'GET', '/login', {}),
+        (None, 'POST', '/login', {'data': {'email': 'cliente@teatro.com', 'password': 'incorrecta'}}),
+        (None, 'GET', f'/evento/{evento_id}', {}),
+        (None, 'GET', f'/evento/{numerado_id}', {}),
+        ('cliente', 'GET', '/perfil', {}),
+        ('cliente', 'GET', f'/comprar/{evento_id}', {}),
+        ('cliente', 'POST', f'/comprar/{evento_id}', {'data': {'cantidad': 2}}),
+        ('cliente', 'POST', f'/comprar/{evento_id}', {'data': {'cantidad': 10 ** 9}}),
+        ('cliente', 'GET', f'/comprar/{numerado_id}', {}),
+        ('cliente', 'POST', f'/comprar/{numerado_id}', {'data': {'cantidad': 1}}),
+        ('cliente', 'POST', '/buscar-compras', {'data': {'email': 'cliente@teatro.com'}}),
+        ('superuser', 'GET', '/dashboard/superuser', {}),
+        ('superuser', 'GET', '/admin', {}),
+        ('superuser', 'GET', '/admin/usuarios', {}),
+        ('superuser', 'GET', '/admin/usuarios?rol=cliente&email=usuario', {}),
+        ('superuser', 'GET', '/admin/ventas', {}),
+        ('superuser', 'GET', f'/admin/ventas?evento_id={evento_id}&desde=2021-01-01', {}),
+        ('director', 'GET', '/dashboard/director', {}),
+        ('director', 'GET', f'/checkin/{numerado_id}', {}),
+        ('director', 'POST', f'/checkin/{numerado_id}', {'json': {'codigo': '1-1-AAAAAAAAAA'}}),
+        ('director', 'POST', f'/checkin/{numerado_id}', {'data': {'codigo': 'basura'}}),
+        ('actor', 'GET', '/dashboard/actor', {}),
+    ]
+
+
+PASSWORDS = {
+    'cliente': ('cliente@teatro.com', 'cliente123'),
+    'superuser': ('superuser@teatro.com', 'super123'),
+    'director': ('director@teatro.com', 'director123'),
+    'actor': ('actor@teatro.com', 'actor123'),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--particiones', type=int, default=0, help='Archivos de ventas particionadas')
+    parser.add_argument('--eventos', type=int, default=200)
+    parser.add_argument('--usuarios', type=int, default=1000)
+    parser.add_argument('--ventas', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # app.py se configura al importarse: base temporal y KDF barato en el mismo proceso
+        os.environ.update({
+            'DATABASE_PATH': os.path.join(tmp, 'teatro.db'),
+            'VENTAS_PARTICIONES': ','.join(os.path.join(tmp, f'ventas-{i}.db')
+                                           for i in range(1, args.particiones + 1)),
+            'LIMITES_PATH': os.path.join(tmp, 'limites'),
+            'PASSWORD_PROCESOS': '0',
+            'PASSWORD_SCRYPT_N': str(2 ** 10),
+            'METRICAS': '1',
+        })
+        import app as aplicacion
+        from asientos import parsear_secciones
+
+        db = aplicacion.db
+        db.inicializar_db()
+        generar_datos(db, args.eventos, args.usuarios, args.ventas,
+                      fecha_inicio='2030-01-01', dias=60)
+        evento_id = db.crear_evento('Función general', '2030-01-01', '20:00', 'Sala', 10.0, 500, 'd')
+        numerado_id = db.crear_evento('Función numerada', '2030-01-01', '21:00', 'Sala', 10.0, 0, 'd',
+                                      secciones=parsear_secciones('Platea: A-J x 20'))
+        aplicacion.app.testing = True
+
+        fallas = []
+        cubiertas = set()
+        for ronda in ('fría', 'caliente'):
+            # Una sesión por rol y ronda: los límites de tasa del login cuentan cada intento
+            clientes = {}
+            for rol, metodo, url, opciones in casos(evento_id, numerado_id):
+                if rol not in clientes:
+                    clientes[rol] = aplicacion.app.test_client()
+                    if rol is not None:
+                        email, password = PASSWORDS[rol]
+                        respuesta = clientes[rol].post('/login', data={'email': email, 'password': password})
+                        # Sin sesión las rutas protegidas redirigen y cualquier presupuesto alcanza
+                        if respuesta.status_code != 302:
+                            fallas.append(f'{rol}: no se pudo iniciar sesión ({respuesta.status_code})')
+                cliente = clientes[rol]
+                cubiertas.add(aplicacion.app.url_map.bind('').match(url.split('?')[0], method=metodo)[0])
+                try:
+                    respuesta = cliente.open(url, method=metodo, **opciones)
+                except AssertionError as e:
+                    fallas.append(f'{metodo} {url} ({rol or "anónimo"}, cache {ronda}): {e}')
+                    continue
+                if respuesta.status_code >= 500:
+                    fallas.append(f'{metodo} {url} ({rol or "anónimo"}): estado {respuesta.status_code}')
+                if metodo == 'POST' and url.startswith('/comprar/') and respuesta.status_code == 302:
+                    # La confirmación de la compra recién hecha, con la misma sesión
+                    destino = respuesta.headers['Location']
+                    try:
+                        cliente.get(destino)
+                        cubiertas.add('confirmacion')
+                    except AssertionError as e:
+                        fallas.append(f'GET {destino} (cliente, cache {ronda}): {e}')
+            print(f'▶ Cache {ronda}: {len(casos(evento_id, numerado_id))} requests')
+
+        con_presupuesto = {endpoint for endpoint, vista in aplicacion.app.view_functions.items()
+                           if hasattr(vista, 'presupuesto_consultas')}
+        for endpoint in sorted(con_presupuesto - cubiertas):
+            fallas.append(f'{endpoint}: ruta con presupuesto sin casos en el test')
+        db.cerrar()
+
+    print()
+    if fallas:
+        for falla in fallas:
+            print(f'❌ {falla}')
+        sys.exit(1)
+    print(f'✅ {len(con_presupuesto)} rutas respetan su presupuesto de consultas')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Prueba de estrés de ventas concurrentes sobre un único evento.
+
+Lanza miles de compras simultáneas (hilos y procesos) contra un evento con
+capacidad limitada y verifica que nunca se vendan más entradas que las
+disponibles, con una transacción por compra y con el escritor de commits
+agrupados. Informa el throughput de cada escenario.
+
+Uso: python tests/test-ventas-concurrentes.py [--compras 4000] [--capacidad 1000] [--lote 64]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import Database  # noqa: E402
+
+
+def preparar_db(ruta, capacidad):
+    db = Database(ruta)
+    db.inicializar_db()
+    evento_id = db.crear_evento('Función agotada', '2030-01-01', '20:00', 'Sala Estrés',
+                                10.0, capacidad, 'Evento para prueba de estrés')
+    user_id = db.obtener_usuario_por_email('cliente@teatro.com').id
+    return db, evento_id, user_id
+
+
+def comprar_lote(ruta, evento_id, user_id, compras, hilos, lote=0):
+    """Ejecutar compras concurrentes desde un proceso; devuelve (exitosas, transacciones de venta)"""
+    db = Database(ruta, max_conexiones=hilos, lote_ventas=lote)
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        resultados = list(executor.map(
+            lambda i: db.crear_venta(evento_id, user_id, 1 + i % 3, 10.0 * (1 + i % 3)),
+            range(compras),
+        ))
+    db.cerrar()
+    transacciones = db.escritor_ventas.lotes if db.escritor_ventas else compras
+    return sum(1 for r in resultados if r), transacciones
+
+
+def verificar(db, evento_id, capacidad):
+    conn = db.get_connection()
+    vendidas = conn.execute(
+        'SELECT COALESCE(SUM(cantidad), 0) FROM ventas WHERE evento_id = ?', (evento_id,)
+    ).fetchone()[0]
+    disponibles = conn.execute(
+        'SELECT entradas_disponibles FROM eventos WHERE id = ?', (evento_id,)
+    ).fetchone()[0]
+    conn.close()
+    errores = []
+    if vendidas > capacidad:
+        errores.append(f'sobreventa: {vendidas} vendidas con capacidad {capacidad}')
+    if disponibles < 0:
+        errores.append(f'stock negativo: {disponibles}')
+    if vendidas + disponibles != capacidad:
+        errores.append(f'stock inconsistente: {vendidas} vendidas + {disponibles} disponibles')
+    return vendidas, errores
+
+
+def escenario(nombre, procesos, hilos, compras, capacidad, lote=0):
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, 'estres.db')
+        db, evento_id, user_id = preparar_db(ruta, capacidad)
+        por_proceso = compras // procesos
+
+        inicio = time.perf_counter()
+        if procesos == 1:
+            exitosas, transacciones = comprar_lote(ruta, evento_id, user_id, compras, hilos, lote)
+        else:
+            with ProcessPoolExecutor(max_workers=procesos) as executor:
+                futuros = [executor.submit(comprar_lote, ruta, evento_id, user_id, por_proceso, hilos, lote)
+                           for _ in range(procesos)]
+                resultados = [f.result() for f in futuros]
+            exitosas = sum(r[0] for r in resultados)
+            transacciones = sum(r[1] for r in resultados)
+        duracion = time.perf_counter() - inicio
+
+        vendidas, errores = verificar(db, evento_id, capacidad)
+        db.cerrar()
+
+    intentos = compras if procesos == 1 else por_proceso * procesos
+    print(f'▶ {nombre}: {intentos} compras en {duracion:.2f}s '
+          f'({intentos / duracion:.0f} compras/s), {exitosas} exitosas, '
+          f'{vendidas}/{capacidad} entradas vendidas, {transacciones} transacciones')
+    for error in errores:
+        print(f'   ❌ {error}')
+    return not errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--compras', type=int, default=4000)
+    parser.add_argument('--capacidad', type=int, default=1000)
+    parser.add_argument('--hilos', type=int, default=16)
+    parser.add_argument('--procesos', type=int, default=4)
+    parser.add_argument('--lote', type=int, default=64,
+                        help='Ventas por transacción en los escenarios de commits agrupados')
+    args = parser.parse_args()
+
+    ok = escenario('Hilos', 1, args.hilos, args.compras, args.capacidad)
+    ok &= escenario('Procesos', args.procesos, args.hilos, args.compras, args.capacidad)
+    ok &= escenario('Hilos, commits agrupados', 1, args.hilos, args.compras, args.capacidad, args.lote)
+    ok &= escenario('Procesos, commits agrupados', args.procesos, args.hilos, args.compras,
+                    args.capacidad, args.lote)
+
+    if ok:
+        print('✅ Sin sobreventa')
+    else:
+        print('❌ Se detectó sobreventa o stock inconsistente')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()